@@ -2,9 +2,15 @@ CREATE DATABASE [Database_name];
 
 USE [Database_name];
 
+-- Default VFD register layout, partitioned by month. For a custom register
+-- map in config.json print the table with: python webapp/schema.py sql config.json
+-- Convert an existing unpartitioned table with: python webapp/schema.py migrate config.json
+-- The logger adds upcoming partitions itself (python webapp/schema.py maintain config.json).
+
 CREATE TABLE [Table_name] (
-    ID INT AUTO_INCREMENT PRIMARY KEY,
-    Date_Time DATETIME NOT NULL,
+    ID BIGINT NOT NULL AUTO_INCREMENT,
+    Device_ID INT NOT NULL DEFAULT 1,
+    Date_Time DATETIME(3) NOT NULL,
     Control_Word INT,
     Status_Word INT,
     Reference_1 INT,
@@ -14,5 +20,13 @@ CREATE TABLE [Table_name] (
     Voltage INT,
     Current_i INT,
     Power INT,
-    Error_code INT
+    Error_code INT,
+    PRIMARY KEY (Device_ID, Date_Time, ID),
+    KEY idx_id (ID)
+) ENGINE=InnoDB
+PARTITION BY RANGE COLUMNS (Date_Time) (
+    PARTITION p202601 VALUES LESS THAN ('2026-02-01'),
+    PARTITION p202602 VALUES LESS THAN ('2026-03-01'),
+    PARTITION p202603 VALUES LESS THAN ('2026-04-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
 );
@@ -1,26 +1,41 @@
 #libraries required
 import streamlit as st
-import mysql.connector
 import time
 from datetime import datetime, timedelta
 from pymodbus.client import ModbusSerialClient
 import json
 import os
+import tempfile
+import warnings
 import subprocess
-import signal
-import psutil
+import threading
+from collections import OrderedDict
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from data_cache import BlockCache, time_slice
+from downsample import KeyColumns, bucket_seconds, bucket_stats, fetch_downsampled, value_columns
+from rollup import align_bucket, choose_level, fetch_rollup, rollup_covers
+from gaps import FillStrategies, fill_window, find_gaps, sample_interval, step_hold
+from streaming import ChunkDownsampler, count_rows, stream_rows
+from moments import Moments, rollup_moments
+import numpy as np
+from storage import open_backend
+from pool import ConnectionPool
+from ring_buffer import RingReader
+from status_channel import StatusReader
+from metrics import MetricHelp, histogram_summary, parse_metrics
+import urllib.request
+from charts import Colors, FigureCache, add_series, combined_figure, line_figure, subplots_figure
+from export import ExportFormats, ExportWriter, available_formats, export_file_name
+
+# Column selections share memory with the cached frame until modified
+pd.set_option("mode.copy_on_write", True)
 
 #Inistialising Session State
 if 'ModbusClient' not in st.session_state:
   st.session_state.ModbusClient = None
 if 'Mysql' not in st.session_state:
   st.session_state.Mysql = None
-if 'Logger' not in st.session_state:
-  st.session_state.Logger = False
 
 # WEb application Start
 st.title("Industrial Data Logger & Analytics Dashboard")
@@ -38,7 +53,7 @@ other industrial equipment with historical data analysis capabilities.
 
 with st.expander("📖 How to Use This Dashboard"):
     st.write("""
-    1. **Configure Modbus**: Set your serial port parameters
+    1. **Configure Modbus**: Set your serial port or TCP gateway parameters
     2. **Setup Database**: Enter MySQL connection details  
     3. **Start Logging**: Begin data collection from your devices
     4. **Analyze Data**: Select time ranges and visualize trends
@@ -51,11 +66,30 @@ st.divider()
 st.subheader("Modbus")
 st.warning(":warning: Always Start Modbus Connection Before Data Logger!")
 
-port = st.text_input("Serial Port (e.g. COM3 or /dev/ttyUSB0)", "COM3")
-baudrate = st.number_input("Baudrate", 1200, 115200, 9600)  
-stopbits = st.selectbox("Stop Bits", [1, 2])
-parity = st.selectbox("Parity", ["N", "E", "O"])
-bytesize = st.selectbox("Data Bits", [7, 8])
+transport = st.selectbox(
+    "Transport", ["Serial (RTU)", "Modbus TCP", "RTU over TCP gateway"],
+    help="Modbus TCP keeps several requests in flight on one connection. RTU over TCP is for transparent serial gateways, one request at a time."
+)
+if transport == "Serial (RTU)":
+    port = st.text_input("Serial Port (e.g. COM3 or /dev/ttyUSB0)", "COM3")
+    baudrate = st.number_input("Baudrate", 1200, 115200, 9600)  
+    stopbits = st.selectbox("Stop Bits", [1, 2])
+    parity = st.selectbox("Parity", ["N", "E", "O"])
+    bytesize = st.selectbox("Data Bits", [7, 8])
+else:
+    tcp_host = st.text_input("Gateway Host", "192.168.1.10")
+    tcp_port = st.number_input("Gateway Port", 1, 65535, 502)
+    if transport == "Modbus TCP":
+        max_in_flight = st.number_input("Requests in flight", 1, 64, 8,
+                                        help="How many reads the gateway may queue at once")
+slaves_text = st.text_input("Slave IDs (comma separated, polled concurrently)", "1")
+try:
+    slaves = [int(s) for s in slaves_text.split(",") if s.strip()]
+    if any(not 1 <= slave <= 247 for slave in slaves):
+        raise ValueError
+except ValueError:
+    st.error("Slave IDs must be whole numbers from 1 to 247, e.g. 1, 2, 3")
+    slaves = [1]
 
 #modbus back ground code
 if st.button("Save Modbus", use_container_width=True):
@@ -75,13 +109,23 @@ if st.button("❌ Reset", use_container_width=True):
 
 st.divider()
 st.subheader("Database Connection")
-col1, col2 = st.columns(2)
-with col1:
-    host = st.text_input("HOST" ,"localhost")
-    user = st.text_input("Username","root")
-with col2:
-    password = st.text_input("Password","Amey1105!" , type="password")
-    database = st.text_input("Database", "iasys")
+storage_kind = st.selectbox(
+    "Storage", ["MySQL", "SQLite (local file)", "DuckDB (Parquet archive)"],
+    help="SQLite logs to a local file without a server. DuckDB reads days archived to Parquet with: python storage.py archive"
+)
+if storage_kind == "MySQL":
+    col1, col2 = st.columns(2)
+    with col1:
+        host = st.text_input("HOST" ,"localhost")
+        user = st.text_input("Username","root")
+    with col2:
+        password = st.text_input("Password","Amey1105!" , type="password")
+        database = st.text_input("Database", "iasys")
+    storage = {"backend": "mysql", "host": host, "user": user, "password": password, "database": database}
+elif storage_kind.startswith("SQLite"):
+    storage = {"backend": "sqlite", "path": st.text_input("SQLite file", r"C:\Users\ADMIN\Desktop\IASYS\iasys.db")}
+else:
+    storage = {"backend": "duckdb", "path": st.text_input("Parquet archive folder", r"C:\Users\ADMIN\Desktop\IASYS\archive")}
 
 table ="vfd"
 
@@ -108,28 +152,93 @@ st.subheader("Logging")
 # Define paths - make sure they match your logger.py exactly
 ConfigPath = r"C:\Users\ADMIN\Desktop\IASYS\config.json"
 LoggerScriptPath = r"C:\Users\ADMIN\Desktop\IASYS\logger.py"  # Full path to logger.py
+SupervisorScriptPath = os.path.join(os.path.dirname(LoggerScriptPath), "supervisor.py")
+
+def supervisor_call(path, method="GET", timeout=5):
+    """JSON reply of the supervisor's control API (see supervisor.py)"""
+    sup_cfg = {}
+    if os.path.exists(ConfigPath):
+        with open(ConfigPath, "r") as f:
+            sup_cfg = json.load(f).get("supervisor", {})
+    url = f"http://{sup_cfg.get('host', '127.0.0.1')}:{sup_cfg.get('port', 9100)}{path}"
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+def supervisor_workers():
+    """Workers of the running supervisor, None when it is not running"""
+    try:
+        return supervisor_call("/workers", timeout=2)["workers"]
+    except Exception:
+        return None
+
+def start_supervisor():
+    """Start the supervisor as its own process, it keeps running when the dashboard restarts"""
+    if os.name == 'nt':
+        flags = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+        subprocess.Popen(["python", SupervisorScriptPath, "--config", ConfigPath, "--start"],
+                         cwd=os.path.dirname(SupervisorScriptPath), creationflags=flags)
+    else:
+        subprocess.Popen(["python", SupervisorScriptPath, "--config", ConfigPath, "--start"],
+                         cwd=os.path.dirname(SupervisorScriptPath), start_new_session=True)
+
+interval = st.number_input("Logging interval (s)", min_value=0.1, max_value=3600.0, value=1.0, step=0.1)
+store_by_exception = st.checkbox(
+    "Store by exception (deadband)",
+    help="Write a row only when a value moves past its deadband, plus a heartbeat row. "
+         "Steady drives write far fewer rows; registers can set their own \"deadband\" in the register map"
+)
+if store_by_exception:
+    col1, col2 = st.columns(2)
+    heartbeat = col1.number_input("Heartbeat (s)", min_value=1.0, max_value=3600.0, value=60.0,
+                                  help="A row is written at least this often, also when nothing changed")
+    default_deadband = col2.number_input("Deadband", min_value=0.0, max_value=65535.0, value=0.0,
+                                         help="Change that counts as a new value, for registers without their own. 0 stores every change")
 
 if st.button("▶️ Start Logging", use_container_width=True):
-    if st.session_state.ModbusClient and st.session_state.Mysql:
+    if not open_backend(storage).writable:
+        st.error("DuckDB only reads the Parquet archive, log to MySQL or SQLite")
+    elif st.session_state.ModbusClient and st.session_state.Mysql:
         try:
             # Prepare config with the exact same structure your logger expects
             cfg = {
-                "modbus": {
+                "interval": interval,
+                "buffer": {
+                    "max_rows": 50,
+                    "max_age": 5
+                },
+                "spool": {
+                    "path": os.path.join(os.path.dirname(ConfigPath), "spool"),
+                    "max_mb": 256,
+                    "segment_kb": 1024,
+                    "fsync": "always"
+                }
+            }
+            
+            if store_by_exception:
+                cfg["deadband"] = {"enabled": True, "heartbeat": heartbeat, "default": default_deadband}
+
+            if transport == "Serial (RTU)":
+                cfg["modbus"] = {
                     "port": port,
                     "baudrate": baudrate,
                     "stopbits": stopbits,
                     "parity": parity,
-                    "bytesize": bytesize
-                },
-                "mysql": {
-                    "host": host,
-                    "user": user,
-                    "password": password,
-                    "database": database
-                },
-                "interval": 1
-            }
-            
+                    "bytesize": bytesize,
+                    "slaves": slaves
+                }
+            else:
+                gateway = {"type": "tcp" if transport == "Modbus TCP" else "rtu_tcp", "host": tcp_host, "port": tcp_port}
+                if transport == "Modbus TCP":
+                    gateway["max_in_flight"] = max_in_flight
+                cfg["buses"] = {"gateway": gateway}
+                cfg["devices"] = [{"id": slave, "bus": "gateway", "slave": slave} for slave in slaves]
+
+            if storage["backend"] == "mysql":
+                cfg["mysql"] = {k: v for k, v in storage.items() if k != "backend"}
+            else:
+                cfg["storage"] = storage
+
             # Ensure directory exists
             os.makedirs(os.path.dirname(ConfigPath), exist_ok=True)
             
@@ -139,105 +248,71 @@ if st.button("▶️ Start Logging", use_container_width=True):
             
             st.info(f"Config written to: {ConfigPath}")
             
-            # Check if logger is already running
-            if "Logger" not in st.session_state:
-                st.session_state.Logger = None
-                
-            if st.session_state.Logger is None or st.session_state.Logger.poll() is not None:
-                # Start logger process from the correct directory
-                working_dir = os.path.dirname(LoggerScriptPath)
-                
-                proc = subprocess.Popen(
-                    ["python", "logger.py"],
-                    cwd=working_dir,  # Set working directory
-                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
-                )
-                st.session_state.Logger = proc
-                st.success(f"Logger started with PID: {proc.pid}")
-                time.sleep(1)  # Give it a moment to start
-                
-                # Verify it's actually running
-                if proc.poll() is None:
-                    st.success("✅ Logger is running successfully")
+            # The supervisor owns the logger workers, one per bus
+            if supervisor_workers() is None:
+                start_supervisor()
+                for _ in range(20):  # Give it a moment to start
+                    time.sleep(0.5)
+                    workers = supervisor_workers()
+                    if workers is not None:
+                        break
                 else:
-                    st.error("❌ Logger failed to start")
-                    st.session_state.Logger = None
+                    workers = None
+            else:
+                supervisor_call("/reload", "POST", timeout=30)
+                workers = supervisor_call("/start", "POST")["workers"]
+            
+            if workers is None:
+                st.error("❌ Supervisor failed to start")
             else:
-                st.warning("Logger already running")
+                st.success(f"✅ Logging started: {len(workers)} worker(s), " + ", ".join(w['bus'] for w in workers))
                 
         except Exception as e:
             st.error(f"Error starting logger: {e}")
-            st.session_state.Logger = None
     else:
         st.error("Connect Modbus and SQL first!")
 
 if st.button("⏹️ Stop Logging", use_container_width=True):
-    if "Logger" in st.session_state and st.session_state.Logger is not None:
+    if supervisor_workers() is not None:
         try:
-            proc = st.session_state.Logger
-            
-            # Check if process is still running
-            if proc.poll() is None:
-                st.info(f"Stopping logger process (PID: {proc.pid})...")
-                
-                # Try graceful termination first
-                if os.name == 'nt':  # Windows
-                    proc.send_signal(signal.CTRL_BREAK_EVENT)
-                else:  # Unix/Linux
-                    proc.terminate()
-                
-                # Wait a bit for graceful shutdown
-                try:
-                    proc.wait(timeout=5)
-                    st.success("Logger stopped gracefully")
-                except subprocess.TimeoutExpired:
-                    st.warning("Logger didn't stop gracefully, forcing termination...")
-                    
-                    # Force kill if graceful didn't work
-                    if os.name == 'nt':  # Windows
-                        subprocess.run(["taskkill", "/F", "/PID", str(proc.pid)], 
-                                     capture_output=True)
-                    else:  # Unix/Linux
-                        proc.kill()
-                        proc.wait()
-                    
-                    st.success("Logger forcefully terminated")
-            else:
-                st.info("Logger process was already stopped")
-                
-            st.session_state.Logger = None
-            
+            # Workers flush their buffers before they exit
+            supervisor_call("/stop", "POST", timeout=60)
+            st.success("Logger workers stopped")
         except Exception as e:
             st.error(f"Error stopping logger: {e}")
-            # Try to clean up anyway
-            st.session_state.Logger = None
     else:
-        st.warning("No logger process running")
+        st.warning("No logger supervisor running")
+
+StatusPath = os.path.join(os.path.dirname(ConfigPath), "status.bin")
+StatusStale = 10  # seconds without a publish before the logger counts as stalled
+
+@st.cache_resource
+def get_status_reader(path):
+    return StatusReader(path)
+
+def worker_status_paths():
+    """(name, status block) of every logger worker, the single logger's block without a supervisor"""
+    workers = supervisor_workers()
+    if not workers:
+        return [("logger", StatusPath)]
+    return [(worker['bus'], worker['status_path']) for worker in workers]
 
 # Optional: Add status check
 if st.button("🔍 Check Logger Status", use_container_width=True):
-    if "Logger" in st.session_state and st.session_state.Logger is not None:
-        proc = st.session_state.Logger
-        if proc.poll() is None:
-            st.success(f"✅ Logger is running (PID: {proc.pid})")
-            
-            # Optional: Check if the process is actually doing work
-            try:
-                # Try to read the status file
-                StatusPath = r"C:\Users\ADMIN\Desktop\IASYS\status.json"
-                if os.path.exists(StatusPath):
-                    with open(StatusPath, "r") as f:
-                        status = json.load(f)
-                    st.json(status)
-                else:
-                    st.info("Status file not found yet")
-            except Exception as e:
-                st.warning(f"Could not read status: {e}")
-        else:
-            st.error("❌ Logger process has stopped")
-            st.session_state.Logger = None
+    workers = supervisor_workers()
+    if workers is None:
+        st.info("No logger supervisor running")
     else:
-        st.info("No logger process in session state")
+        for worker in workers:
+            if worker['state'] == "running":
+                st.success(f"✅ Bus {worker['bus']}: running (PID {worker['pid']}, CPU {worker['cpu']}), "
+                           f"up {worker['uptime']:.0f} s, {worker['restarts']} restarts")
+            elif worker['state'] == "restarting":
+                st.warning(f"🔁 Bus {worker['bus']}: restarting after exit code {worker['last_exit']}, {worker['restarts']} restarts")
+            else:
+                st.info(f"⏹️ Bus {worker['bus']}: stopped")
+            if worker.get('status'):
+                st.json(worker['status'], expanded=False)
 
 # Optional: Display current config
 with st.expander("Current Config"):
@@ -253,15 +328,125 @@ with st.expander("Current Config"):
 
 st.divider()
 st.subheader("Status LOG")
-StatusPath = r"C:\Users\ADMIN\Desktop\IASYS\status.json"
+
+@st.fragment(run_every=1)
+def status_panel():
+    """Read the status block of every logger worker, a memory read so it can refresh every second"""
+    paths = worker_status_paths()
+    for name, path in paths:
+        if len(paths) > 1:
+            st.markdown(f"**Bus {name}**")
+        show_status(path)
+
+def show_status(path):
+    try:
+        status = get_status_reader(path).snapshot()
+    except Exception as e:
+        st.warning(f"Could not read status: {e}")
+        return
+    if status is None:
+        st.info("No status from the logger yet")
+        return
+
+    age = (datetime.now() - datetime.fromisoformat(status['updated'])).total_seconds()
+    if not status['running']:
+        st.error(f"Logger stopped: {status.get('error') or status.get('message', '')}")
+    elif age > StatusStale:
+        st.warning(f"No update from the logger for {age:.0f} s (PID {status['pid']})")
+    else:
+        st.success(f"Logger running (PID {status['pid']}), last update {age:.1f} s ago")
+    if status['running'] and status.get('error'):
+        st.error(status['error'])
+    if status['running'] and status.get('warning'):
+        st.warning(status['warning'])
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Samples", status['samples'], help=f"{status.get('samples_suppressed', 0)} more not stored, within their deadband")
+    col2.metric("Rows written", status['rows_written'])
+    col3.metric("Read cycle", f"{status['cycle_last_ms']:.0f} ms", help=f"Average {status['cycle_avg_ms']:.1f} ms, max {status['cycle_max_ms']:.1f} ms")
+    col4.metric("Overruns", status['overruns'], help=f"{status['missed_deadlines']} missed deadlines")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Insert errors", status['insert_errors'])
+    col2.metric("Device errors", status['device_errors'])
+    col3.metric("Spooled", f"{status['spooled_bytes'] / 1024:.0f} KiB")
+    col4.metric("Last sample", (status['last_sample'] or "-")[11:19] or "-")
+
+if st.toggle("Follow logger status", help="Updates every second from the logger's shared status block"):
+    status_panel()
 if st.button("LOGS", use_container_width=True):
-  if os.path.exists(StatusPath):
-      with open(StatusPath, "r") as f:
-        status = json.load(f)
-      st.json(status)
-  else:
-      st.info("No status file found")
+  for name, path in worker_status_paths():
+    try:
+        status = get_status_reader(path).snapshot()
+        if status is not None:
+            st.json({"bus": name, **status})
+        else:
+            st.info(f"No status from {name} yet")
+    except Exception as e:
+        st.warning(f"Could not read status: {e}")
+
+def metrics_urls():
+    """(worker, metrics endpoint) of every logger worker, from the metrics section of the config"""
+    metrics_cfg = {}
+    if os.path.exists(ConfigPath):
+        with open(ConfigPath, "r") as f:
+            metrics_cfg = json.load(f).get("metrics", {})
+    host = metrics_cfg.get('host', '127.0.0.1')
+    workers = supervisor_workers()
+    if not workers:
+        return [("logger", f"http://{host}:{metrics_cfg.get('port', 9108)}/metrics")]
+    return [(w['bus'], f"http://{host}:{w['metrics_port']}/metrics") for w in workers if w['metrics_port']]
+
+@st.fragment(run_every=5)
+def metrics_panel():
+    """Per-stage latency histograms and counters scraped from the logger"""
+    parsed = {}
+    for worker, url in metrics_urls():
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                text = response.read().decode()
+        except Exception as e:
+            st.info(f"No metrics from {worker} ({e})")
+            continue
+        for name, series in parse_metrics(text).items():
+            parsed.setdefault(name, []).extend(({**labels, 'worker': worker}, value) for labels, value in series)
+    if not parsed:
+        return
+
+    rows = []
+    summaries = {}
+    for name, (kind, text) in MetricHelp.items():
+        if kind == "histogram":
+            summaries[name] = histogram_summary(parsed, name)
+            for row in summaries[name]:
+                labels = ", ".join(f"{k}={v}" for k, v in row.items() if not k.endswith("_ms") and k != "count")
+                rows.append({"stage": name.replace("_seconds", ""), "labels": labels, "count": row["count"],
+                             "mean ms": row["mean_ms"], "p50 ms": row["p50_ms"], "p95 ms": row["p95_ms"], "p99 ms": row["p99_ms"]})
+    if rows:
+        st.dataframe(pd.DataFrame(rows).round(2), use_container_width=True, hide_index=True)
+
+    counters = []
+    for name, (kind, text) in MetricHelp.items():
+        for labels, value in parsed.get(name, []):
+            counters.append({"metric": name, "labels": ", ".join(f"{k}={v}" for k, v in labels.items()),
+                             "value": value, "description": text})
+    if counters:
+        st.dataframe(pd.DataFrame(counters), use_container_width=True, hide_index=True)
 
+    # Early signs of saturation, before samples are lost
+    queued = sum(value for _, value in parsed.get("event_queue_depth", []))
+    spooled = sum(value for _, value in parsed.get("spool_bytes", []))
+    if queued > 100:
+        st.warning(f"{queued:.0f} samples waiting for the database loop, writes are not keeping up")
+    if spooled:
+        st.warning(f"{spooled / 1024:.0f} KiB spooled to disk, the database is rejecting or missing writes")
+    for row in summaries.get("modbus_lock_wait_seconds", []):
+        if row["p95_ms"] and row["p95_ms"] > 500:
+            st.warning(f"Bus {row.get('bus')} is saturated: read cycles wait {row['p95_ms']:.0f} ms (p95) for the line")
+
+with st.expander("📈 Logger Metrics"):
+    st.caption("Modbus round trips, bus waits, database insert/commit latency and error counters, refreshed every 5 seconds")
+    if st.toggle("Show metrics", key='show_metrics'):
+        metrics_panel()
 
 st.divider()
 
@@ -342,71 +527,439 @@ if 'start_datetime' in st.session_state and 'end_datetime' in st.session_state:
 
 st.divider()
 
+device_id = st.number_input("Device ID (Modbus slave)", 1, 247, slaves[0] if slaves else 1)
+
+CacheBlockSeconds = 3600  # retrieved rows are cached in blocks of this many seconds
+CacheBudgetMB = 512  # least recently used blocks are dropped above this, over all sessions
+CacheRereadSeconds = 120  # re-read before the newest cached row, for rows other workers committed late
+
+# Shared by every session and bounded by CacheBudgetMB. Every retrieve still queries the database:
+# missing blocks in full, cached blocks for rows written since they were read and the last CacheRereadSeconds
+@st.cache_resource
+def get_data_cache():
+    return BlockCache(CacheBlockSeconds, CacheBudgetMB * 1024 * 1024, CacheRereadSeconds)
+
+PoolSize = 5  # most connections the dashboard opens per database, over all sessions
+PoolsKept = 4  # pools of the least recently used databases are closed above this
+
+# Shared by every session: database key (no password) -> pool, least recently used first
+@st.cache_resource
+def get_pools():
+    return OrderedDict(), threading.Lock()
+
+def get_pool(storage):
+    backend = open_backend(storage)
+    key = backend.key()
+    pools, lock = get_pools()
+    with lock:
+        pool = pools.get(key)
+        if pool is None:
+            pool = pools[key] = ConnectionPool(backend.connect, backend.is_alive, max_size=PoolSize, end_read=backend.end_read)
+        pools.move_to_end(key)
+        # New connections log in with the credentials entered last
+        pool.connect = backend.connect
+        while len(pools) > PoolsKept:
+            pools.popitem(last=False)[1].close()
+    return pool
+
+def logged_hold():
+    """(interval, max hold) in seconds when config.json stores by exception, else None"""
+    try:
+        with open(ConfigPath, "r") as f:
+            cfg = json.load(f)
+    except Exception:
+        return None
+    section = cfg.get("deadband", {})
+    if not section.get("enabled", False):
+        return None
+    # A stored value holds until the next row, at most a heartbeat plus some slack for late writes
+    return cfg.get("interval", 1), section.get("heartbeat", 60) * 1.5
+
+def gap_tolerance(step, hold):
+    """Tolerance for find_gaps: rows stored by exception are only missing after the heartbeat"""
+    if not hold:
+        return 1.5
+    return max(1.5, hold[1] / pd.Timedelta(step).total_seconds())
+
+HoldOversample = 8  # step-held points per plot bucket, so bucket means weight each value by the time it held
+HoldWarning = ("Rows are stored by exception: statistics and aggregated means weight each stored row equally, "
+               "not by the time its value held. Min and max are exact.")
+
 # Data retrieval function
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def retrieve_data(host, user, password, database, table, start_datetime, end_datetime):
-    """Retrieve data from MySQL database"""
+def retrieve_data(storage, table, start_datetime, end_datetime, device_id=1, hold=None):
+    """Retrieve data through the block cache: missing blocks are fetched, cached ones only get their new rows.
+
+    With hold (interval, max hold) the rows were stored by exception and
+    the last row before the start is kept, it holds the value at the start.
+    Only the plotted window is step-held (see held_window).
+    """
     try:
-        # Connect to database
-        connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database
+        # The value at the start was stored up to one heartbeat before it
+        fetch_start = start_datetime - timedelta(seconds=hold[1]) if hold else start_datetime
+        df = get_data_cache().retrieve(
+            open_backend(storage).key() + (table, device_id), get_pool(storage).connection,
+            table, device_id, fetch_start, end_datetime
         )
-        
-        # SQL query to get data in time range
-        query = f"""
-        SELECT * FROM vfd 
-        WHERE Date_Time BETWEEN %s AND %s 
-        ORDER BY Date_Time ASC
-        """
-        
-        # Read data into pandas DataFrame
-        df = pd.read_sql(query, connection, params=[start_datetime, end_datetime])
-        
-        connection.close()
+        if hold:
+            first = max(df['Date_Time'].searchsorted(pd.Timestamp(start_datetime)) - 1, 0)
+            df = df.iloc[first:].reset_index(drop=True)
         return df, None
         
     except Exception as e:
         return None, str(e)
 
-# Function to fill gaps
-def fill_data_gaps(df, interval='1T'):
-    """Fill gaps in data with 0 values"""
-    if df.empty:
-        return df
-    
-    # Convert Date_Time to datetime if it's not already
-    df['Date_Time'] = pd.to_datetime(df['Date_Time'])
-    
-    # Set Date_Time as index
-    df_indexed = df.set_index('Date_Time')
-    
-    # Create complete time range
-    start_time = df_indexed.index.min()
-    end_time = df_indexed.index.max()
-    complete_range = pd.date_range(start=start_time, end=end_time, freq=interval)
-    
-    # Reindex with complete range and fill missing values with 0
-    df_filled = df_indexed.reindex(complete_range, fill_value=0)
+@st.cache_data(ttl=300, max_entries=64)
+def retrieve_downsampled(storage, table, device_id, start_datetime, end_datetime, columns, bucket):
+    """Retrieve min/max/mean per time bucket, from a rollup table when one fits or else aggregated from the raw rows"""
+    try:
+        with get_pool(storage).connection() as connection:
+            if not columns:
+                columns = value_columns(connection, table)
+            # Coarsest rollup that is not wider than a bucket: thousands of rows instead of millions
+            level = choose_level(bucket)
+            if level and rollup_covers(connection, table, level, device_id, start_datetime):
+                df = fetch_rollup(connection, table, level, device_id, start_datetime, end_datetime, list(columns), bucket)
+            else:
+                df = fetch_downsampled(connection, table, device_id, start_datetime, end_datetime, list(columns), bucket)
+        return df, None
+
+    except Exception as e:
+        return None, str(e)
+
+@st.cache_data(ttl=300, max_entries=64)
+def retrieve_range_stats(storage, table, device_id, start_datetime, end_datetime, columns):
+    """Exact count, mean, min and max over the whole range from the hourly or minute rollups (raw rows for the partial buckets at the ends), None when they do not cover it"""
+    try:
+        with get_pool(storage).connection() as connection:
+            for level in ("1h", "1m"):
+                if rollup_covers(connection, table, level, device_id, start_datetime):
+                    moments = rollup_moments(connection, table, level, device_id, start_datetime, end_datetime, list(columns))
+                    # Rollups keep no squares, so only the first moment is known
+                    return moments.rows, moments.result()[['count', 'mean', 'min', 'max', 'Range']].T
+    except Exception:
+        pass
+    return None
+
+@st.cache_data(max_entries=32)
+def summary_statistics(_df, table, device_id, data_version, bucket, first, last, rows, columns):
+    """describe() and the additional metrics of every column in one vectorised pass.
+
+    _df is not hashed: it is cached per source (table, device, data
+    version), range (bucket, first and last time, row count) and columns,
+    so reruns of the page do not recompute them.
+    """
+    columns = list(columns)
+    stats = Moments.from_frame(_df, columns).result()
+    values = _df[columns].to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+        quartiles = np.nanpercentile(values, [25, 50, 75], axis=0) if len(values) else np.full((3, len(columns)), np.nan)
+    describe = pd.DataFrame([stats['count'], stats['mean'], stats['std'], stats['min'], *quartiles, stats['max']],
+                            index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'], columns=columns)
+    additional = stats[['Variance', 'Skewness', 'Kurtosis', 'Missing %']].copy()
+    additional['Unique Values'] = _df[columns].nunique()
+    additional['Range'] = stats['Range']
+    return describe, additional
+
+StreamChunkSize = 50000  # rows per chunk in streaming mode
+# Private to the dashboard process, files only leave it through a session's download button
+ExportDir = os.path.join(tempfile.gettempdir(), "iasys_exports")
+ExportMaxAge = 3600  # seconds an export file is kept for downloading
+
+def sweep_exports():
+    """Delete export files older than ExportMaxAge, e.g. of sessions that never downloaded them"""
+    if not os.path.isdir(ExportDir):
+        return
+    for name in os.listdir(ExportDir):
+        old = os.path.join(ExportDir, name)
+        try:
+            if time.time() - os.path.getmtime(old) > ExportMaxAge:
+                os.remove(old)
+        except OSError:
+            pass  # another session removed it first
+
+def export_path(extension, previous=None):
+    """New export file of this session with a random name, removing its previous one"""
+    os.makedirs(ExportDir, exist_ok=True)
+    if previous and os.path.exists(previous):
+        os.remove(previous)
+    sweep_exports()
+    fd, path = tempfile.mkstemp(suffix="." + extension, prefix="export_", dir=ExportDir)
+    os.close(fd)
+    return path
+
+def discard_export(key):
+    """Delete the export file in st.session_state[key] once it was downloaded"""
+    exported = st.session_state.get(key) or {}
+    if exported.get('path') and os.path.exists(exported['path']):
+        os.remove(exported['path'])
+    exported['path'] = None
+
+def export_download(key, label):
+    """Download button for the export file in st.session_state[key].
+
+    The button reads the file on every rerun, so the file is deleted as
+    soon as it was downloaded, or by sweep_exports after ExportMaxAge.
+    """
+    exported = st.session_state.get(key)
+    if not exported or not exported.get('path') or not os.path.exists(exported['path']):
+        return
+    with open(exported['path'], "rb") as f:
+        st.download_button(f"📥 {label}", f, file_name=exported['file_name'], use_container_width=True,
+                           on_click=discard_export, args=(key,))
+
+def retrieved_device(df):
+    """Device ID of the retrieved rows, the device widget may have changed since"""
+    if 'Device_ID' in df.columns and len(df):
+        return int(df['Device_ID'].iloc[0])
+    return (st.session_state.get('overview') or {}).get('device_id', device_id)
+
+def stream_range(storage, table, device_id, start_datetime, end_datetime, bucket, progress):
+    """Stream a range chunk by chunk into statistics, plot buckets and a CSV file"""
+    try:
+        with get_pool(storage).connection() as connection:
+            total = count_rows(connection, table, device_id, start_datetime, end_datetime)
+            csv_path = export_path("csv", (st.session_state.get('streamed') or {}).get('path'))
+            stats = downsampler = csv_writer = None
+            done = 0
+            
+            try:
+                for chunk in stream_rows(connection, table, device_id, start_datetime, end_datetime, StreamChunkSize):
+                    if stats is None:
+                        columns = [c for c in chunk.columns if c not in KeyColumns]
+                        stats = Moments(columns)
+                        downsampler = ChunkDownsampler(columns, bucket)
+                        csv_writer = ExportWriter(csv_path, "CSV")
+                    stats.update(chunk)
+                    downsampler.update(chunk)
+                    csv_writer.write(chunk)
+                    done += len(chunk)
+                    progress.progress(min(1.0, done / max(total, 1)), text=f"Streamed {done:,} of {total:,} rows")
+            finally:
+                if csv_writer:
+                    csv_writer.close()
+        
+        if stats is None:
+            os.remove(csv_path)
+            return None, None
+        return {'buckets': downsampler.result(), 'stats': stats.result().T, 'rows': done, 'path': csv_path,
+                'file_name': export_file_name(table, device_id, start_datetime, end_datetime, "CSV")}, None
     
-    # Reset index to get Date_Time back as a column
-    df_filled = df_filled.reset_index()
-    df_filled.rename(columns={'index': 'Date_Time'}, inplace=True)
+    except Exception as e:
+        return None, str(e)
+
+def export_range(storage, table, device_id, start_datetime, end_datetime, columns, fmt, progress):
+    """Stream rows from the database straight into an export file, one chunk at a time"""
+    path = None
+    try:
+        path = export_path(ExportFormats[fmt][0], (st.session_state.get('export') or {}).get('path'))
+        with get_pool(storage).connection() as connection:
+            total = count_rows(connection, table, device_id, start_datetime, end_datetime)
+            with ExportWriter(path, fmt) as writer:
+                for chunk in stream_rows(connection, table, device_id, start_datetime, end_datetime, StreamChunkSize, columns):
+                    writer.write(chunk)
+                    progress.progress(min(1.0, writer.rows / max(total, 1)), text=f"Exported {writer.rows:,} of {total:,} rows")
+        return {'path': path, 'rows': writer.rows, 'format': fmt,
+                'file_name': export_file_name(table, device_id, start_datetime, end_datetime, fmt)}, None
     
-    return df_filled
+    except Exception as e:
+        if path and os.path.exists(path):
+            os.remove(path)
+        return None, str(e)
+
+def held_window(df, view_start, view_end, max_points, hold):
+    """Step-hold the stored rows of the view window, at plot resolution rather than the logging interval.
+
+    Returns the held rows and their interval: the logging interval, or
+    coarser so the window has at most HoldOversample * max_points rows.
+    """
+    view_start, view_end = pd.Timestamp(view_start), pd.Timestamp(view_end)
+    times = df['Date_Time']
+    first = max(times.searchsorted(view_start, side='right') - 1, 0)
+    last = times.searchsorted(view_end, side='right')
+    interval = max(pd.Timedelta(seconds=hold[0]), ((view_end - view_start) / (HoldOversample * max_points)).ceil('s'))
+    return step_hold(df.iloc[first:last], interval, pd.Timedelta(seconds=hold[1]), view_start, view_end), interval
+
+def get_plot_data(filtered_df, columns, view_start, view_end, max_points, strategy, interval):
+    """Rows to plot for the view window, downsampled to about max_points buckets.
+
+    Gaps are filled with strategy after downsampling, so only the visible
+    rows (or buckets) are ever filled. Returns (data, bucket). bucket is
+    None when the rows are not downsampled.
+    """
+    bucket = bucket_seconds(view_start, view_end, max_points)
+    overview = st.session_state.get('overview')
+    hold = st.session_state.get('hold')
+    data = None
+    held = False  # step-held rows: a hole in them is a logger outage, not a quiet value
+
+    if overview:
+        # Zoomed in far enough: the raw rows are fewer than the points
+        if bucket <= 1:
+            raw, error = retrieve_data(storage, table, view_start, view_end, overview['device_id'], hold)
+            if error is None and hold:
+                raw, step = held_window(raw, view_start, view_end, max_points, hold)
+                data, bucket, held = raw[['Date_Time'] + columns], None, True
+            elif error is None:
+                data, step, bucket = raw[['Date_Time'] + columns], sample_interval(raw['Date_Time']), None
+        else:
+            bucket = align_bucket(bucket)
+            df, error = retrieve_downsampled(storage, table, overview['device_id'],
+                                             view_start, view_end, tuple(columns), bucket)
+            if error is None:
+                data, step = df, pd.Timedelta(seconds=bucket)
+        if data is None:
+            st.warning(f"Could not refine from database, showing overview data: {error}")
+
+    if data is None:
+        if hold and not overview:
+            # Stored rows: bucket the held values, so the means are weighted by time
+            window, interval = held_window(filtered_df, view_start, view_end, max_points, hold)
+            held = True
+        else:
+            window = time_slice(filtered_df, view_start, view_end)
+        if len(window) <= max_points:
+            data, step, bucket = window, interval, None
+        else:
+            data, step = bucket_stats(window, 'Date_Time', columns, bucket), pd.Timedelta(seconds=bucket)
+
+    gaps = find_gaps(data['Date_Time'], step, gap_tolerance(step, None if held else hold))
+    return fill_window(data, gaps, strategy, step, max_rows=max_points), bucket
+
+LivePath = os.path.join(os.path.dirname(ConfigPath), "live.ring")
+LiveWindow = 600  # seconds of live samples kept on the chart
+
+@st.cache_resource
+def get_ring_reader(path):
+    return RingReader(path)
+
+@st.fragment(run_every=1)
+def live_tail(device_id):
+    """Append the samples the logger published since the last run and redraw, without querying the database"""
+    live = st.session_state.get('live')
+    if live is None or live['device_id'] != device_id:
+        # With a supervisor each bus worker has its own ring
+        path = next((w['live_path'] for w in supervisor_workers() or [] if device_id in w['devices']), LivePath)
+        live = st.session_state.live = {'device_id': device_id, 'seq': 0, 'data': None, 'path': path}
+    reader = get_ring_reader(live['path'])
+    try:
+        new, live['seq'] = reader.read_since(live['seq'], device_id)
+    except Exception as e:
+        st.info(f"No live data from the logger yet ({e})")
+        return
+
+    if not new.empty:
+        data = new if live['data'] is None else pd.concat([live['data'], new], ignore_index=True)
+        cutoff = data['Date_Time'].iloc[-1] - pd.Timedelta(seconds=LiveWindow)
+        live['data'] = data.iloc[data['Date_Time'].searchsorted(cutoff):].reset_index(drop=True)
+    data = live['data']
+    if data is None or data.empty:
+        st.info(f"Waiting for samples from device {device_id}...")
+        return
+
+    live_columns = st.multiselect("Live parameters", reader.columns, default=reader.columns[:3], key='live_columns')
+    fig = go.Figure()
+    for i, col in enumerate(live_columns):
+        add_series(fig, data, col, Colors[i % len(Colors)], False)
+    fig.update_xaxes(type='date')
+    fig.update_layout(
+        xaxis_title="Time",
+        yaxis_title="Values",
+        height=400,
+        hovermode='x unified',
+        uirevision='live'  # keep zoom and legend selection between refreshes
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Last sample {data['Date_Time'].iloc[-1]:%Y-%m-%d %H:%M:%S}, {len(data)} samples in the last {LiveWindow // 60} minutes")
+
+st.subheader("📡 Live Tail")
+if st.toggle("Live tail", help="Updates every second from the logger's shared ring buffer, without database queries"):
+    live_tail(device_id)
+
+st.divider()
+
+retrieval_mode = st.radio(
+    "Retrieval mode",
+    ["Raw rows", "Overview (aggregated in database)", "Streaming (chunked)"],
+    horizontal=True,
+    help="Overview suits long ranges: the database returns min/max/mean per time bucket instead of every row. "
+         "Streaming reads every row in chunks to compute exact statistics and a CSV export without holding the range in memory"
+)
+max_points = st.slider(
+    "Points per trace", 500, 10000, 2000, step=500,
+    help="About two points per pixel of plot width. Longer windows are downsampled to this many buckets"
+)
+hold = logged_hold()
+if st.checkbox("Step-hold rows stored by exception", value=hold is not None,
+               help="Each stored value holds until the next row. On by default when the logger stores by exception"):
+    hold = hold or (interval, 90)
+else:
+    hold = None
 
 # Main retrieval button
 if st.button("🔍 Retrieve Data", use_container_width=True, type="primary"):
-    if not all([host, user, password, database, table]):
+    if not all(storage.values()):
         st.error("Please fill in all database connection fields!")
+    elif retrieval_mode.startswith("Overview"):
+        with st.spinner("Aggregating data in the database..."):
+            bucket = align_bucket(bucket_seconds(start_datetime, end_datetime, max_points))
+            overview_data, error = retrieve_downsampled(
+                storage, table, device_id, start_datetime, end_datetime, (), bucket
+            )
+
+            if error:
+                st.error(f"Database Error: {error}")
+            elif overview_data is None or overview_data.empty:
+                st.warning("No data found for the selected time period!")
+            else:
+                # The table and statistics work on the bucket means
+                mean_columns = [c for c in overview_data.columns if not c.endswith(('__min', '__max'))]
+                st.session_state.analysis_data = overview_data[mean_columns]
+                st.session_state.data_version = st.session_state.get('data_version', 0) + 1
+                st.session_state.overview = {'device_id': device_id, 'bucket': bucket}
+                st.session_state.sample_interval = pd.Timedelta(seconds=bucket)
+                st.session_state.hold = hold
+                st.session_state.gaps = find_gaps(overview_data['Date_Time'], st.session_state.sample_interval,
+                                                  gap_tolerance(st.session_state.sample_interval, hold))
+                st.session_state.streamed = None
+                range_stats = retrieve_range_stats(storage, table, device_id, start_datetime, end_datetime, tuple(mean_columns[1:]))
+                st.session_state.range_stats = range_stats and {'rows': range_stats[0], 'stats': range_stats[1], 'source': 'rollup'}
+                st.success(f"✅ Retrieved {len(overview_data)} buckets of {bucket} s")
+                if hold:
+                    st.warning(HoldWarning)
+    elif retrieval_mode.startswith("Streaming"):
+        bucket = bucket_seconds(start_datetime, end_datetime, max_points)
+        progress = st.progress(0.0, text="Counting rows...")
+        streamed, error = stream_range(
+            storage, table, device_id, start_datetime, end_datetime, bucket, progress
+        )
+        progress.empty()
+
+        if error:
+            st.error(f"Database Error: {error}")
+        elif streamed is None:
+            st.warning("No data found for the selected time period!")
+        else:
+            # Plots and the table use the buckets, statistics were computed over every row
+            buckets = streamed.pop('buckets')
+            mean_columns = [c for c in buckets.columns if not c.endswith(('__min', '__max'))]
+            st.session_state.analysis_data = buckets[mean_columns]
+            st.session_state.data_version = st.session_state.get('data_version', 0) + 1
+            st.session_state.overview = {'device_id': device_id, 'bucket': bucket}
+            st.session_state.sample_interval = pd.Timedelta(seconds=bucket)
+            st.session_state.hold = hold
+            st.session_state.gaps = find_gaps(buckets['Date_Time'], st.session_state.sample_interval,
+                                              gap_tolerance(st.session_state.sample_interval, hold))
+            st.session_state.range_stats = {'rows': streamed['rows'], 'stats': streamed.pop('stats'), 'source': 'streamed'}
+            st.session_state.streamed = streamed
+            st.success(f"✅ Streamed {streamed['rows']:,} records into {len(buckets)} buckets of {bucket} s")
+            if hold:
+                st.warning(HoldWarning)
     else:
         with st.spinner("Retrieving data from database..."):
             # Retrieve raw data
             raw_data, error = retrieve_data(
-                host, user, password, database, 
-                table, start_datetime, end_datetime
+                storage, table, start_datetime, end_datetime, device_id, hold
             )
             
             if error:
@@ -417,26 +970,31 @@ if st.button("🔍 Retrieve Data", use_container_width=True, type="primary"):
                 st.success(f"✅ Retrieved {len(raw_data)} records")
                 
                 # Store in session state
-                st.session_state.raw_data = raw_data
+                st.session_state.analysis_data = raw_data
+                st.session_state.data_version = st.session_state.get('data_version', 0) + 1
+                st.session_state.overview = None
+                st.session_state.streamed = None
+                st.session_state.range_stats = None
+                st.session_state.hold = hold
                 
-                # Fill gaps
-                with st.spinner("Filling data gaps..."):
-                    filled_data = fill_data_gaps(raw_data, "1s")
-                    st.session_state.filled_data = filled_data
+                # Find gaps, they are only filled for the window being viewed
+                st.session_state.sample_interval = pd.Timedelta(seconds=hold[0]) if hold else sample_interval(raw_data['Date_Time'])
+                st.session_state.gaps = find_gaps(raw_data['Date_Time'], st.session_state.sample_interval,
+                                                  gap_tolerance(st.session_state.sample_interval, hold))
                 
-                st.success(f"✅ After gap filling: {len(filled_data)} records")
-if 'filled_data' in st.session_state:
-    filled_data = st.session_state.filled_data 
+                st.success(f"✅ Found {len(st.session_state.gaps)} gaps, {st.session_state.gaps['missing'].sum()} missing samples")
+if 'analysis_data' in st.session_state:
+    analysis_data = st.session_state.analysis_data 
 
     st.divider()
 
     st.subheader("📊 Data Analysis & Visualization")
         
     # Get all column names except id and date_time related columns
-    exclude_columns = ['ID', 'Date_Time']
+    exclude_columns = ['ID', 'Device_ID', 'Date_Time']
         
     # Get all columns and filter out the excluded ones
-    all_columns = filled_data.columns.tolist()
+    all_columns = analysis_data.columns.tolist()
     available_columns = [col for col in all_columns if col not in exclude_columns]
 
     time_column = 'Date_Time'    
@@ -472,7 +1030,7 @@ if 'filled_data' in st.session_state:
     if selected_columns:
         # Create filtered dataframe with time column and selected columns
         display_columns = [time_column] + selected_columns
-        filtered_df = filled_data[display_columns].copy()
+        filtered_df = analysis_data[display_columns]
         
         # Display metrics
         col1, col2, col3, col4 = st.columns([1,1,1,1])
@@ -492,87 +1050,101 @@ if 'filled_data' in st.session_state:
             missing_count = filtered_df[selected_columns].isnull().sum().sum()
             st.metric("🔍 Missing Values", missing_count)
         
-        # Tabs for different views
-        tab1, tab2, tab3, tab4, tab5 = st.tabs(["📋 Filtered Data", "📈 Individual Plots", "📊 Combined Plot", "📉 Subplots", "📈 Summary Statistics"])
+        if st.session_state.get('overview'):
+            st.info(f"Overview mode: rows are means of {st.session_state.overview['bucket']} s buckets")
+
+        fill_label = st.selectbox(
+            "Gap handling",
+            list(FillStrategies),
+            help="How missing samples are drawn. Only the rows in the view window are filled, statistics always use the logged rows"
+        )
+
+        # Zoom: plots only cover the view window, refined to full resolution when it is small enough
+        data_start = filtered_df[time_column].min().to_pydatetime()
+        data_end = filtered_df[time_column].max().to_pydatetime()
+        if data_start < data_end:
+            view_start, view_end = st.slider(
+                "🔎 View window",
+                min_value=data_start,
+                max_value=data_end,
+                value=(data_start, data_end),
+                format="YYYY-MM-DD HH:mm:ss"
+            )
+        else:
+            view_start, view_end = data_start, data_end
+        # Plot data and figures are built once per data version, view window, resolution and columns
+        if 'figures' not in st.session_state:
+            st.session_state.figures = FigureCache()
+        figures = st.session_state.figures
+        plot_key = (st.session_state.get('data_version'), view_start, view_end, max_points, fill_label)
+        plot_df, bucket = figures.get(
+            ('data',) + plot_key + (tuple(selected_columns),),
+            lambda: get_plot_data(filtered_df, selected_columns, view_start, view_end, max_points,
+                                  FillStrategies[fill_label], st.session_state.sample_interval)
+        )
+        bucketed = bucket is not None
+        if bucketed:
+            st.caption(f"Plots show mean with min/max band per {bucket} s bucket ({len(plot_df)} buckets). Narrow the view window for more detail.")
+        
+        # Only the selected view is built, tabs would build every figure on each rerun
+        views = ["📋 Filtered Data", "📈 Individual Plots", "📊 Combined Plot", "📉 Subplots", "📈 Summary Statistics"]
+        view = st.radio("View", views, horizontal=True, key='view', label_visibility="collapsed")
         
-        with tab1:
+        if view == views[0]:
             st.write("### 📋 Filtered DataFrame")
             st.write(f"Showing {len(selected_columns)} selected columns:")
             
             # Display column info
             for i, col in enumerate(selected_columns):
                 col_info = f"**{i+1}. {col}** - {filtered_df[col].dtype}"
-                if filtered_df[col].dtype in ['int64', 'float64']:
+                if pd.api.types.is_numeric_dtype(filtered_df[col]):
                     col_info += f" (Range: {filtered_df[col].min():.2f} to {filtered_df[col].max():.2f})"
                 st.write(col_info)
             
             st.dataframe(filtered_df, use_container_width=True, height=400)
             
-            # Download filtered data
-            csv = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download Filtered Data (CSV)",
-                data=csv,
-                file_name=f"filtered_data_{len(selected_columns)}_columns.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+            # Export the selected columns of the whole range, streamed from the database to a file
+            st.write("#### 📥 Export")
+            sweep_exports()
+            export_format = st.selectbox("Format", available_formats(), help="Parquet and Arrow need pyarrow and are much smaller than CSV")
+            if st.button("Prepare Export", use_container_width=True):
+                export_device = retrieved_device(analysis_data)
+                progress = st.progress(0.0, text="Counting rows...")
+                exported, error = export_range(
+                    storage, table, export_device,
+                    start_datetime, end_datetime, selected_columns, export_format, progress
+                )
+                progress.empty()
+                if error:
+                    st.session_state.export = None
+                    st.error(f"Export Error: {error}")
+                else:
+                    st.session_state.export = exported
+            
+            exported = st.session_state.get('export')
+            if exported:
+                export_download('export', f"Download {exported['format']} ({exported['rows']:,} rows)")
+            
+            # The streamed export holds every row of the range, not just the buckets shown
+            streamed = st.session_state.get('streamed')
+            if streamed:
+                export_download('streamed', f"Download Full Range ({streamed['rows']:,} rows, CSV)")
         
-        with tab2:
+        if view == views[1]:
             st.write("### 📈 Individual Line Plots")
             
-            for col in selected_columns:
-                fig = px.line(
-                    filtered_df, 
-                    x=time_column, 
-                    y=col,
-                    title=f"{col} Over Time",
-                    labels={time_column: "Time", col: col}
-                )
-                
-                # Customize the plot
-                fig.update_traces(line=dict(width=2))
-                fig.update_layout(
-                    height=400,
-                    hovermode='x unified',
-                    showlegend=True
-                )
-                
+            for i, col in enumerate(selected_columns):
+                fig = figures.get(('line', col, Colors[i % len(Colors)]) + plot_key,
+                                  lambda: line_figure(plot_df, col, Colors[i % len(Colors)], bucketed))
                 st.plotly_chart(fig, use_container_width=True)
         
-        with tab3:
+        if view == views[2]:
             st.write("### 📊 Combined Line Plot")
             
             if len(selected_columns) > 1:
                 # Create combined plot with all selected columns
-                fig = go.Figure()
-                
-                colors = px.colors.qualitative.Set1[:len(selected_columns)]
-                
-                for i, col in enumerate(selected_columns):
-                    fig.add_trace(go.Scatter(
-                        x=filtered_df[time_column],
-                        y=filtered_df[col],
-                        mode='lines',
-                        name=col,
-                        line=dict(width=2, color=colors[i]),
-                        hovertemplate=f'<b>{col}</b><br>Value: %{{y}}<br>Time: %{{x}}<extra></extra>'
-                    ))
-                
-                fig.update_layout(
-                    title=f"Combined Plot: {', '.join(selected_columns)}",
-                    xaxis_title="Time",
-                    yaxis_title="Values",
-                    height=500,
-                    hovermode='x unified',
-                    legend=dict(
-                        yanchor="top",
-                        y=0.99,
-                        xanchor="left",
-                        x=1.01
-                    )
-                )
-                
+                fig = figures.get(('combined', tuple(selected_columns)) + plot_key,
+                                  lambda: combined_figure(plot_df, selected_columns, bucketed))
                 st.plotly_chart(fig, use_container_width=True)
                 
                 st.info("💡 **Tip:** This plot shows all selected columns on the same scale. Use subplots if your data has very different ranges.")
@@ -580,48 +1152,13 @@ if 'filled_data' in st.session_state:
             else:
                 st.info("Select multiple columns to see a combined plot.")
         
-        with tab4:
+        if view == views[3]:
             st.write("### 📉 Individual Subplots")
             
             if len(selected_columns) > 1:
                 # Create subplots
-                fig = make_subplots(
-                    rows=len(selected_columns),
-                    cols=1,
-                    subplot_titles=selected_columns,
-                    shared_xaxes=True,
-                    vertical_spacing=0.05,
-                    specs=[[{"secondary_y": False}] for _ in selected_columns]
-                )
-                
-                colors = px.colors.qualitative.Set1[:len(selected_columns)]
-                
-                for i, col in enumerate(selected_columns):
-                    fig.add_trace(
-                        go.Scatter(
-                            x=filtered_df[time_column],
-                            y=filtered_df[col],
-                            mode='lines',
-                            name=col,
-                            line=dict(width=2, color=colors[i]),
-                            showlegend=False,
-                            hovertemplate=f'<b>{col}</b><br>Value: %{{y}}<br>Time: %{{x}}<extra></extra>'
-                        ),
-                        row=i+1, col=1
-                    )
-                    
-                    # Update y-axis title for each subplot
-                    fig.update_yaxes(title_text=col, row=i+1, col=1)
-                
-                fig.update_layout(
-                    height=300 * len(selected_columns),
-                    title_text="Individual Parameter Analysis",
-                    showlegend=False
-                )
-                
-                # Only show x-axis title on bottom plot
-                fig.update_xaxes(title_text="Time", row=len(selected_columns), col=1)
-                
+                fig = figures.get(('subplots', tuple(selected_columns)) + plot_key,
+                                  lambda: subplots_figure(plot_df, selected_columns, bucketed))
                 st.plotly_chart(fig, use_container_width=True)
                 
                 st.info("💡 **Tip:** Subplots are ideal when your data columns have different scales or units.")
@@ -629,34 +1166,35 @@ if 'filled_data' in st.session_state:
             else:
                 st.info("Select multiple columns to see subplots.")
         
-        with tab5:
+        if view == views[4]:
             st.write("### 📈 Summary Statistics")
             
             # Calculate summary statistics for selected columns
             numeric_columns = [col for col in selected_columns if pd.api.types.is_numeric_dtype(filtered_df[col])]
             
+            if st.session_state.get('hold'):
+                st.warning(HoldWarning)
+            range_stats = st.session_state.get('range_stats')
+            if range_stats and numeric_columns:
+                source = "streamed rows" if range_stats['source'] == 'streamed' else "rows, from the rollup tables"
+                st.write(f"#### 📊 Statistics over all {range_stats['rows']:,} {source}")
+                st.dataframe(range_stats['stats'][[c for c in numeric_columns if c in range_stats['stats'].columns]], use_container_width=True)
+                st.caption("The tables below are computed on the bucket means")
+            
             if numeric_columns:
                 try:
+                    overview = st.session_state.get('overview')
+                    summary_stats, additional_stats = summary_statistics(
+                        filtered_df, table, retrieved_device(analysis_data), st.session_state.get('data_version'), (overview or {}).get('bucket'), filtered_df['Date_Time'].iloc[0],
+                        filtered_df['Date_Time'].iloc[-1], len(filtered_df), tuple(numeric_columns)
+                    )
+                    
                     # Basic descriptive statistics
                     st.write("#### 📊 Descriptive Statistics")
-                    summary_stats = filtered_df[numeric_columns].describe()
                     st.dataframe(summary_stats, use_container_width=True)
                     
                     # Additional statistics
                     st.write("#### 📈 Additional Metrics")
-                    additional_stats = pd.DataFrame(index=numeric_columns)
-                    
-                    for col in numeric_columns:
-                        try:
-                            additional_stats.loc[col, 'Variance'] = filtered_df[col].var()
-                            additional_stats.loc[col, 'Skewness'] = filtered_df[col].skew()
-                            additional_stats.loc[col, 'Kurtosis'] = filtered_df[col].kurtosis()
-                            additional_stats.loc[col, 'Missing %'] = (filtered_df[col].isnull().sum() / len(filtered_df)) * 100
-                            additional_stats.loc[col, 'Unique Values'] = filtered_df[col].nunique()
-                            additional_stats.loc[col, 'Range'] = filtered_df[col].max() - filtered_df[col].min()
-                        except Exception as e:
-                            st.warning(f"Could not calculate some statistics for {col}: {str(e)}")
-                    
                     st.dataframe(additional_stats.round(4), use_container_width=True)
                     
                 except Exception as e:
@@ -682,15 +1220,21 @@ if 'filled_data' in st.session_state:
     st.divider()
     st.subheader("📋 Data Quality Summary")
     
-    total_rows = len(st.session_state.filled_data)
-    total_cols = len(st.session_state.filled_data.columns)
-    missing_cells = st.session_state.filled_data.isnull().sum().sum()
+    total_rows = len(analysis_data)
+    gaps = st.session_state.gaps
+    missing_samples = int(gaps['missing'].sum())
     
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Total Records", total_rows)
-    col2.metric("Total Columns", total_cols)  
-    col3.metric("Missing Values", missing_cells)
-    col4.metric("Data Completeness", f"{((total_rows * total_cols - missing_cells) / (total_rows * total_cols) * 100):.1f}%")
+    col2.metric("Gaps", len(gaps))  
+    col3.metric("Missing Samples", missing_samples)
+    col4.metric("Data Completeness", f"{(total_rows / (total_rows + missing_samples) * 100):.1f}%")
+    
+    with st.expander(f"Gaps (expected interval {st.session_state.sample_interval})"):
+        if gaps.empty:
+            st.info("No gaps found")
+        else:
+            st.dataframe(gaps.sort_values('length', ascending=False), use_container_width=True)
 else:
     st.warning("⚠️ No data available! Please retrieve and process data first.")
 
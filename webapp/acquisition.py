@@ -0,0 +1,266 @@
+import asyncio
+import threading
+import time
+# pymodbus 3.10 renamed slave= to device_id= and the server's slave contexts, see requirements.txt
+from pymodbus import FramerType
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+from metrics import Registry
+from modbus_tcp import PipelinedTcpClient
+from register_map import DefaultRegisters, decode_block, parse_registers, plan_reads
+from scheduler import DeadlineScheduler
+
+
+def load_devices(cfg):
+    """Buses and devices from the config.
+
+    New style configs list them explicitly:
+        "buses": {"rs485_1": {"type": "serial", "port": "COM3", "baudrate": 9600, ...},
+                  "gateway": {"type": "tcp", "host": "192.168.1.10", "port": 502, "max_in_flight": 8},
+                  "rtu_gw": {"type": "rtu_tcp", "host": "192.168.1.11", "port": 4001}}
+        "devices": [{"id": 1, "bus": "rs485_1", "slave": 1, "interval": 1}, ...]
+
+    The register map ("registers", see register_map.py) is taken from the
+    device or else from the top level of the config. Registers with their
+    own "interval" are polled in a separate group at that rate, and each
+    group is planned into as few block reads as possible.
+
+    Old configs with only a "modbus" section become one serial bus with the
+    slave IDs in "slaves" (default: a single unit 1).
+    """
+    buses = dict(cfg.get("buses", {}))
+    devices = list(cfg.get("devices", []))
+
+    if "modbus" in cfg and "default" not in buses:
+        buses["default"] = dict(cfg["modbus"], type="serial")
+    if not devices:
+        for slave in cfg.get("modbus", {}).get("slaves", [1]):
+            devices.append({"id": slave, "bus": "default", "slave": slave})
+
+    default_interval = cfg.get("interval", 1)
+    for device in devices:
+        device.setdefault("bus", "default")
+        device.setdefault("slave", device.get("id", 1))
+        device.setdefault("id", device["slave"])
+        device.setdefault("interval", default_interval)
+        device.setdefault("timeout", 1)
+        if device["bus"] not in buses:
+            raise ValueError(f"Device {device['id']} uses unknown bus '{device['bus']}'")
+
+        registers = parse_registers(device.get("registers", cfg.get("registers", DefaultRegisters)), device["interval"])
+        device["registers"] = registers
+        max_gap = device.get("max_gap", cfg.get("max_gap", 8))
+        device["groups"] = []
+        for interval in sorted(set(reg["interval"] for reg in registers)):
+            group_registers = [reg for reg in registers if reg["interval"] == interval]
+            device["groups"].append({"interval": interval, "blocks": plan_reads(group_registers, max_gap)})
+    return buses, devices
+
+
+async def gather_all(aws):
+    """Results of aws run concurrently, in order.
+
+    On the first failure the others are cancelled and awaited before it is
+    raised, so no task is left running with an exception nobody retrieves
+    (and a cancelled pipelined read drops its transaction ID).
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+def device_columns(devices):
+    """Every mapped column over all devices, in register map order."""
+    columns = []
+    for device in devices:
+        for reg in device["registers"]:
+            if reg["column"] not in columns:
+                columns.append(reg["column"])
+    return columns
+
+
+class Bus:
+    """One Modbus connection shared by every device behind it.
+
+    Types: "serial" (RTU on a local port), "tcp" (Modbus TCP, pipelined)
+    and "rtu_tcp" (RTU frames through a transparent TCP gateway).
+    """
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        kind = settings.get("type", "serial")
+        # Modbus TCP replies carry the transaction ID, so reads can overlap. RS-485, and RTU
+        # frames tunnelled over TCP, are half duplex: one transaction on the wire at a time.
+        self.pipelined = kind == "tcp"
+        self.lock = asyncio.Lock()
+        if kind == "tcp":
+            self.client = PipelinedTcpClient(
+                settings["host"],
+                port=settings.get("port", 502),
+                timeout=settings.get("timeout", 1),
+                max_in_flight=settings.get("max_in_flight", 8)
+            )
+        elif kind == "rtu_tcp":
+            self.client = AsyncModbusTcpClient(
+                settings["host"],
+                port=settings.get("port", 502),
+                framer=FramerType.RTU,
+                timeout=settings.get("timeout", 1)
+            )
+        else:
+            self.client = AsyncModbusSerialClient(
+                port=settings["port"],
+                baudrate=settings.get("baudrate", 9600),
+                stopbits=settings.get("stopbits", 1),
+                parity=settings.get("parity", "N"),
+                bytesize=settings.get("bytesize", 8),
+                timeout=settings.get("timeout", 1)
+            )
+
+    async def ensure_connected(self):
+        if not self.client.connected:
+            Registry.incr("modbus_reconnects_total", bus=self.name)
+            await self.client.connect()
+        return self.client.connected
+
+    def close(self):
+        self.client.close()
+
+
+class AcquisitionEngine:
+    """Polls every configured device concurrently on its own schedule.
+
+    Each register group of each device runs in its own task on a deadline
+    scheduler, so a slave that times out only delays the devices sharing its
+    serial line, never the other buses. On Modbus TCP buses the reads of all
+    devices overlap on one connection. After each successful cycle the
+    device's latest decoded values are handed to on_sample(device, ts, values)
+    as a {column: value} dict; columns of groups not read yet are missing.
+    Failures go to on_error(device, message). Both are called from the
+    engine thread.
+    """
+
+    def __init__(self, buses, devices, on_sample, on_error):
+        self.bus_settings = buses
+        self.devices = devices
+        self.on_sample = on_sample
+        self.on_error = on_error
+        self.buses = {}
+        self.schedulers = {}
+        self.loop = None
+        self.main_task = None
+        self.thread = None
+
+    async def read_block(self, bus, device, block):
+        """Read one planned block and decode it into column values."""
+        if block["table"] == "input":
+            request = bus.client.read_input_registers(block["address"], count=block["count"], slave=device["slave"])
+        else:
+            request = bus.client.read_holding_registers(block["address"], count=block["count"], slave=device["slave"])
+        try:
+            with Registry.timer("modbus_request_seconds", bus=bus.name, device=device["id"]):
+                rr = await asyncio.wait_for(request, timeout=device["timeout"])
+        except asyncio.TimeoutError:
+            Registry.incr("modbus_errors_total", bus=bus.name, device=device["id"], kind="timeout")
+            raise
+        except (ModbusException, ConnectionError):
+            # No or garbled response, e.g. a CRC error on the serial line or a dropped TCP connection
+            Registry.incr("modbus_errors_total", bus=bus.name, device=device["id"], kind="io")
+            raise
+
+        if rr is None or rr.isError():
+            Registry.incr("modbus_errors_total", bus=bus.name, device=device["id"], kind="exception")
+            raise ValueError(f"Modbus read error at {block['table']} {block['address']}")
+        if len(rr.registers) < block["count"]:
+            Registry.incr("modbus_errors_total", bus=bus.name, device=device["id"], kind="short")
+            raise ValueError(f"Only got {len(rr.registers)} registers at {block['address']}, expected {block['count']}")
+        return decode_block(block, rr.registers)
+
+    async def poll_group(self, device, group, latest):
+        bus = self.buses[device["bus"]]
+        scheduler = DeadlineScheduler(group["interval"])
+        self.schedulers[(device["id"], group["interval"])] = scheduler
+
+        await scheduler.wait_first()
+        while True:
+            try:
+                started = time.monotonic()
+                ts = scheduler.tick_time().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                values = {}
+                async with bus.lock:
+                    Registry.observe("modbus_lock_wait_seconds", time.monotonic() - started, bus=bus.name)
+                    if not await bus.ensure_connected():
+                        Registry.incr("modbus_errors_total", bus=bus.name, device=device["id"], kind="connect")
+                        raise ConnectionError(f"Cannot connect to bus '{bus.name}'")
+                    if not bus.pipelined:
+                        for block in group["blocks"]:
+                            values.update(await self.read_block(bus, device, block))
+                if bus.pipelined:
+                    # Every block of the group in flight at once, the lock only guards connecting
+                    for block_values in await gather_all(
+                            [self.read_block(bus, device, block) for block in group["blocks"]]):
+                        values.update(block_values)
+
+                scheduler.record_cycle(time.monotonic() - started)
+                Registry.observe("acquisition_cycle_seconds", time.monotonic() - started, device=device["id"])
+                latest.update(values)
+                self.on_sample(device, ts, dict(latest))
+
+            except asyncio.TimeoutError:
+                self.on_error(device, f"Timeout after {device['timeout']} s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.on_error(device, f"Read cycle error: {e}")
+
+            await scheduler.wait()
+
+    def schedule_stats(self):
+        """Tick and overrun counters per device and polling rate."""
+        return {f"{device_id}@{interval}s": scheduler.stats()
+                for (device_id, interval), scheduler in list(self.schedulers.items())}
+
+    async def run(self):
+        self.buses = {name: Bus(name, settings) for name, settings in self.bus_settings.items()}
+        tasks = []
+        for device in self.devices:
+            # Groups of one device share the latest values so every row is complete
+            latest = {}
+            for group in device["groups"]:
+                tasks.append(asyncio.create_task(self.poll_group(device, group, latest)))
+        try:
+            # Polls only end on an unexpected error, gather_all stops the others and raises it
+            await gather_all(tasks)
+        finally:
+            for bus in self.buses.values():
+                bus.close()
+
+    def _thread_main(self):
+        self.loop = asyncio.new_event_loop()
+        self.main_task = self.loop.create_task(self.run())
+        try:
+            self.loop.run_until_complete(self.main_task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    def start(self):
+        """Run the engine in a background thread."""
+        self.thread = threading.Thread(target=self._thread_main, name="acquisition", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.main_task.cancel)
+        if self.thread:
+            self.thread.join(timeout)
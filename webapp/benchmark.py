@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from register_map import DefaultRegisters, parse_registers
+from storage import SQLiteBackend
+
+# Dashboard benchmarks run on a generated SQLite table with this layout
+BenchColumns = [reg["column"] for reg in DefaultRegisters]
+BenchStart = datetime(2024, 1, 1)
+
+
+def percentile(values, q):
+    """q quantile (0..1) of values, nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(fn, repeat):
+    """Seconds of repeat calls of fn()."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Acquisition: the logger against a simulated slave -----------------------
+
+def start_simulator(port, slaves, registers, transport="tcp"):
+    """pymodbus TCP server with slaves units of registers holding registers, in a daemon thread.
+
+    With transport "rtu_tcp" it speaks RTU frames, like a transparent serial gateway.
+    """
+    from pymodbus import FramerType
+    from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+    from pymodbus.server import StartAsyncTcpServer
+
+    def block():
+        # Address 0 is at index 1 of a pymodbus data block
+        return ModbusSequentialDataBlock(0, [i % 65536 for i in range(registers + 1)])
+
+    context = ModbusServerContext(
+        slaves={unit: ModbusSlaveContext(hr=block(), ir=block()) for unit in range(1, slaves + 1)},
+        single=False
+    )
+    thread = threading.Thread(
+        target=lambda: asyncio.run(StartAsyncTcpServer(
+            context=context, address=("127.0.0.1", port),
+            framer=FramerType.RTU if transport == "rtu_tcp" else FramerType.SOCKET
+        )),
+        name="simulator", daemon=True
+    )
+    thread.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return thread
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Simulated slave did not start on port {port}")
+
+
+def bench_config(folder, port, devices, registers, interval, transport="tcp"):
+    return {
+        "buses": {"sim": {"type": transport, "host": "127.0.0.1", "port": port}},
+        "devices": [{"id": unit, "bus": "sim", "slave": unit} for unit in range(1, devices + 1)],
+        "registers": [{"column": f"R{address:04d}", "address": address} for address in range(registers)],
+        "interval": interval,
+        "storage": {"backend": "sqlite", "path": os.path.join(folder, "bench.db")},
+        "spool": {"path": os.path.join(folder, "spool")},
+        "live": {"path": os.path.join(folder, "live.ring")},
+        "metrics": {"enabled": False}
+    }
+
+
+def start_logger(folder):
+    """logger.py's main loop in a child process, with every path in folder."""
+    script = (
+        "import logger\n"
+        f"logger.ConfigPath = {os.path.join(folder, 'config.json')!r}\n"
+        f"logger.StatusPath = {os.path.join(folder, 'status.bin')!r}\n"
+        "logger.main()\n"
+    )
+    return subprocess.Popen(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
+    )
+
+
+def stop_logger(proc, timeout=10):
+    # Same as the dashboard's Stop button: a graceful interrupt, then kill
+    if os.name == "nt":
+        proc.send_signal(signal.CTRL_BREAK_EVENT)
+    else:
+        proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_acquisition(devices, registers, interval, duration, warmup=5, transport="tcp"):
+    """Run the logger against a simulated slave and measure what reaches the database.
+
+    Latency is from a sample's tick time to the moment the row is visible
+    in the database, found by polling it every 50 ms.
+    """
+    import psutil
+    from status_channel import StatusReader
+
+    folder = tempfile.mkdtemp(prefix="vfd_bench_")
+    port = free_port()
+    start_simulator(port, devices, registers, transport)
+    with open(os.path.join(folder, "config.json"), "w") as f:
+        json.dump(bench_config(folder, port, devices, registers, interval, transport), f, indent=2)
+
+    proc = start_logger(folder)
+    process = psutil.Process(proc.pid)
+    process.cpu_percent()
+    db_path = os.path.join(folder, "bench.db")
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(db_path):
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Logger did not start, run it by hand with the config in " + folder)
+            time.sleep(0.1)
+        db = SQLiteBackend(db_path).connect()
+        time.sleep(warmup)
+
+        cursor = db.cursor()
+        cursor.execute("SELECT COALESCE(MAX(ID), 0) FROM vfd")
+        last_id = cursor.fetchone()[0]
+        started = datetime.now()
+        end = time.monotonic() + duration
+        latencies, cpu, rss, rows = [], [], [], 0
+        next_sample = time.monotonic()
+        while time.monotonic() < end:
+            cursor.execute("SELECT ID, Date_Time FROM vfd WHERE ID > ? ORDER BY ID", (last_id,))
+            now = datetime.now()
+            for row_id, ts in cursor.fetchall():
+                last_id = row_id
+                ts = datetime.fromisoformat(ts)
+                if ts >= started:
+                    rows += 1
+                    latencies.append((now - ts).total_seconds())
+            if time.monotonic() >= next_sample:
+                cpu.append(process.cpu_percent())
+                rss.append(process.memory_info().rss)
+                next_sample += 0.5
+            time.sleep(0.05)
+        status = StatusReader(os.path.join(folder, "status.bin")).snapshot() or {}
+        db.close()
+    finally:
+        stop_logger(proc)
+
+    return {
+        "devices": devices,
+        "registers": registers,
+        "interval": interval,
+        "expected_per_s": devices / interval,
+        "samples_per_s": rows / duration,
+        "latency_p50_ms": (percentile(latencies, 0.5) or 0) * 1000,
+        "latency_p95_ms": (percentile(latencies, 0.95) or 0) * 1000,
+        "latency_p99_ms": (percentile(latencies, 0.99) or 0) * 1000,
+        "cpu_percent": statistics.mean(cpu) if cpu else None,
+        "rss_mb": max(rss) / 1024 / 1024 if rss else None,
+        "overruns": status.get("overruns"),
+        "insert_errors": status.get("insert_errors")
+    }
+
+
+# --- Dashboard: retrieval, gap filling and charts ----------------------------
+
+def generate(path, rows, seed=1):
+    """SQLite table vfd with rows one-second samples of device 1, with some gaps.
+
+    The file is kept and reused by later runs with the same row count.
+    """
+    import numpy as np
+
+    backend = SQLiteBackend(path)
+    db = backend.connect()
+    try:
+        backend.create_table(db, "vfd", parse_registers(DefaultRegisters))
+        if db.execute("SELECT COUNT(*) FROM vfd").fetchone()[0] == rows:
+            return
+        db.execute("DELETE FROM vfd")
+
+        rng = np.random.default_rng(seed)
+        # About one 30 s outage per 10k samples, so gap filling has work to do
+        outages = np.zeros(rows, dtype="int64")
+        np.add.at(outages, rng.integers(0, rows, max(1, rows // 10000)), 30)
+        seconds = np.arange(rows, dtype="int64") + np.cumsum(outages)
+        names = ", ".join(["Device_ID", "Date_Time"] + BenchColumns)
+        query = f"INSERT INTO vfd ({names}) VALUES ({', '.join(['?'] * (len(BenchColumns) + 2))})"
+        chunk = 100000
+        for lo in range(0, rows, chunk):
+            n = min(chunk, rows - lo)
+            values = np.cumsum(rng.integers(-5, 6, (n, len(BenchColumns))), axis=0) % 1000
+            times = [(BenchStart + timedelta(seconds=int(s))).isoformat(" ", "milliseconds") for s in seconds[lo:lo + n]]
+            db.executemany(query, ((1, ts, *map(int, row)) for ts, row in zip(times, values)))
+            db.commit()
+            print(f"Generated {lo + n:,} of {rows:,} rows", end="\r")
+        print()
+    finally:
+        db.close()
+
+
+def run_dashboard(rows, folder, repeat=3, points=2000):
+    """Median seconds of the dashboard's data path on rows rows."""
+    from charts import combined_figure
+    from data_cache import BlockCache
+    from downsample import bucket_seconds, bucket_stats
+    from gaps import fill_window, find_gaps, sample_interval
+    from pool import ConnectionPool
+    import pandas as pd
+
+    path = os.path.join(folder, f"bench_{rows}.db")
+    generate(path, rows)
+    backend = SQLiteBackend(path)
+    pool = ConnectionPool(backend.connect, backend.is_alive, end_read=backend.end_read)
+    start, end = BenchStart, BenchStart + timedelta(days=3650)
+    results = {}
+
+    def retrieve():
+        return BlockCache().retrieve(("bench", rows), pool.connection, "vfd", 1, start, end)
+
+    results["retrieve_data"] = measure(retrieve, repeat)
+    df = retrieve()
+    cache = BlockCache()
+    cache.retrieve(("bench", rows), pool.connection, "vfd", 1, start, end)
+    results["retrieve_data (cached)"] = measure(
+        lambda: cache.retrieve(("bench", rows), pool.connection, "vfd", 1, start, end), repeat)
+
+    data = df[["Date_Time"] + BenchColumns]
+    interval = sample_interval(data["Date_Time"])
+    for strategy in ("nan", "interpolate"):
+        results[f"fill gaps ({strategy})"] = measure(
+            lambda: fill_window(data, find_gaps(data["Date_Time"], interval), strategy, interval), repeat)
+
+    def chart():
+        view_start, view_end = data["Date_Time"].iloc[0], data["Date_Time"].iloc[-1]
+        bucket = bucket_seconds(view_start, view_end, points)
+        plot_df = data if len(data) <= points else bucket_stats(data, "Date_Time", BenchColumns[:3], bucket)
+        step = interval if len(data) <= points else pd.Timedelta(seconds=bucket)
+        plot_df = fill_window(plot_df, find_gaps(plot_df["Date_Time"], step), "nan", step)
+        fig = combined_figure(plot_df, BenchColumns[:3], len(data) > points)
+        # Serialising is what st.plotly_chart spends most of its time on
+        return fig.to_json()
+
+    results["build chart"] = measure(chart, repeat)
+    pool.close()
+    return {name: statistics.median(times) for name, times in results.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Names of benchmarks more than tolerance slower than in baseline."""
+    slower = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before and seconds > before * (1 + tolerance):
+            slower.append(f"{name}: {before:.3f} s -> {seconds:.3f} s")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the logger and the dashboard's data path")
+    parser.add_argument("suite", choices=["acquisition", "dashboard"])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--registers", type=int, nargs="+", default=[10, 60])
+    parser.add_argument("--interval", type=float, nargs="+", default=[1.0, 0.1])
+    parser.add_argument("--transport", nargs="+", choices=["tcp", "rtu_tcp"], default=["tcp"],
+                        help="pipelined Modbus TCP, or RTU frames over TCP one request at a time")
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per acquisition run")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000, 10000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "vfd_bench"),
+                        help="folder for the generated databases, reused between runs")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier --save to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = {}
+    if args.suite == "acquisition":
+        for transport in args.transport:
+            for devices in args.devices:
+                for registers in args.registers:
+                    for interval in args.interval:
+                        run = run_acquisition(devices, registers, interval, args.duration, transport=transport)
+                        name = f"{devices} devices x {registers} registers @ {interval:g} s"
+                        if transport != "tcp":
+                            name += f" ({transport})"
+                        results[name] = run
+                        print(f"{name}: {run['samples_per_s']:.1f}/{run['expected_per_s']:.1f} samples/s, "
+                              f"latency p50 {run['latency_p50_ms']:.0f} ms p95 {run['latency_p95_ms']:.0f} ms "
+                              f"p99 {run['latency_p99_ms']:.0f} ms, CPU {run['cpu_percent']:.0f} %, "
+                              f"RSS {run['rss_mb']:.0f} MB, {run['overruns']} overruns")
+    else:
+        os.makedirs(args.data, exist_ok=True)
+        for rows in args.rows:
+            for name, seconds in run_dashboard(rows, args.data, args.repeat).items():
+                results[f"{name} @ {rows} rows"] = seconds
+                print(f"{name} @ {rows:,} rows: {seconds * 1000:.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if args.suite == "acquisition":
+            # Lower throughput is the regression here
+            slower = [f"{name}: {baseline[name]['samples_per_s']:.1f} -> {run['samples_per_s']:.1f} samples/s"
+                      for name, run in results.items()
+                      if name in baseline and run["samples_per_s"] < baseline[name]["samples_per_s"] * (1 - args.tolerance)]
+        else:
+            slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print("Regressions against the baseline:\n  " + "\n  ".join(slower))
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
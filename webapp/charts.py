@@ -0,0 +1,132 @@
+from collections import OrderedDict
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+Colors = px.colors.qualitative.Set1
+
+
+def time_values(plot_df):
+    """Date_Time as float milliseconds since 1970.
+
+    Plotly sends float arrays to the browser base64 encoded instead of as
+    JSON lists of date strings; the axes are set to type date so they still
+    show times.
+    """
+    return plot_df['Date_Time'].values.astype('datetime64[ms]').astype('int64').astype('float64')
+
+
+def column_values(plot_df, column):
+    return plot_df[column].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def add_series(fig, plot_df, column, color, bucketed, showlegend=True, x=None, **position):
+    """Line for column; downsampled data also gets a shaded min/max band.
+
+    WebGL traces with numpy arrays, so 100k points draw and transfer quickly.
+    x can be passed when several series share the same time_values().
+    """
+    if x is None:
+        x = time_values(plot_df)
+    if bucketed:
+        band = color.replace('rgb(', 'rgba(').replace(')', ',0.2)')
+        fig.add_trace(go.Scattergl(x=x, y=column_values(plot_df, f'{column}__max'), mode='lines', line=dict(width=0),
+                                   showlegend=False, hoverinfo='skip'), **position)
+        fig.add_trace(go.Scattergl(x=x, y=column_values(plot_df, f'{column}__min'), mode='lines', line=dict(width=0),
+                                   fill='tonexty', fillcolor=band, showlegend=False, hoverinfo='skip'), **position)
+    fig.add_trace(go.Scattergl(
+        x=x,
+        y=column_values(plot_df, column),
+        mode='lines',
+        name=column,
+        line=dict(width=2, color=color),
+        showlegend=showlegend,
+        hovertemplate=f'<b>{column}</b><br>Value: %{{y}}<br>Time: %{{x|%Y-%m-%d %H:%M:%S}}<extra></extra>'
+    ), **position)
+
+
+def line_figure(plot_df, column, color, bucketed):
+    fig = go.Figure()
+    add_series(fig, plot_df, column, color, bucketed)
+    fig.update_layout(
+        title=f"{column} Over Time",
+        xaxis_title="Time",
+        yaxis_title=column,
+        height=400,
+        hovermode='x unified',
+        showlegend=True
+    )
+    fig.update_xaxes(type='date')
+    return fig
+
+
+def combined_figure(plot_df, columns, bucketed):
+    fig = go.Figure()
+    x = time_values(plot_df)
+    for i, column in enumerate(columns):
+        add_series(fig, plot_df, column, Colors[i % len(Colors)], bucketed, x=x)
+    fig.update_layout(
+        title=f"Combined Plot: {', '.join(columns)}",
+        xaxis_title="Time",
+        yaxis_title="Values",
+        height=500,
+        hovermode='x unified',
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=1.01
+        )
+    )
+    fig.update_xaxes(type='date')
+    return fig
+
+
+def subplots_figure(plot_df, columns, bucketed):
+    fig = make_subplots(
+        rows=len(columns),
+        cols=1,
+        subplot_titles=columns,
+        shared_xaxes=True,
+        vertical_spacing=0.05,
+        specs=[[{"secondary_y": False}] for _ in columns]
+    )
+    x = time_values(plot_df)
+    for i, column in enumerate(columns):
+        add_series(fig, plot_df, column, Colors[i % len(Colors)], bucketed, showlegend=False, x=x, row=i+1, col=1)
+        fig.update_yaxes(title_text=column, row=i+1, col=1)
+    fig.update_layout(
+        height=300 * len(columns),
+        title_text="Individual Parameter Analysis",
+        showlegend=False
+    )
+    fig.update_xaxes(type='date')
+    # Only show x-axis title on bottom plot
+    fig.update_xaxes(title_text="Time", row=len(columns), col=1)
+    return fig
+
+
+class FigureCache:
+    """The last few figures (and plot data) of a session, built once per key.
+
+    Keys hold everything the figure depends on (data version, view window,
+    resolution, columns), so a rerun with the same inputs, e.g. after
+    switching views or toggling a column back on, reuses the built figure.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key, build):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = self.entries[key] = build()
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,235 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from storage import dialect_of
+
+
+def compact_dtypes(df):
+    """Downcast columns in place to the smallest dtype that holds their values.
+
+    Registers are 16 bit, so int64 columns usually shrink to (u)int16 or
+    smaller; unsigned is preferred when nothing is negative. Float columns
+    (scaled values, or integers with NULLs) are left as they are.
+    """
+    df['Date_Time'] = pd.to_datetime(df['Date_Time'])
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col]) and not df.empty:
+            downcast = 'unsigned' if df[col].min() >= 0 else 'integer'
+            df[col] = pd.to_numeric(df[col], downcast=downcast)
+    return df
+
+
+def fetch_rows(connection, table, where, params):
+    """Rows of table matching where, ordered by time, with compact dtypes."""
+    query = f"SELECT * FROM {table} WHERE {where} ORDER BY Date_Time ASC, ID ASC"
+    df = pd.read_sql(query, connection, params=params)
+    return compact_dtypes(df)
+
+
+def time_slice(df, start, end, time_column='Date_Time'):
+    """Rows with start <= time <= end of a time ordered frame, without a boolean mask copy."""
+    times = df[time_column]
+    lo = times.searchsorted(pd.Timestamp(start), side='left')
+    hi = times.searchsorted(pd.Timestamp(end), side='right')
+    return df.iloc[lo:hi]
+
+
+# Memory of the bookkeeping, counted against the budget with the rows (measured on CPython 3.11, pandas 2)
+BlockOverhead = 256  # cache entry, key and Block
+FrameOverhead = 2048  # DataFrame, its index and column blocks
+
+
+class Block:
+    """Rows of one device in the time block [start, start + block seconds).
+
+    df is None for a block without rows. max_id is the highest ID in the
+    table when the rows were read; rows written later, also late ones into
+    this block, have a higher ID.
+    """
+
+    __slots__ = ("df", "max_id", "bytes")
+
+    def __init__(self, df, max_id):
+        self.df = df
+        self.max_id = max_id
+        self.bytes = BlockOverhead
+        if df is not None:
+            self.bytes += FrameOverhead + int(df.memory_usage(index=True, deep=False).sum())
+
+
+class BlockCache:
+    """Process-wide cache of rows in fixed time blocks, shared by all sessions.
+
+    Rows are kept per key (server, database, table, device) in blocks of
+    block_seconds (hourly by default) with compact dtypes. A request is
+    assembled from the blocks it spans; missing blocks are fetched with one
+    query per run of adjacent missing blocks, so overlapping windows of
+    different operators are served from memory. Blocks without rows only
+    hold a marker. The least recently used blocks are dropped once the
+    cache, bookkeeping included, holds more than max_bytes.
+
+    Rows that arrive after a block was cached (new samples in the current
+    block, or late inserts such as spool replays) have a higher ID than
+    the table had when the block was read. Every request therefore runs
+    one query for them over its cached blocks, besides MAX(ID).
+
+    With several writers (one worker per bus) a transaction can commit
+    after one with a higher ID was already seen, so the same query also
+    re-reads the last reread_seconds before the newest cached row, and
+    rows already cached are skipped by ID. A lower-ID row that commits
+    later and is older than that, e.g. a spool replay still in progress
+    on another worker, is only seen once its blocks are read again.
+    """
+
+    def __init__(self, block_seconds=3600, max_bytes=512 * 1024 * 1024, reread_seconds=120):
+        self.block_seconds = int(block_seconds)
+        self.max_bytes = int(max_bytes)
+        self.reread_seconds = reread_seconds
+        self.blocks = OrderedDict()  # (key, block number) -> Block, least recently used first
+        self.columns = {}  # key -> empty frame with the table's columns, for ranges without rows
+        self.bytes = 0
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "fetches": 0, "evicted": 0}
+
+    def key_lock(self, key):
+        # One lock per key so sessions reading other devices are not held up
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def block_number(self, ts):
+        return int(pd.Timestamp(ts).value // 1_000_000_000 // self.block_seconds)
+
+    def block_start(self, number):
+        return pd.Timestamp(number * self.block_seconds, unit='s').to_pydatetime()
+
+    def block_numbers(self, df):
+        """Block number of every row of df."""
+        return df['Date_Time'].values.astype('datetime64[s]').astype('int64') // self.block_seconds
+
+    def _put(self, key, blocks):
+        """Store {block number: Block} and evict down to the budget."""
+        with self.lock:
+            for number, block in blocks.items():
+                old = self.blocks.pop((key, number), None)
+                if old is not None:
+                    self.bytes -= old.bytes
+                self.blocks[(key, number)] = block
+                self.bytes += block.bytes
+            # Keep the blocks just stored even if they alone are over budget
+            while self.bytes > self.max_bytes and len(self.blocks) > len(blocks):
+                _, evicted = self.blocks.popitem(last=False)
+                self.bytes -= evicted.bytes
+                self.stats["evicted"] += 1
+
+    def _split(self, df, first, last, max_id):
+        """Blocks first..last from their rows, fetched together and time ordered."""
+        blocks = {number: Block(None, max_id) for number in range(first, last + 1)}
+        if df.empty:
+            return blocks
+        numbers = self.block_numbers(df)
+        present, starts = np.unique(numbers, return_index=True)
+        ends = np.append(starts[1:], len(df))
+        for number, lo, hi in zip(present.tolist(), starts, ends):
+            # A copy, so an evicted block frees its rows even while a neighbour is cached
+            blocks[number] = Block(df.iloc[lo:hi].reset_index(drop=True).copy(), max_id)
+        return blocks
+
+    def retrieve(self, key, connect, table, device_id, start, end):
+        """Rows with start <= Date_Time <= end.
+
+        connect() gives a connection as a context manager, e.g.
+        ConnectionPool.connection.
+        """
+        numbers = range(self.block_number(start), self.block_number(end) + 1)
+        with self.key_lock(key):
+            # Blocks of this request; some may be evicted meanwhile if the range is over budget
+            with self.lock:
+                blocks = {}
+                for n in numbers:
+                    block = self.blocks.get((key, n))
+                    if block is not None:
+                        self.blocks.move_to_end((key, n))
+                        blocks[n] = block
+            cached = sorted(blocks)
+            missing = [n for n in numbers if n not in blocks]
+            self.stats["hits"] += len(cached)
+            self.stats["misses"] += len(missing)
+
+            with connect() as connection:
+                p = dialect_of(connection).placeholder
+                # Read first: whatever the queries below miss is written later and has a higher ID
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(f"SELECT MAX(ID) FROM {table}")
+                    max_id = cursor.fetchone()[0] or 0
+                finally:
+                    cursor.close()
+
+                # Runs of adjacent missing blocks, one query each
+                runs = []
+                for n in missing:
+                    if runs and runs[-1][1] == n - 1:
+                        runs[-1][1] = n
+                    else:
+                        runs.append([n, n])
+                fetched = {}
+                for first, last in runs:
+                    df = fetch_rows(connection, table, f"Device_ID = {p} AND Date_Time >= {p} AND Date_Time < {p}",
+                                    [device_id, self.block_start(first), self.block_start(last + 1)])
+                    self.stats["fetches"] += 1
+                    self.columns.setdefault(key, df.iloc[:0])
+                    fetched.update(self._split(df, first, last, max_id))
+
+                # New and late rows of the blocks that were already cached, and the trailing window
+                # where another writer's transaction may have committed after a higher ID
+                if cached:
+                    newest = max((blocks[n].df['Date_Time'].iloc[-1] for n in cached if blocks[n].df is not None),
+                                 default=pd.Timestamp(self.block_start(cached[-1] + 1)))
+                    df = fetch_rows(connection, table,
+                                    f"Device_ID = {p} AND Date_Time >= {p} AND Date_Time < {p} "
+                                    f"AND (ID > {p} OR Date_Time >= {p})",
+                                    [device_id, self.block_start(cached[0]), self.block_start(cached[-1] + 1),
+                                     min(blocks[n].max_id for n in cached),
+                                     (newest - pd.Timedelta(seconds=self.reread_seconds)).to_pydatetime()])
+                    if not df.empty:
+                        numbers_of = self.block_numbers(df)
+                        present, starts = np.unique(numbers_of, return_index=True)
+                        ends = np.append(starts[1:], len(df))
+                        for n, lo, hi in zip(present.tolist(), starts, ends):
+                            block = blocks.get(n)
+                            if block is None:
+                                continue  # fetched in full above
+                            rows = df.iloc[lo:hi]
+                            if block.df is not None:
+                                rows = rows[~np.isin(rows['ID'].to_numpy(), block.df['ID'].to_numpy())]
+                            if rows.empty:
+                                continue
+                            merged = rows if block.df is None else pd.concat([block.df, rows], ignore_index=True)
+                            # Late inserts can land anywhere in the block, keep it time ordered
+                            if not merged['Date_Time'].is_monotonic_increasing:
+                                merged = merged.sort_values(['Date_Time', 'ID'], kind='mergesort')
+                            fetched[n] = Block(merged.reset_index(drop=True), max_id)
+                    with self.lock:
+                        for n in cached:
+                            if n not in fetched:
+                                blocks[n].max_id = max(blocks[n].max_id, max_id)
+
+            self._put(key, fetched)
+            blocks.update(fetched)
+
+            parts = [blocks[n].df for n in numbers if blocks[n].df is not None]
+            if not parts:
+                return self.columns[key] if key in self.columns else pd.DataFrame(columns=['Date_Time'])
+            df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            return time_slice(df, start, end).reset_index(drop=True)
+
+    def status(self):
+        with self.lock:
+            return {"blocks": len(self.blocks), "bytes": self.bytes, "max_bytes": self.max_bytes, **self.stats}
+
+    def clear(self):
+        with self.lock:
+            self.blocks.clear()
+            self.bytes = 0
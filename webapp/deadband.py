@@ -0,0 +1,74 @@
+import math
+import time
+
+
+class DeadbandFilter:
+    """Report by exception: keeps a sample only when a value moved.
+
+    A device's sample is stored when any column differs from the last
+    stored row by more than its deadband (0 stores every change), when a
+    value appears or disappears, or when heartbeat seconds have passed
+    since the last stored row. Steady drives then write one row per
+    heartbeat instead of one per poll; readers hold each stored value until
+    the next row (see gaps.step_hold).
+
+    deadbands maps column -> absolute deadband in the column's (scaled)
+    units; columns without one use default.
+    """
+
+    def __init__(self, deadbands=None, default=0, heartbeat=60):
+        self.deadbands = dict(deadbands or {})
+        self.default = default
+        self.heartbeat = float(heartbeat)
+        self.stored = {}  # device ID -> (monotonic time, values) of the last stored sample
+        self.held = {}  # device ID -> (ts, values) of the last sample that was not stored
+
+    def changed(self, last, values):
+        for column, value in values.items():
+            previous = last.get(column)
+            if value is None or previous is None:
+                if value is not previous:
+                    return True
+                continue
+            if isinstance(value, float) and math.isnan(value):
+                if not (isinstance(previous, float) and math.isnan(previous)):
+                    return True
+                continue
+            if abs(value - previous) > self.deadbands.get(column, self.default):
+                return True
+        return False
+
+    def keep(self, device_id, ts, values, now=None):
+        """True if the sample of device_id at ts should be written."""
+        now = time.monotonic() if now is None else now
+        last = self.stored.get(device_id)
+        if last is None or now - last[0] >= self.heartbeat or self.changed(last[1], values):
+            self.stored[device_id] = (now, dict(values))
+            self.held.pop(device_id, None)
+            return True
+        self.held[device_id] = (ts, values)
+        return False
+
+    def pending(self):
+        """(device ID, ts, values) of the latest suppressed samples, to write on shutdown.
+
+        Without them a reader would hold the last stored values until the
+        heartbeat runs out instead of up to the moment logging stopped.
+        """
+        samples = [(device_id, ts, values) for device_id, (ts, values) in self.held.items()]
+        self.held.clear()
+        return samples
+
+
+def deadband_filter(cfg, registers):
+    """DeadbandFilter from the "deadband" section of the config, or None when it is off.
+
+        "deadband": {"enabled": true, "heartbeat": 60, "default": 0}
+
+    Registers can set their own "deadband" in the register map.
+    """
+    section = cfg.get("deadband", {})
+    if not section.get("enabled", False):
+        return None
+    deadbands = {reg["column"]: reg["deadband"] for reg in registers if reg.get("deadband") is not None}
+    return DeadbandFilter(deadbands, section.get("default", 0), section.get("heartbeat", 60))
@@ -0,0 +1,76 @@
+import math
+import pandas as pd
+from storage import MySQLBackend, dialect_of
+
+# Columns that are never plotted or aggregated
+KeyColumns = ['ID', 'Device_ID', 'Date_Time']
+
+
+def bucket_seconds(start, end, points):
+    """Bucket width in whole seconds so [start, end] fits in about points buckets."""
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    return max(1, math.ceil(span / max(1, points)))
+
+
+def bucket_stats(df, time_column, columns, bucket):
+    """Min, max and mean of each column per bucket of bucket seconds.
+
+    Returns one row per non-empty bucket with time_column set to the bucket
+    start, the mean in the column itself and the extremes in <col>__min and
+    <col>__max, so spikes stay visible after downsampling.
+    """
+    seconds = df[time_column].values.astype('datetime64[s]').astype('int64')
+    key = (seconds // bucket) * bucket
+    grouped = df[columns].groupby(key, sort=True)
+
+    means = grouped.mean()
+    mins = grouped.min().add_suffix('__min')
+    maxs = grouped.max().add_suffix('__max')
+    out = pd.concat([means, mins, maxs], axis=1)
+    out.index = pd.to_datetime(out.index, unit='s')
+    out.index.name = time_column
+    return out.reset_index()
+
+
+def downsample_query(table, columns, bucket, dialect=None):
+    """SQL that does the same bucketing as bucket_stats in the database."""
+    dialect = dialect or MySQLBackend()
+    q, p = dialect.quote, dialect.placeholder
+    parts = []
+    for col in columns:
+        parts += [f"AVG({q(col)}) AS {q(col)}", f"MIN({q(col)}) AS {q(col + '__min')}", f"MAX({q(col)}) AS {q(col + '__max')}"]
+    return f"""
+        SELECT {dialect.bucket_time('Date_Time', bucket)} AS Date_Time,
+               {', '.join(parts)}
+        FROM {table}
+        WHERE Device_ID = {p} AND Date_Time BETWEEN {p} AND {p}
+        GROUP BY {dialect.bucket_key('Date_Time', bucket)}
+        ORDER BY Date_Time ASC
+        """
+
+
+def fetch_downsampled(connection, table, device_id, start, end, columns, bucket):
+    """Bucketed min/max/mean rows computed by the database."""
+    query = downsample_query(table, columns, bucket, dialect_of(connection))
+    return read_buckets(connection, query, [device_id, start, end])
+
+
+def read_buckets(connection, query, params):
+    """Run a bucketing query and give the columns numeric dtypes."""
+    df = pd.read_sql(query, connection, params=params)
+    df['Date_Time'] = pd.to_datetime(df['Date_Time'])
+    # AVG comes back as DECIMAL objects, MIN/MAX as the column type
+    value_cols = [c for c in df.columns if c != 'Date_Time']
+    df[value_cols] = df[value_cols].apply(pd.to_numeric, downcast='float')
+    return df
+
+
+def value_columns(connection, table):
+    """Data columns of table, without the key columns."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        cursor.fetchall()
+        return [d[0] for d in cursor.description if d[0] not in KeyColumns]
+    finally:
+        cursor.close()
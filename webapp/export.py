@@ -0,0 +1,96 @@
+import gzip
+import pandas as pd
+
+# label: (file extension, mime type, needs pyarrow)
+ExportFormats = {
+    "CSV": ("csv", "text/csv", False),
+    "CSV (gzip)": ("csv.gz", "application/gzip", False),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", True),
+    "Arrow IPC": ("arrow", "application/vnd.apache.arrow.file", True)
+}
+
+
+def available_formats():
+    """Export formats usable here, Parquet and Arrow need pyarrow installed."""
+    try:
+        import pyarrow  # noqa: F401
+        return list(ExportFormats)
+    except ImportError:
+        return [label for label, (_, _, arrow) in ExportFormats.items() if not arrow]
+
+
+def arrow_schema(chunk):
+    """Fixed schema from the first chunk.
+
+    Integer columns are written as nullable int64 and everything else as
+    float64. A register that is NULL in some chunk comes back as float there,
+    which still fits the int64 column as nulls, so the schema never changes.
+    """
+    import pyarrow as pa
+    fields = []
+    for col in chunk.columns:
+        if col == 'Date_Time':
+            fields.append(pa.field(col, pa.timestamp('ms')))
+        elif pd.api.types.is_integer_dtype(chunk[col]):
+            fields.append(pa.field(col, pa.int64()))
+        else:
+            fields.append(pa.field(col, pa.float64()))
+    return pa.schema(fields)
+
+
+class ExportWriter:
+    """Write DataFrame chunks to one file as they arrive.
+
+    Only the current chunk is in memory; CSV and gzip CSV are appended as
+    text, Parquet gets one row group per chunk and Arrow IPC one record
+    batch per chunk.
+    """
+
+    def __init__(self, path, fmt="CSV"):
+        if fmt not in ExportFormats:
+            raise ValueError(f"Unknown export format: {fmt}")
+        if fmt not in available_formats():
+            raise ImportError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self.file = None
+        self.writer = None
+        self.schema = None
+        if fmt == "CSV":
+            self.file = open(path, "w", newline="", encoding="utf-8")
+        elif fmt == "CSV (gzip)":
+            self.file = gzip.open(path, "wt", newline="", encoding="utf-8")
+
+    def write(self, chunk):
+        if self.file is not None:
+            chunk.to_csv(self.file, header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.schema is None:
+                self.schema = arrow_schema(chunk)
+                if self.fmt == "Parquet":
+                    self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+                else:
+                    self.writer = pa.ipc.new_file(self.path, self.schema)
+            table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False, safe=False)
+            self.writer.write_table(table)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_file_name(table, device_id, start, end, fmt):
+    extension = ExportFormats[fmt][0]
+    return f"{table}_{device_id}_{start:%Y%m%d%H%M%S}_{end:%Y%m%d%H%M%S}.{extension}"
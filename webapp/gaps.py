@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+# How missing samples are shown, applied only to the rows being viewed
+FillStrategies = {
+    "NaN (break lines)": "nan",
+    "None (connect across gaps)": "none",
+    "Forward fill": "ffill",
+    "Interpolate": "interpolate",
+    "Zero": "zero"
+}
+
+
+def sample_interval(times):
+    """Typical spacing of the samples (median difference)."""
+    t = np.asarray(times, dtype='datetime64[ns]').astype('int64')
+    if len(t) < 2:
+        return pd.Timedelta(seconds=1)
+    return pd.Timedelta(int(np.median(np.diff(t))), unit='ns')
+
+
+def find_gaps(times, interval, tolerance=1.5):
+    """Gaps between consecutive samples longer than tolerance * interval.
+
+    Returns a DataFrame with one row per gap: start (last sample before the
+    gap), end (first sample after it), length and the number of missing
+    samples. Works on the timestamp array only, nothing is reindexed.
+    """
+    t = np.asarray(times, dtype='datetime64[ns]').astype('int64')
+    step = pd.Timedelta(interval).value
+    if len(t) < 2 or step <= 0:
+        return pd.DataFrame({'start': pd.Series(dtype='datetime64[ns]'),
+                             'end': pd.Series(dtype='datetime64[ns]'),
+                             'length': pd.Series(dtype='timedelta64[ns]'),
+                             'missing': pd.Series(dtype='int64')})
+
+    diffs = np.diff(t)
+    idx = np.flatnonzero(diffs > step * tolerance)
+    return pd.DataFrame({
+        'start': pd.to_datetime(t[idx]),
+        'end': pd.to_datetime(t[idx + 1]),
+        'length': pd.to_timedelta(diffs[idx]),
+        'missing': np.rint(diffs[idx] / step).astype('int64') - 1
+    })
+
+
+def fill_window(df, gaps, strategy, interval, time_column='Date_Time', max_rows=None):
+    """Apply a fill strategy to the gaps of df (already cut to the viewed window).
+
+    "none" returns df unchanged and "nan" inserts one empty row per gap,
+    which is enough to break plotted lines. The other strategies add rows
+    for the missing samples only and fill them with ffill, time
+    interpolation or zero; NULLs in the logged rows are left alone.
+
+    max_rows caps the added rows (the plot resolution): long gaps then get
+    evenly spaced points instead of one per interval, which draws the same
+    line. With more gaps than that allows, the gaps are only broken ("nan").
+    """
+    if strategy == "none" or gaps.empty:
+        return df
+
+    step = pd.Timedelta(interval)
+    if strategy != "nan" and max_rows is not None and 2 * len(gaps) > max_rows:
+        strategy = "nan"
+    if strategy == "nan":
+        missing_times = (gaps['start'] + step).values
+    else:
+        per_gap = None
+        if max_rows is not None and gaps['missing'].sum() > max_rows:
+            per_gap = max(2, max_rows // len(gaps))
+        parts = []
+        for start, end, missing in zip(gaps['start'], gaps['end'], gaps['missing']):
+            if per_gap is None or missing <= per_gap:
+                parts.append(pd.date_range(start + step, end - step / 2, freq=step).values)
+            else:
+                # First and last missing sample and evenly spaced ones between
+                parts.append(pd.date_range(start + step, end - step, periods=per_gap).values)
+        missing_times = np.concatenate(parts)
+
+    missing = pd.DataFrame({time_column: pd.to_datetime(missing_times), '__filled': True})
+    out = pd.concat([df, missing], ignore_index=True).sort_values(time_column, kind='mergesort', ignore_index=True)
+    filled = out.pop('__filled').fillna(False).to_numpy(dtype=bool)
+    value_columns = [c for c in out.columns if c != time_column]
+
+    if strategy == "ffill":
+        values = out[value_columns].ffill()
+    elif strategy == "interpolate":
+        values = out.set_index(time_column)[value_columns].interpolate(method='time', limit_area='inside')
+        values.index = out.index
+    elif strategy == "zero":
+        values = out[value_columns].fillna(0)
+    else:
+        return out
+    # Only the added rows take the filled values
+    out.loc[filled, value_columns] = values.loc[filled, value_columns]
+    return out
+
+
+def step_hold(df, interval, max_hold, start=None, end=None, time_column='Date_Time'):
+    """Regular series from rows stored by exception (see deadband.py).
+
+    Each stored row holds its values until the next one. The result has a
+    row per multiple of interval from start to end (default: the first and
+    last row), carrying the last stored values at or before it. Points
+    more than max_hold after the last stored row are left out, so logger
+    outages stay gaps; max_hold is normally a bit over the heartbeat.
+    """
+    t = np.asarray(df[time_column], dtype='datetime64[ns]').astype('int64')
+    step = pd.Timedelta(interval).value
+    if len(t) == 0 or step <= 0:
+        return df
+    first = pd.Timestamp(start).value if start is not None else t[0]
+    last = pd.Timestamp(end).value if end is not None else t[-1]
+    grid = np.arange(-(-first // step) * step, last + 1, step, dtype='int64')
+    idx = np.searchsorted(t, grid, side='right') - 1
+    held = (idx >= 0) & (grid - t[np.maximum(idx, 0)] <= pd.Timedelta(max_hold).value)
+    out = df.iloc[idx[held]].reset_index(drop=True)
+    out[time_column] = pd.to_datetime(grid[held])
+    return out
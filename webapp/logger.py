@@ -1,19 +1,126 @@
+import argparse
 import json
+import os
+import queue
+import signal
 import time
-from datetime import datetime
-import mysql.connector
-from pymodbus.client import ModbusSerialClient
-StatusPath = r"C:\Users\ADMIN\Desktop\IASYS\status.json"
+from acquisition import AcquisitionEngine, device_columns, load_devices
+from deadband import deadband_filter
+from write_buffer import WriteBuffer
+from spool import Spool
+from rollup import Rollup, RollupLevels
+from storage import open_backend, storage_config
+from ring_buffer import RingWriter
+from status_channel import StatusWriter
+from metrics import Registry, serve
+StatusPath = r"C:\Users\ADMIN\Desktop\IASYS\status.bin"
 ConfigPath = r"C:\Users\ADMIN\Desktop\IASYS\config.json"
+SpoolPath = r"C:\Users\ADMIN\Desktop\IASYS\spool"
+LivePath = r"C:\Users\ADMIN\Desktop\IASYS\live.ring"
+StopPath = r"C:\Users\ADMIN\Desktop\IASYS\stop.flag"  # created to ask the logger to stop, see supervisor.py
+StopCheckInterval = 0.5  # seconds between checks for the stop file
+MaintenanceInterval = 24 * 3600  # partition maintenance once a day
+
+def insert_query(columns, backend):
+    """INSERT statement for the mapped columns."""
+    names = ", ".join(["Device_ID", "Date_Time"] + columns)
+    placeholders = ", ".join([backend.placeholder] * (len(columns) + 2))
+    return f"INSERT INTO vfd ({names}) VALUES ({placeholders})"
+
+def worker_path(path, bus):
+    """Path of a file of the worker logging bus, e.g. status.rs485_1.bin (see supervisor.py)."""
+    if not bus:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{bus}{ext}"
+
+Status = None  # StatusWriter, opened on first use
+
+def status_channel():
+    global Status
+    if Status is None:
+        Status = StatusWriter(StatusPath)
+    return Status
+
 def update_status(status: dict):
-    """Write status to status.json for Streamlit to read."""
+    """Publish status on the shared status channel for Streamlit to read."""
     try:
-        with open(StatusPath, "w") as f:
-            json.dump(status, f, indent=2)
+        status_channel().publish(**status)
     except Exception as e:
         print(f"Error writing status: {e}")
 
-def main():
+def record_write(buffer, written=0, failed=False):
+    """Count a flush (or a failed one) on the status channel."""
+    channel = status_channel()
+    if failed:
+        channel.incr("insert_errors")
+    elif written:
+        channel.incr("rows_written", written)
+        channel.set(last_write=time.time())
+        Registry.incr("db_rows_written_total", written)
+    spooled = buffer.spool.size() if buffer.spool else 0
+    channel.set(spooled_bytes=spooled)
+    Registry.set("spool_bytes", spooled)
+
+def sample_row(columns, device, ts, values):
+    """Row for insert_query(columns) from one device sample."""
+    return (device["id"], ts) + tuple(values.get(column) for column in columns)
+
+def schedule_summary(engine):
+    """Overrun counters and read cycle latency over all polling schedules."""
+    stats = list(engine.schedule_stats().values())
+    cycles = sum(s["cycles"] for s in stats)
+    return {
+        "overruns": sum(s["overruns"] for s in stats),
+        "missed_deadlines": sum(s["missed_deadlines"] for s in stats),
+        "cycle_last_ms": max((s["cycle_last_ms"] for s in stats), default=0.0),
+        "cycle_avg_ms": sum(s["cycle_avg_ms"] * s["cycles"] for s in stats) / cycles if cycles else 0.0,
+        "cycle_max_ms": max((s["cycle_max_ms"] for s in stats), default=0.0)
+    }
+
+def log_sample(buffer, engine, columns, device, ts, values):
+    """Queue one sample for the database, the buffer writes a batch once it is due."""
+    status_channel().incr("samples")
+    status_channel().set(last_sample=ts)
+    summary = schedule_summary(engine)
+    Registry.set("acquisition_overruns", summary["overruns"])
+    Registry.set("acquisition_missed_deadlines", summary["missed_deadlines"])
+    try:
+        written = buffer.add(sample_row(columns, device, ts, values))
+        Registry.set("buffer_pending_rows", len(buffer))
+        if written:
+            record_write(buffer, written)
+            print(f"Logged {written} rows, last at {ts}")
+            update_status({"running": True, "message": f"Last update: {ts}", **summary})
+        else:
+            # Publishing is a memory write, so every sample can refresh the counters
+            update_status(summary)
+
+    except Exception as e:
+        record_write(buffer, failed=True)
+        update_status({"running": True, "error": f"Database insert error, spooling to disk: {e}"})
+        print(f"Database insert error, spooled to disk: {e}")
+
+def run_maintenance(backend, db, cfg):
+    """Backend housekeeping, e.g. adding upcoming monthly partitions and dropping expired ones on MySQL."""
+    try:
+        backend.maintain(db, "vfd", cfg)
+    except Exception as e:
+        print(f"Maintenance error: {e}")
+
+def main(bus=None, metrics_port=None, maintenance=True):
+    """Log every bus of the config, or only bus when run as a supervisor worker."""
+    global StatusPath
+    StatusPath = worker_path(StatusPath, bus)
+    # Works without a console, e.g. under a detached supervisor on Windows where CTRL_BREAK cannot be sent
+    stop_path = worker_path(StopPath, bus)
+    if os.path.exists(stop_path):
+        os.remove(stop_path)
+    # The dashboard stops the logger with an interrupt, shut down cleanly on it
+    if hasattr(signal, "SIGBREAK"):
+        signal.signal(signal.SIGBREAK, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
     # Load config
     try:
         with open(ConfigPath, "r") as f:
@@ -23,113 +130,222 @@ def main():
         print(f"Config error: {e}")
         return
 
-    # Modbus connection
-    modbus = None
+    # Modbus buses and the devices polled on them
     try:
-        modbus = ModbusSerialClient(
-            port=cfg["modbus"]["port"],
-            baudrate=cfg["modbus"]["baudrate"],
-            stopbits=cfg["modbus"]["stopbits"],
-            parity=cfg["modbus"]["parity"],
-            bytesize=cfg["modbus"]["bytesize"],
-            timeout=1
-        )
-        
-        if not modbus.connect():
-            update_status({"running": False, "error": "Modbus connection failed"})
-            print("Modbus connection failed")
-            return
-        else:
-            print("Modbus connection successful")
-            
+        buses, devices = load_devices(cfg)
+        # Every worker writes rows with all columns, the table is shared
+        columns = device_columns(devices)
+        registers = {reg["column"]: reg for device in devices for reg in device["registers"]}
+        if bus:
+            if bus not in buses:
+                raise ValueError(f"Unknown bus '{bus}'")
+            buses = {bus: buses[bus]}
+            devices = [device for device in devices if device["bus"] == bus]
+        reads = sum(len(group["blocks"]) for device in devices for group in device["groups"])
+        print(f"{len(devices)} devices on {len(buses)} buses, {len(columns)} columns in {reads} block reads")
     except Exception as e:
-        update_status({"running": False, "error": f"Modbus error: {e}"})
-        print(f"Modbus error: {e}")
+        update_status({"running": False, "error": f"Modbus config error: {e}"})
+        print(f"Modbus config error: {e}")
         return
 
-    # SQL connection
+    # Database connection (MySQL, or a local SQLite file)
     db = None
-    cursor = None
     try:
-        db = mysql.connector.connect(
-            host=cfg["mysql"]["host"],
-            user=cfg["mysql"]["user"],
-            password=cfg["mysql"]["password"],
-            database=cfg["mysql"]["database"]
+        backend = open_backend(storage_config(cfg))
+        db = backend.connect()
+        backend.create_table(db, "vfd", list(registers.values()))
+        print(f"{backend.name} connection successful")
+
+    except Exception as e:
+        update_status({"running": False, "error": f"Database error: {e}"})
+        print(f"Database error: {e}")
+        if db:
+            db.close()
+        return
+
+    # Local spool keeps rows while the database is unavailable
+    spool_cfg = cfg.get("spool", {})
+    try:
+        spool = Spool(
+            os.path.join(spool_cfg.get("path", SpoolPath), bus) if bus else spool_cfg.get("path", SpoolPath),
+            max_bytes=spool_cfg.get("max_mb", 256) * 1024 * 1024,
+            segment_bytes=spool_cfg.get("segment_kb", 1024) * 1024,
+            fsync=spool_cfg.get("fsync", "always"),
+            fsync_interval=spool_cfg.get("fsync_interval", 1)
         )
-        cursor = db.cursor()
-        print("MySQL connection successful")
-        
+        if spool.pending():
+            print(f"Spool holds {spool.size()} bytes from a previous run, replaying with the next batch")
     except Exception as e:
-        update_status({"running": False, "error": f"MySQL error: {e}"})
-        print(f"MySQL error: {e}")
-        if modbus:
-            modbus.close()
+        update_status({"running": False, "error": f"Spool error: {e}"})
+        print(f"Spool error: {e}")
+        db.close()
         return
 
-    update_status({"running": True, "message": "Logger started"})
+    # 1 min / 1 h aggregates kept next to the raw rows
+    rollup = None
+    levels = cfg.get("rollups", list(RollupLevels))
+    if levels:
+        try:
+            rollup = Rollup("vfd", columns, levels, backend)
+            cursor = db.cursor()
+            rollup.create(cursor)
+            cursor.close()
+        except Exception as e:
+            update_status({"running": False, "error": f"Rollup table error: {e}"})
+            print(f"Rollup table error: {e}")
+            spool.close()
+            db.close()
+            return
+
+    # Report by exception: only samples that moved past a deadband, plus a heartbeat row
+    deadband = deadband_filter(cfg, list(registers.values()))
+    if deadband:
+        print(f"Storing by exception, heartbeat every {deadband.heartbeat:g} s")
+
+    query = insert_query(columns, backend)
+    buffer_cfg = cfg.get("buffer", {})
+    buffer = WriteBuffer(
+        lambda rows: backend.write(db, query, rows, rollup),
+        max_rows=buffer_cfg.get("max_rows", 50),
+        max_age=buffer_cfg.get("max_age", 5),
+        spool=spool
+    )
+
+    # Latest samples in shared memory for the dashboard's live tail
+    live_cfg = cfg.get("live", {})
+    ring = None
+    try:
+        ring = RingWriter(worker_path(live_cfg.get("path", LivePath), bus), columns, live_cfg.get("capacity", 36000))
+    except Exception as e:
+        print(f"Live tail disabled: {e}")
+
+    # The engine polls in its own thread, database writes stay on this one
+    events = queue.Queue()
+    engine = AcquisitionEngine(
+        buses, devices,
+        on_sample=lambda device, ts, values: events.put(("sample", device, ts, values)),
+        on_error=lambda device, message: events.put(("error", device, message))
+    )
+    engine.start()
+
+    # Prometheus text endpoint for the dashboard's metrics panel (or any scraper)
+    metrics_cfg = cfg.get("metrics", {})
+    server = None
+    if metrics_cfg.get("enabled", True):
+        port = metrics_port or metrics_cfg.get("port", 9108)
+        try:
+            server = serve(Registry, port, metrics_cfg.get("host", "127.0.0.1"))
+            print(f"Metrics on http://{metrics_cfg.get('host', '127.0.0.1')}:{port}/metrics")
+        except Exception as e:
+            print(f"Metrics endpoint disabled: {e}")
+
+    # With several workers only one of them runs the table housekeeping
+    if maintenance:
+        run_maintenance(backend, db, cfg)
+    last_maintenance = time.monotonic()
+    last_stop_check = 0.0
+
+    update_status({"running": True, "message": f"Logger started, polling {len(devices)} devices"})
     print("Logger started successfully")
 
     try:
         while True:
-            # Read holding registers starting at address 0
+            # Age-based flush so rows are not held back while reads are failing
             try:
-                rr = modbus.read_holding_registers(address=0, count=10)
-
-                if rr.isError() or rr is None:
-                    update_status({"running": True, "warning": "Modbus read error"})
-                    print("Modbus read error")
-                    time.sleep(1)
-                    continue
-                
-                # Check if we got enough registers
-                if len(rr.registers) < 10:
-                    update_status({"running": True, "warning": f"Only got {len(rr.registers)} registers, expected 10"})
-                    print(f"Only got {len(rr.registers)} registers, expected 10")
-                    time.sleep(1)
-                    continue
-
-                values = rr.registers
-                ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                # Insert into DB
-                try:
-                    cursor.execute(
-                        "INSERT INTO vfd (Date_Time, Control_Word, Status_Word, Reference_1, Reference_2, Speed, Torque, Voltage, Current_i, Power, Error_code) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                        (ts, values[0], values[1], values[2], values[3], values[4], values[5], values[6], values[7], values[8], values[9])
-                    )
-                    db.commit()
-                    print(f"Data logged successfully at {ts}")
-                    update_status({"running": True, "message": f"Last update: {ts}"})
-                    
-                except Exception as e:
-                    update_status({"running": True, "error": f"MySQL insert error: {e}"})
-                    print(f"MySQL insert error: {e}")
-
+                if buffer.due():
+                    written = buffer.flush()
+                    record_write(buffer, written)
+                    print(f"Logged {written} rows")
             except Exception as e:
-                update_status({"running": True, "error": f"Read cycle error: {e}"})
-                print(f"Read cycle error: {e}")
+                record_write(buffer, failed=True)
+                update_status({"running": True, "error": f"Database insert error, spooling to disk: {e}"})
+                print(f"Database insert error, spooled to disk: {e}")
+
+            if time.monotonic() - last_stop_check >= StopCheckInterval:
+                last_stop_check = time.monotonic()
+                if os.path.exists(stop_path):
+                    update_status({"running": False, "message": "Logger stopped by the supervisor"})
+                    print("Stop requested, shutting down")
+                    break
+
+            if maintenance and time.monotonic() - last_maintenance >= MaintenanceInterval:
+                run_maintenance(backend, db, cfg)
+                last_maintenance = time.monotonic()
+
+            try:
+                event = events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if event[0] == "error":
+                _, device, message = event
+                status_channel().incr("device_errors")
+                update_status({"running": True, "warning": f"Device {device['id']}: {message}"})
+                print(f"Device {device['id']}: {message}")
+                continue
 
-            time.sleep(1)  # 1 second logging interval
+            _, device, ts, values = event
+            Registry.set("event_queue_depth", events.qsize())
+            if ring:
+                ring.append(device["id"], ts, [values.get(column) for column in columns])
+            if deadband and not deadband.keep(device["id"], ts, values):
+                status_channel().incr("samples_suppressed")
+                Registry.incr("samples_suppressed_total")
+                continue
+            log_sample(buffer, engine, columns, device, ts, values)
 
     except KeyboardInterrupt:
         update_status({"running": False, "message": "Logger stopped by user"})
         print("Logger stopped by user")
-        
+
     except Exception as e:
         update_status({"running": False, "error": f"Unexpected error: {e}"})
         print(f"Unexpected error: {e}")
-        
+
     finally:
-        # Clean up connections
-        if modbus:
-            modbus.close()
-            print("Modbus connection closed")
-        if cursor:
-            cursor.close()
+        # Stop polling (this also closes the Modbus connections)
+        engine.stop()
+        print("Modbus connections closed")
+
+        # Keep samples that were read but not yet queued
+        remaining = []
+        while not events.empty():
+            event = events.get()
+            if event[0] == "sample":
+                _, device, ts, values = event
+                if deadband is None or deadband.keep(device["id"], ts, values):
+                    remaining.append(sample_row(columns, device, ts, values))
+        # The last values held back by the deadband mark where the held series end
+        if deadband:
+            for device_id, ts, values in deadband.pending():
+                remaining.append(sample_row(columns, {"id": device_id}, ts, values))
+        buffer.extend(remaining)
+
+        # Write whatever is still buffered before closing the connections
+        try:
+            written = buffer.flush()
+            record_write(buffer, written)
+            if written:
+                print(f"Flushed {written} buffered rows")
+        except Exception as e:
+            record_write(buffer, failed=True)
+            print(f"Database insert error on shutdown, rows kept in spool: {e}")
+        spool.close()
+        if ring:
+            ring.close()
+        update_status({"running": False})
+        status_channel().close()
+        if server:
+            server.shutdown()
+
         if db:
             db.close()
-            print("MySQL connection closed")
+            print("Database connection closed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Poll the Modbus devices of config.json into the database")
+    parser.add_argument("--bus", help="only poll the devices on this bus (one worker per bus, see supervisor.py)")
+    parser.add_argument("--metrics-port", type=int, help="serve metrics on this port instead of the configured one")
+    parser.add_argument("--no-maintenance", action="store_true", help="leave partition maintenance to another worker")
+    args = parser.parse_args()
+    main(args.bus, args.metrics_port, not args.no_maintenance)
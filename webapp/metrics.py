@@ -0,0 +1,211 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from a fast TCP read to a serial timeout
+DefaultBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Every metric the logger reports: name -> (type, help)
+MetricHelp = {
+    "modbus_request_seconds": ("histogram", "Modbus block read round trip"),
+    "modbus_lock_wait_seconds": ("histogram", "Time a read cycle waited for its bus"),
+    "modbus_errors_total": ("counter", "Failed Modbus reads by kind (timeout, exception, io, short, connect)"),
+    "modbus_reconnects_total": ("counter", "Bus connection attempts after the link dropped"),
+    "acquisition_cycle_seconds": ("histogram", "Read cycle of one register group, lock wait included"),
+    "acquisition_overruns": ("gauge", "Read cycles that ran past their deadline"),
+    "acquisition_missed_deadlines": ("gauge", "Ticks skipped because of overruns"),
+    "event_queue_depth": ("gauge", "Samples read but not yet queued for the database"),
+    "samples_suppressed_total": ("counter", "Samples not stored because no value left its deadband"),
+    "db_insert_seconds": ("histogram", "Batch INSERT of the raw rows"),
+    "db_rollup_seconds": ("histogram", "Rollup upserts of a batch"),
+    "db_commit_seconds": ("histogram", "Commit of a batch"),
+    "db_write_errors_total": ("counter", "Batches that failed to write"),
+    "db_rows_written_total": ("counter", "Rows written to the database"),
+    "buffer_pending_rows": ("gauge", "Rows waiting in the write buffer"),
+    "spool_bytes": ("gauge", "Rows spooled to disk while the database was unreachable")
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, as Prometheus histograms."""
+
+    def __init__(self, buckets=DefaultBuckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters, gauges and histograms of the logger, by name and labels.
+
+    Updates are a dict lookup and an add under a lock, cheap enough for
+    every Modbus request. render() returns the Prometheus text format.
+    """
+
+    def __init__(self, buckets=DefaultBuckets):
+        self.buckets = buckets
+        self.values = {}  # (name, labels) -> number or Histogram
+        self.lock = threading.Lock()
+
+    def _key(self, name, labels):
+        if name not in MetricHelp:
+            raise KeyError(f"Unknown metric '{name}'")
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def incr(self, name, count=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + count
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """with metrics.timer("db_commit_seconds"): ... observes the time taken, also on errors."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items(), key=lambda item: item[0])
+            items = [(key, value if not isinstance(value, Histogram) else
+                      (value.buckets, list(value.counts), value.sum, value.count)) for key, value in items]
+
+        lines = []
+        described = set()
+        for (name, labels), value in items:
+            kind, text = MetricHelp[name]
+            if name not in described:
+                lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+                described.add(name)
+            if kind != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            buckets, counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + [math.inf], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# The logger's metrics, shared by the acquisition engine, the backend and the main loop
+Registry = Metrics()
+
+
+def serve(metrics, port=9108, host="127.0.0.1"):
+    """Serve metrics.render() on http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scraped every few seconds, keep the logger output readable
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def parse_metrics(text):
+    """{name: [(labels dict, value), ...]} from the Prometheus text format."""
+    parsed = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        labels = {}
+        if "{" in series:
+            series, rest = series.split("{", 1)
+            for pair in rest.rstrip("}").split(","):
+                k, v = pair.split("=", 1)
+                labels[k] = v.strip('"')
+        parsed.setdefault(series, []).append((labels, float(value)))
+    return parsed
+
+
+def histogram_quantile(q, buckets):
+    """Estimated q quantile from [(upper bound, cumulative count), ...], like PromQL's.
+
+    Linear within the bucket; values in the +Inf bucket are reported as
+    the highest finite bound.
+    """
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == math.inf:
+                return lower
+            if cumulative == below:
+                return bound
+            return lower + (bound - lower) * (rank - below) / (cumulative - below)
+        lower, below = bound, cumulative
+    return lower
+
+
+def histogram_summary(parsed, name):
+    """Count, mean and p50/p95/p99 per label set of a histogram in parse_metrics() output."""
+    series = {}
+    for labels, value in parsed.get(name + "_bucket", []):
+        # A copy: parsed is shared by every histogram_summary call on the scrape
+        labels = dict(labels)
+        le = labels.pop("le")
+        key = tuple(sorted(labels.items()))
+        series.setdefault(key, []).append((math.inf if le == "+Inf" else float(le), value))
+    totals = {tuple(sorted(l.items())): v for l, v in parsed.get(name + "_sum", [])}
+    counts = {tuple(sorted(l.items())): v for l, v in parsed.get(name + "_count", [])}
+
+    rows = []
+    for key, buckets in series.items():
+        count = counts.get(key, 0)
+        row = {**dict(key), "count": int(count), "mean_ms": totals.get(key, 0) / count * 1000 if count else None}
+        for q in (0.5, 0.95, 0.99):
+            value = histogram_quantile(q, buckets)
+            row[f"p{int(q * 100)}_ms"] = None if value is None else value * 1000
+        rows.append(row)
+    return rows
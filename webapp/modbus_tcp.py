@@ -0,0 +1,140 @@
+import asyncio
+import struct
+from pymodbus.exceptions import ModbusException
+
+# Function codes of the reads the logger uses
+ReadHolding = 3
+ReadInput = 4
+
+
+class RegistersResponse:
+    """Reply to a register read, shaped like pymodbus' (registers, isError())."""
+
+    def __init__(self, function_code, registers=(), exception_code=None):
+        self.function_code = function_code
+        self.registers = list(registers)
+        self.exception_code = exception_code
+
+    def isError(self):
+        return self.exception_code is not None
+
+    def __repr__(self):
+        if self.isError():
+            return f"RegistersResponse(function {self.function_code}, exception {self.exception_code})"
+        return f"RegistersResponse(function {self.function_code}, {len(self.registers)} registers)"
+
+
+class PipelinedTcpClient:
+    """Modbus TCP client with several requests in flight on one connection.
+
+    Every request gets its own transaction ID in the MBAP header and
+    replies are matched by it, so a read does not wait for the previous
+    one to come back: gateways with many drives behind them queue the
+    requests and the network round trip is paid once per batch instead of
+    once per read. At most max_in_flight requests are outstanding; most
+    gateways accept 4 to 16.
+
+    Reads have the same signature as pymodbus' async client. Requests fail
+    with ConnectionError when the connection drops; the caller reconnects.
+    Replies from the wrong unit or with the wrong function code, byte count
+    or length raise ModbusException.
+    """
+
+    def __init__(self, host, port=502, timeout=1, max_in_flight=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+        self.pending = {}  # transaction ID -> future of the reply
+        self.next_id = 0
+        self.slots = None
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        self.close()
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Modbus TCP connect to {self.host}:{self.port} failed: {e}")
+            self.reader = self.writer = None
+            return False
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.receiver = asyncio.create_task(self._receive(self.reader))
+        return True
+
+    async def _receive(self, reader):
+        """Hand each reply to the request with its transaction ID."""
+        error = ConnectionError(f"Connection to {self.host}:{self.port} closed")
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction, protocol, length, unit = struct.unpack(">HHHB", header)
+                if length < 2 or length > 254:
+                    # Not an MBAP header, the stream is out of step and cannot be resynchronised
+                    error = ConnectionError(f"Garbled reply from {self.host}:{self.port} (length {length})")
+                    break
+                body = await reader.readexactly(length - 1)
+                future = self.pending.get(transaction)
+                # Replies to requests that timed out have no future any more
+                if protocol == 0 and future is not None and not future.done():
+                    future.set_result((unit, body))
+        except (asyncio.IncompleteReadError, OSError) as e:
+            error = ConnectionError(f"Connection to {self.host}:{self.port} lost: {e}")
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            if self.writer is not None and self.reader is reader:
+                self.writer.close()
+
+    async def request(self, unit, pdu):
+        """Send one PDU to unit and return the reply PDU."""
+        if not self.connected:
+            raise ConnectionError(f"Not connected to {self.host}:{self.port}")
+        async with self.slots:
+            self.next_id = (self.next_id + 1) % 65536
+            transaction = self.next_id
+            future = asyncio.get_running_loop().create_future()
+            self.pending[transaction] = future
+            try:
+                self.writer.write(struct.pack(">HHHB", transaction, 0, len(pdu) + 1, unit) + pdu)
+                await self.writer.drain()
+                reply_unit, body = await future
+                if reply_unit != unit:
+                    raise ModbusException(f"Reply from unit {reply_unit} to a request to unit {unit}")
+                return body
+            finally:
+                self.pending.pop(transaction, None)
+
+    async def read_registers(self, function_code, address, count, unit):
+        reply = await self.request(unit, struct.pack(">BHH", function_code, address, count))
+        if reply[0] == function_code | 0x80:
+            if len(reply) != 2:
+                raise ModbusException(f"Exception reply of {len(reply)} bytes to function {function_code}")
+            return RegistersResponse(function_code, exception_code=reply[1])
+        if reply[0] != function_code:
+            raise ModbusException(f"Reply with function {reply[0]} to function {function_code}")
+        if len(reply) < 2 or reply[1] != 2 * count or len(reply) != 2 + reply[1]:
+            raise ModbusException(f"Reply of {len(reply)} bytes to a read of {count} registers")
+        return RegistersResponse(function_code, struct.unpack(f">{count}H", reply[2:]))
+
+    async def read_holding_registers(self, address, count=1, slave=1):
+        return await self.read_registers(ReadHolding, address, count, slave)
+
+    async def read_input_registers(self, address, count=1, slave=1):
+        return await self.read_registers(ReadInput, address, count, slave)
+
+    def close(self):
+        if self.receiver is not None:
+            self.receiver.cancel()
+            self.receiver = None
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
@@ -0,0 +1,179 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from storage import dialect_of
+
+
+class Moments:
+    """Count, mean, central moments 2 to 4, min, max and nulls of many columns at once.
+
+    Built from a frame or chunk with whole-array numpy operations (no
+    per-column loops), and mergeable: two partial results combine exactly
+    with the pairwise formulas of Chan and Pébay, so chunks, days or rollup
+    buckets can be summed up without going back to the rows. Moments that
+    a source cannot provide (rollups have no squares) are NaN and stay NaN
+    through merges.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.rows = 0
+        self.n = np.zeros(k)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.m3 = np.zeros(k)
+        self.m4 = np.zeros(k)
+        self.min = np.full(k, np.nan)
+        self.max = np.full(k, np.nan)
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        """Moments of the columns of df."""
+        moments = cls(columns)
+        values = df[moments.columns].to_numpy(dtype='float64', na_value=np.nan)
+        moments.rows = len(values)
+        if not len(values):
+            return moments
+        valid = ~np.isnan(values)
+        n = valid.sum(axis=0).astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(values, axis=0) / n
+            d = np.where(valid, values - mean, 0.0)
+            d2 = d * d
+            moments.m2 = d2.sum(axis=0)
+            moments.m3 = (d2 * d).sum(axis=0)
+            moments.m4 = (d2 * d2).sum(axis=0)
+        moments.n = n
+        moments.mean = np.where(n > 0, mean, 0.0)
+        has = n > 0
+        moments.min[has] = np.nanmin(values[:, has], axis=0)
+        moments.max[has] = np.nanmax(values[:, has], axis=0)
+        return moments
+
+    @classmethod
+    def from_sums(cls, columns, count, total, minimum, maximum, rows=None):
+        """Partial moments from pre-aggregated count, sum, min and max per column, e.g. rollup rows.
+
+        Count, mean, min and max are exact; the higher moments are unknown (NaN).
+        """
+        moments = cls(columns)
+        moments.n = np.asarray(count, dtype='float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            moments.mean = np.where(moments.n > 0, np.asarray(total, dtype='float64') / moments.n, 0.0)
+        moments.m2 = np.full(len(moments.columns), np.nan)
+        moments.m3 = np.full(len(moments.columns), np.nan)
+        moments.m4 = np.full(len(moments.columns), np.nan)
+        moments.min = np.asarray(minimum, dtype='float64')
+        moments.max = np.asarray(maximum, dtype='float64')
+        moments.rows = int(moments.n.max()) if rows is None and len(moments.n) else (rows or 0)
+        return moments
+
+    def merge(self, other):
+        """Combine with the moments of other rows of the same columns, in place."""
+        if other.columns != self.columns:
+            raise ValueError("Can only merge moments of the same columns")
+        na, nb = self.n, other.n
+        n = na + nb
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            ab = na * nb
+            mean = np.where(n > 0, self.mean + delta * nb / n, 0.0)
+            m2 = self.m2 + other.m2 + delta ** 2 * ab / n
+            m3 = (self.m3 + other.m3 + delta ** 3 * ab * (na - nb) / n ** 2
+                  + 3 * delta * (na * other.m2 - nb * self.m2) / n)
+            m4 = (self.m4 + other.m4 + delta ** 4 * ab * (na * na - ab + nb * nb) / n ** 3
+                  + 6 * delta ** 2 * (na * na * other.m2 + nb * nb * self.m2) / n ** 2
+                  + 4 * delta * (na * other.m3 - nb * self.m3) / n)
+        # An empty side adds nothing, also when its moments are unknown
+        for mine, theirs, merged, name in ((self.m2, other.m2, m2, 'm2'), (self.m3, other.m3, m3, 'm3'),
+                                           (self.m4, other.m4, m4, 'm4')):
+            setattr(self, name, np.where(nb == 0, mine, np.where(na == 0, theirs, merged)))
+        self.mean = mean
+        self.n = n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.rows += other.rows
+        return self
+
+    def update(self, chunk):
+        """Add the rows of a chunk."""
+        return self.merge(Moments.from_frame(chunk, self.columns))
+
+    def result(self):
+        """One row per column: count, mean, std, min, max, variance, skewness, kurtosis, missing %, range.
+
+        Variance and std use n - 1, skewness and (excess) kurtosis are the
+        bias-corrected sample estimates, the same as pandas' var/skew/kurt.
+        """
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = np.where(n > 1, self.m2 / (n - 1), np.nan)
+            m2 = self.m2 / n
+            g1 = (self.m3 / n) / m2 ** 1.5
+            g2 = (self.m4 / n) / m2 ** 2 - 3
+            skew = np.where(n > 2, np.sqrt(n * (n - 1)) / (n - 2) * g1, np.nan)
+            kurt = np.where(n > 3, (n - 1) / ((n - 2) * (n - 3)) * ((n + 1) * g2 + 6), np.nan)
+            # Constant columns: pandas reports 0 rather than 0 / 0
+            flat = self.m2 <= 1e-14 * np.maximum(1.0, self.mean ** 2) * np.maximum(n, 1)
+            skew = np.where(flat & (n > 2), 0.0, skew)
+            kurt = np.where(flat & (n > 3), 0.0, kurt)
+            missing = (self.rows - n) / self.rows * 100 if self.rows else np.full(len(n), np.nan)
+        return pd.DataFrame({
+            'count': n,
+            'mean': np.where(n > 0, self.mean, np.nan),
+            'std': np.sqrt(variance),
+            'min': self.min,
+            'max': self.max,
+            'Variance': variance,
+            'Skewness': skew,
+            'Kurtosis': kurt,
+            'Missing %': missing,
+            'Range': self.max - self.min
+        }, index=self.columns)
+
+
+def rollup_moments(connection, table, level, device_id, start, end, columns):
+    """Moments of a range from the rollup buckets of level (see rollup.py), two small queries.
+
+    Only the buckets that lie wholly inside the range come from the
+    rollup; the rows of the partial buckets at either end are aggregated
+    from the data table, so count, mean, min and max are exact.
+    """
+    from rollup import RollupLevels, bucket_start, rollup_table
+
+    dialect = dialect_of(connection)
+    q, p = dialect.quote, dialect.placeholder
+    width = RollupLevels[level]
+    first = bucket_start(start, width)
+    if first < start:
+        first += timedelta(seconds=width)
+    last = bucket_start(end, width)  # whole buckets are first <= Bucket < last
+    rollup_parts, raw_parts = [], []
+    for col in columns:
+        rollup_parts += [f"SUM({q(col + '__count')})", f"SUM({q(col + '__sum')})",
+                         f"MIN({q(col + '__min')})", f"MAX({q(col + '__max')})"]
+        raw_parts += [f"COUNT({q(col)})", f"SUM({q(col)})", f"MIN({q(col)})", f"MAX({q(col)})"]
+    queries = []
+    if first < last:
+        queries.append((f"SELECT SUM(Samples), {', '.join(rollup_parts)} FROM {rollup_table(table, level)} "
+                        f"WHERE Device_ID = {p} AND Bucket >= {p} AND Bucket < {p}", (device_id, first, last)))
+        queries.append((f"SELECT COUNT(*), {', '.join(raw_parts)} FROM {table} WHERE Device_ID = {p} "
+                        f"AND ((Date_Time >= {p} AND Date_Time < {p}) OR (Date_Time >= {p} AND Date_Time <= {p}))",
+                        (device_id, start, first, last, end)))
+    else:
+        # Shorter than a bucket: no rollup row lies inside
+        queries.append((f"SELECT COUNT(*), {', '.join(raw_parts)} FROM {table} WHERE Device_ID = {p} "
+                        f"AND Date_Time >= {p} AND Date_Time <= {p}", (device_id, start, end)))
+    moments = Moments(columns)
+    cursor = connection.cursor()
+    try:
+        for query, params in queries:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            values = [np.nan if v is None else float(v) for v in row[1:]]
+            moments.merge(Moments.from_sums(columns, np.nan_to_num(values[0::4]), np.nan_to_num(values[1::4]),
+                                            values[2::4], values[3::4], rows=int(row[0] or 0)))
+    finally:
+        cursor.close()
+    return moments
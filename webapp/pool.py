@@ -0,0 +1,123 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections shared by all dashboard sessions.
+
+    At most max_size connections are open; when they are all in use,
+    connection() waits up to timeout seconds for one to come back. Idle
+    connections are checked with is_alive() before reuse once they have
+    been idle for check_after seconds, and closed after max_idle seconds
+    so the server's wait_timeout never cuts them off mid-query. end_read is
+    called on every connection that comes back (e.g. Backend.end_read).
+    """
+
+    def __init__(self, connect, is_alive=None, max_size=5, timeout=10, check_after=30, max_idle=600, end_read=None):
+        self.connect = connect
+        self.is_alive = is_alive
+        self.end_read = end_read
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.idle = []  # (connection, returned at), most recent last
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "waits": 0}
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _take_idle(self):
+        # Most recently used first, it is the least likely to have gone stale
+        while self.idle:
+            connection, returned = self.idle.pop()
+            idle_for = time.monotonic() - returned
+            if idle_for > self.max_idle or (idle_for > self.check_after and self.is_alive and not self.is_alive(connection)):
+                self.size -= 1
+                self.stats["discarded"] += 1
+                self._close(connection)
+                continue
+            self.stats["reused"] += 1
+            return connection
+        return None
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                connection = self._take_idle()
+                if connection is not None:
+                    return connection
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"All {self.max_size} database connections are busy, try again")
+                self.stats["waits"] += 1
+                self.condition.wait(remaining)
+
+        # Connect outside the lock, a slow handshake should not block the other sessions
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.stats["created"] += 1
+        return connection
+
+    def release(self, connection, broken=False):
+        if not broken and self.end_read:
+            try:
+                self.end_read(connection)
+            except Exception:
+                broken = True
+        with self.condition:
+            # Connections still in use when the pool was closed are closed as they come back
+            if broken or self.closed:
+                self.size -= 1
+                self.stats["discarded"] += 1
+                self._close(connection)
+            else:
+                self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as connection: ... returns it to the pool afterwards."""
+        connection = self.acquire()
+        broken = False
+        try:
+            yield connection
+        except Exception:
+            # The connection may be mid-result or dead, do not hand it out again
+            broken = True
+            raise
+        finally:
+            self.release(connection, broken)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            for connection, _ in self.idle:
+                self._close(connection)
+            self.size -= len(self.idle)
+            self.idle = []
+
+    def status(self):
+        with self.condition:
+            return {"open": self.size, "idle": len(self.idle), "max": self.max_size, **self.stats}
@@ -0,0 +1,128 @@
+import struct
+
+# Layout of the original VFD table: ten 16 bit holding registers from address 0
+DefaultRegisters = [
+    {"column": "Control_Word", "address": 0},
+    {"column": "Status_Word", "address": 1},
+    {"column": "Reference_1", "address": 2},
+    {"column": "Reference_2", "address": 3},
+    {"column": "Speed", "address": 4},
+    {"column": "Torque", "address": 5},
+    {"column": "Voltage", "address": 6},
+    {"column": "Current_i", "address": 7},
+    {"column": "Power", "address": 8},
+    {"column": "Error_code", "address": 9}
+]
+
+# Registers (words) per type
+TypeWords = {"u16": 1, "s16": 1, "u32": 2, "s32": 2, "float32": 2}
+
+# Modbus allows at most 125 registers in one read request
+MaxReadCount = 125
+
+
+def parse_registers(entries, default_interval=1):
+    """Validate register map entries and fill in defaults.
+
+    Each entry:
+        {"column": "Speed", "address": 4, "type": "u16", "scale": 0.1,
+         "table": "holding", "word_order": "big", "interval": 1, "deadband": 0.5}
+
+    type is u16, s16, u32, s32 or float32. word_order says which word of a
+    32 bit value comes first ("big": high word first). table is holding or
+    input. interval is optional and lets a register be polled at its own rate.
+    deadband is optional, the change (in scaled units) that counts as a new
+    value when the logger stores by exception (see deadband.py).
+    """
+    registers = []
+    columns = set()
+    for entry in entries:
+        reg = {
+            "column": entry["column"],
+            "address": int(entry["address"]),
+            "type": entry.get("type", "u16"),
+            "scale": entry.get("scale", 1),
+            "table": entry.get("table", "holding"),
+            "word_order": entry.get("word_order", "big"),
+            "interval": entry.get("interval", default_interval),
+            "deadband": entry.get("deadband")
+        }
+        if reg["type"] not in TypeWords:
+            raise ValueError(f"Register {reg['column']}: unknown type '{reg['type']}'")
+        if reg["table"] not in ("holding", "input"):
+            raise ValueError(f"Register {reg['column']}: table must be holding or input")
+        if reg["word_order"] not in ("big", "little"):
+            raise ValueError(f"Register {reg['column']}: word_order must be big or little")
+        if reg["deadband"] is not None and reg["deadband"] < 0:
+            raise ValueError(f"Register {reg['column']}: deadband must not be negative")
+        if reg["column"] in columns:
+            raise ValueError(f"Column {reg['column']} is mapped twice")
+        columns.add(reg["column"])
+        reg["words"] = TypeWords[reg["type"]]
+        registers.append(reg)
+    return registers
+
+
+def plan_reads(registers, max_gap=8, max_count=MaxReadCount):
+    """Coalesce registers into as few read requests as possible.
+
+    Registers of the same table are merged into one block when the hole
+    between them is at most max_gap registers. Reading a few unused words is
+    much cheaper than another request/response turnaround on a serial bus.
+    Returns a list of blocks: {"table", "address", "count", "registers"}.
+    """
+    blocks = []
+    for reg in sorted(registers, key=lambda r: (r["table"], r["address"])):
+        end = reg["address"] + reg["words"]
+        block = blocks[-1] if blocks else None
+        if (block and block["table"] == reg["table"]
+                and reg["address"] <= block["address"] + block["count"] + max_gap
+                and end - block["address"] <= max_count):
+            block["count"] = max(block["count"], end - block["address"])
+            block["registers"].append(reg)
+        else:
+            blocks.append({
+                "table": reg["table"],
+                "address": reg["address"],
+                "count": reg["words"],
+                "registers": [reg]
+            })
+    return blocks
+
+
+def decode_value(reg, words):
+    """Decode the raw words of one register and apply its scale."""
+    if reg["type"] == "u16":
+        value = words[0]
+    elif reg["type"] == "s16":
+        value = words[0] - 0x10000 if words[0] & 0x8000 else words[0]
+    else:
+        high, low = (words[0], words[1]) if reg["word_order"] == "big" else (words[1], words[0])
+        raw = struct.pack(">HH", high, low)
+        if reg["type"] == "u32":
+            value = struct.unpack(">I", raw)[0]
+        elif reg["type"] == "s32":
+            value = struct.unpack(">i", raw)[0]
+        else:
+            value = struct.unpack(">f", raw)[0]
+
+    if reg["scale"] != 1:
+        value = value * reg["scale"]
+    return value
+
+
+def decode_block(block, words):
+    """Column values from the words returned for one block."""
+    values = {}
+    for reg in block["registers"]:
+        start = reg["address"] - block["address"]
+        values[reg["column"]] = decode_value(reg, words[start:start + reg["words"]])
+    return values
+
+
+def sql_type(reg):
+    if reg["type"] == "float32" or reg["scale"] != 1:
+        return "DOUBLE"
+    if reg["type"] == "u32":
+        return "INT UNSIGNED"
+    return "INT"
@@ -0,0 +1,156 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+
+# File layout: a 4 KiB header, then capacity fixed-size slots.
+#   header: magic, capacity, column count, slot size, last written sequence number,
+#           length and JSON of the column names
+#   slot:   sequence number, device id, spare, time (seconds since 1970, local time), values
+Magic = b"VFDRING1"
+HeaderSize = 4096
+HeaderFormat = "<8sIIIxxxxQI"
+HeadOffset = 24  # offset of the last written sequence number
+SlotHeader = "<QiId"
+Epoch = datetime(1970, 1, 1)
+
+
+def slot_size(columns):
+    return struct.calcsize(SlotHeader) + 8 * len(columns)
+
+
+class RingWriter:
+    """Latest samples in a memory-mapped file, for the dashboard's live tail.
+
+    One writer (the logger) appends; any number of readers poll without
+    locks. Every sample gets a sequence number. A slot's number is cleared
+    while it is rewritten and the header's number is moved on last, so a
+    reader that copies a slot mid-write sees the mismatch and skips it.
+    """
+
+    def __init__(self, path, columns, capacity=36000):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.slot = slot_size(self.columns)
+        self.format = SlotHeader + "d" * len(self.columns)
+        size = HeaderSize + capacity * self.slot
+
+        names = json.dumps(self.columns).encode()
+        if struct.calcsize(HeaderFormat) + len(names) > HeaderSize:
+            raise ValueError("Too many columns for the live ring header")
+
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        header = self.file.read(HeaderSize)
+        # Never shrink: readers may have the file mapped (SIGBUS on POSIX, PermissionError on Windows).
+        # Growing is safe; on Windows mmap grows the file itself, truncate would fail while it is mapped
+        if os.path.getsize(path) < size and os.name != "nt":
+            self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        # Keep the sequence going if the layout is unchanged, so readers just continue
+        if self._compatible(header, names):
+            self.seq = struct.unpack_from("<Q", self.mm, HeadOffset)[0]
+        else:
+            # Slots of an older ring could hold sequence numbers the new one is about to use
+            self.mm[:] = bytes(size)
+            struct.pack_into(HeaderFormat, self.mm, 0, Magic, capacity, len(self.columns), self.slot, 0, len(names))
+            self.mm[struct.calcsize(HeaderFormat):struct.calcsize(HeaderFormat) + len(names)] = names
+            self.seq = 0
+
+    def _compatible(self, header, names):
+        if len(header) < struct.calcsize(HeaderFormat):
+            return False
+        magic, capacity, count, slot, _, length = struct.unpack_from(HeaderFormat, header)
+        offset = struct.calcsize(HeaderFormat)
+        return (magic == Magic and capacity == self.capacity and slot == self.slot
+                and header[offset:offset + length] == names)
+
+    def append(self, device_id, ts, values):
+        """values in column order, None for registers that were not read."""
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts)  # the engine's "%Y-%m-%d %H:%M:%S.fff" tick time
+        self.seq += 1
+        offset = HeaderSize + ((self.seq - 1) % self.capacity) * self.slot
+        struct.pack_into("<Q", self.mm, offset, 0)
+        seconds = (ts - Epoch).total_seconds()
+        struct.pack_into(self.format, self.mm, offset, 0, device_id, 0, seconds,
+                         *[float("nan") if v is None else float(v) for v in values])
+        struct.pack_into("<Q", self.mm, offset, self.seq)
+        struct.pack_into("<Q", self.mm, HeadOffset, self.seq)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class RingReader:
+    """Reads the samples added to a RingWriter file since the last call."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+        self.lock = threading.Lock()
+
+    def _open(self):
+        import numpy as np
+
+        with open(self.path, "rb") as f:
+            header = f.read(HeaderSize)
+            if len(header) < HeaderSize or header[:len(Magic)] != Magic:
+                raise ValueError(f"{self.path} is not a live ring file")
+            magic, self.capacity, count, self.slot, _, length = struct.unpack_from(HeaderFormat, header)
+            # The size from the header: the file can be larger than the ring in it
+            self.mm = mmap.mmap(f.fileno(), HeaderSize + self.capacity * self.slot, access=mmap.ACCESS_READ)
+        offset = struct.calcsize(HeaderFormat)
+        self.layout = self._layout()
+        self.columns = json.loads(self.mm[offset:offset + length])
+        self.dtype = np.dtype([("seq", "<u8"), ("device", "<i4"), ("spare", "<u4"), ("ts", "<f8"),
+                               ("values", "<f8", (count,))])
+        self.slots = np.frombuffer(self.mm, self.dtype, count=self.capacity, offset=HeaderSize)
+
+    def _layout(self):
+        # Header without the sequence number, changes when the logger starts a ring with other columns
+        length = struct.unpack_from(HeaderFormat, self.mm)[5]
+        return self.mm[:HeadOffset] + self.mm[HeadOffset + 8:struct.calcsize(HeaderFormat) + length]
+
+    def _close(self):
+        self.slots = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def read_since(self, last_seq, device_id=None):
+        """(DataFrame of samples after last_seq, new last_seq).
+
+        Samples overwritten before they were read are skipped. A sequence
+        number above the writer's means the logger started a new ring, the
+        reader then starts from the oldest sample in it.
+        """
+        import numpy as np
+        import pandas as pd
+
+        with self.lock:
+            if self.mm is None or self._layout() != self.layout:
+                self._close()
+                self._open()
+            head = struct.unpack_from("<Q", self.mm, HeadOffset)[0]
+            if last_seq > head:
+                last_seq = 0
+            first = max(last_seq, head - self.capacity) + 1
+            expected = np.arange(first, head + 1, dtype="<u8")
+            index = (expected - 1) % self.capacity
+            records = self.slots[index]  # copies only the new slots
+            valid = (records["seq"] == expected) & (self.slots["seq"][index] == expected)
+            if device_id is not None:
+                valid &= records["device"] == device_id
+            records = records[valid]
+
+            frame = pd.DataFrame(records["values"], columns=self.columns)
+            frame.insert(0, "Device_ID", records["device"])
+            frame.insert(0, "Date_Time", pd.to_datetime(records["ts"], unit="s"))
+            return frame, head
+
+    def close(self):
+        with self.lock:
+            self._close()
@@ -0,0 +1,290 @@
+import argparse
+import json
+from datetime import datetime, timedelta
+from storage import MySQLBackend, dialect_of, open_backend, storage_config
+
+# Rollup level: bucket width in seconds. Widths must divide a day.
+RollupLevels = {"1m": 60, "1h": 3600}
+
+# Aggregates kept per register and bucket; avg is sum / count
+Aggregates = ["min", "max", "sum", "count", "last"]
+
+
+def rollup_table(table, level):
+    return f"{table}_{level}"
+
+
+def bucket_start(ts, seconds):
+    """Start of the bucket of seconds width holding ts."""
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)  # rows replayed from the spool
+    into_day = (ts.hour * 3600 + ts.minute * 60 + ts.second) % seconds
+    return ts.replace(microsecond=0) - timedelta(seconds=into_day)
+
+
+def rollup_columns(columns):
+    """(name, SQL type) of the aggregate columns of columns."""
+    definitions = []
+    for col in columns:
+        definitions += [(f"{col}__{agg}", "DOUBLE") for agg in ("min", "max", "sum")]
+        definitions += [(f"{col}__count", "INTEGER NOT NULL DEFAULT 0"), (f"{col}__last", "DOUBLE")]
+    return definitions
+
+
+def create_rollup_sql(table, level, columns, dialect=None):
+    dialect = dialect or MySQLBackend()
+    lines = [
+        "Device_ID INTEGER NOT NULL",
+        f"Bucket {dialect.datetime_type} NOT NULL",
+        f"Last_Time {dialect.datetime_type} NOT NULL",
+        "Samples INTEGER NOT NULL"
+    ]
+    lines += [f"{dialect.quote(name)} {sql_type}" for name, sql_type in rollup_columns(columns)]
+    lines.append("PRIMARY KEY (Device_ID, Bucket)")
+    return (f"CREATE TABLE IF NOT EXISTS {rollup_table(table, level)} (\n    " + ",\n    ".join(lines)
+            + "\n)" + dialect.table_options)
+
+
+def upsert_sql(table, level, columns, dialect=None):
+    """INSERT that merges a partial bucket into the stored one.
+
+    MySQL applies the UPDATE assignments left to right, so Last_Time is
+    compared before it is moved forward in the last assignment (the other
+    backends always compare with the stored values).
+    """
+    dialect = dialect or MySQLBackend()
+    new = dialect.new_value
+    names = ["Device_ID", "Bucket", "Last_Time", "Samples"]
+    updates = [("Samples", f"Samples + {new('Samples')}")]
+    for col in columns:
+        low, high, total, count, last = (dialect.quote(f"{col}__{agg}") for agg in Aggregates)
+        names += [low, high, total, count, last]
+        updates += [
+            (low, f"CASE WHEN {low} IS NULL OR {new(low)} < {low} THEN {new(low)} ELSE {low} END"),
+            (high, f"CASE WHEN {high} IS NULL OR {new(high)} > {high} THEN {new(high)} ELSE {high} END"),
+            (total, f"CASE WHEN {new(total)} IS NULL THEN {total} ELSE COALESCE({total}, 0) + {new(total)} END"),
+            (count, f"{count} + {new(count)}"),
+            (last, f"CASE WHEN {new(last)} IS NOT NULL AND {new('Last_Time')} >= Last_Time THEN {new(last)} ELSE {last} END")
+        ]
+    updates.append(("Last_Time", f"CASE WHEN {new('Last_Time')} > Last_Time THEN {new('Last_Time')} ELSE Last_Time END"))
+    return dialect.upsert(rollup_table(table, level), names, ["Device_ID", "Bucket"], updates)
+
+
+class Rollup:
+    """Keeps the rollup tables of a data table up to date from the inserted rows.
+
+    Rows are (Device_ID, Date_Time, value, ...) as written by the logger.
+    Each batch is folded into one partial aggregate per device and bucket,
+    which is merged into the stored bucket with INSERT ... ON DUPLICATE KEY
+    UPDATE in the same transaction as the raw insert. The raw table is never
+    read again.
+    """
+
+    def __init__(self, table, columns, levels=None, dialect=None):
+        self.table = table
+        self.columns = list(columns)
+        self.dialect = dialect or MySQLBackend()
+        self.levels = {name: RollupLevels[name] for name in (levels if levels is not None else RollupLevels)}
+        self.queries = {name: upsert_sql(table, name, self.columns, self.dialect) for name in self.levels}
+
+    def create(self, cursor):
+        """Create the rollup tables, or add the columns of registers mapped since they were created."""
+        for name in self.levels:
+            cursor.execute(create_rollup_sql(self.table, name, self.columns, self.dialect))
+            # Otherwise every upsert fails and takes the raw insert of its batch down with it
+            added = self.dialect.add_columns(cursor, rollup_table(self.table, name), rollup_columns(self.columns))
+            if added:
+                print(f"Added {len(added)} columns to {rollup_table(self.table, name)}")
+
+    def aggregate(self, rows, seconds):
+        """Parameter tuples for the upsert, one per device and bucket in rows."""
+        buckets = {}
+        for row in rows:
+            device, ts = row[0], row[1]
+            if isinstance(ts, str):
+                ts = datetime.fromisoformat(ts)
+            key = (device, bucket_start(ts, seconds))
+            state = buckets.get(key)
+            if state is None:
+                state = buckets[key] = {"last_time": ts, "samples": 0,
+                                        "values": [[None, None, None, 0, None] for _ in self.columns]}
+            state["samples"] += 1
+            newest = ts >= state["last_time"]
+            if newest:
+                state["last_time"] = ts
+            for agg, value in zip(state["values"], row[2:]):
+                if value is None:
+                    continue
+                value = float(value)
+                agg[0] = value if agg[0] is None or value < agg[0] else agg[0]
+                agg[1] = value if agg[1] is None or value > agg[1] else agg[1]
+                agg[2] = value if agg[2] is None else agg[2] + value
+                agg[3] += 1
+                if newest or agg[4] is None:
+                    agg[4] = value
+
+        params = []
+        for (device, bucket), state in buckets.items():
+            values = [v for agg in state["values"] for v in agg]
+            params.append((device, bucket, state["last_time"], state["samples"], *values))
+        return params
+
+    def write(self, cursor, rows):
+        """Merge rows into every rollup level, the caller commits."""
+        for name, seconds in self.levels.items():
+            params = self.aggregate(rows, seconds)
+            if params:
+                cursor.executemany(self.queries[name], params)
+
+
+def choose_level(bucket, levels=RollupLevels):
+    """Coarsest rollup level not wider than bucket seconds, None if raw rows are needed."""
+    fitting = [name for name, seconds in levels.items() if seconds <= bucket]
+    return max(fitting, key=levels.get) if fitting else None
+
+
+def align_bucket(bucket, levels=RollupLevels):
+    """Round bucket up to a whole number of rollup buckets so they are not split."""
+    level = choose_level(bucket, levels)
+    if level is None:
+        return bucket
+    seconds = levels[level]
+    return -(-bucket // seconds) * seconds
+
+
+def rollup_covers(connection, table, level, device_id, start):
+    """True when the rollup has every bucket from start on.
+
+    Rollups only start when the logger first writes them (or from a
+    backfill), so older raw rows may have no rollup yet.
+    """
+    p = dialect_of(connection).placeholder
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT MIN(Bucket) FROM {rollup_table(table, level)} WHERE Device_ID = {p}", (device_id,))
+        first = cursor.fetchone()[0]
+        if first is None:
+            return False
+        if isinstance(first, str):
+            first = datetime.fromisoformat(first)
+        if first <= bucket_start(start, RollupLevels[level]):
+            return True
+        cursor.execute(f"SELECT 1 FROM {table} WHERE Device_ID = {p} AND Date_Time >= {p} AND Date_Time < {p} LIMIT 1",
+                       (device_id, start, first))
+        return cursor.fetchone() is None
+    except Exception:
+        # No rollup table for this data table
+        return False
+    finally:
+        cursor.close()
+
+
+def rollup_query(table, level, columns, bucket, dialect=None):
+    """Same result shape as downsample.downsample_query, read from a rollup table."""
+    dialect = dialect or MySQLBackend()
+    q, p = dialect.quote, dialect.placeholder
+    parts = []
+    for col in columns:
+        parts += [f"SUM({q(col + '__sum')}) / NULLIF(SUM({q(col + '__count')}), 0) AS {q(col)}",
+                  f"MIN({q(col + '__min')}) AS {q(col + '__min')}", f"MAX({q(col + '__max')}) AS {q(col + '__max')}"]
+    return f"""
+        SELECT {dialect.bucket_time('Bucket', bucket)} AS Date_Time,
+               {', '.join(parts)}
+        FROM {rollup_table(table, level)}
+        WHERE Device_ID = {p} AND Bucket BETWEEN {p} AND {p}
+        GROUP BY {dialect.bucket_key('Bucket', bucket)}
+        ORDER BY Date_Time ASC
+        """
+
+
+def fetch_rollup(connection, table, level, device_id, start, end, columns, bucket):
+    """Bucketed min/max/mean rows read from a rollup level instead of the raw rows."""
+    from downsample import read_buckets
+
+    query = rollup_query(table, level, columns, bucket, dialect_of(connection))
+    return read_buckets(connection, query, [device_id, bucket_start(start, RollupLevels[level]), end])
+
+
+def backfill(db, reader, table, columns, device_ids, start, end, levels=None, chunksize=50000):
+    """Build the rollups of [start, end) from the raw rows, once.
+
+    start and end are rounded down to whole hours and existing rollup rows
+    in between are replaced. Run it for ranges the logger is no longer
+    writing to, e.g. everything before the current hour. reader is a
+    second connection, it is busy streaming while db writes.
+    """
+    from streaming import stream_rows
+
+    rollup = Rollup(table, columns, levels, dialect_of(db))
+    p = rollup.dialect.placeholder
+    start = bucket_start(start, 3600)
+    end = bucket_start(end, 3600)
+    cursor = db.cursor()
+    try:
+        rollup.create(cursor)
+        for device_id in device_ids:
+            for name in rollup.levels:
+                cursor.execute(f"DELETE FROM {rollup_table(table, name)} WHERE Device_ID = {p} AND Bucket >= {p} AND Bucket < {p}",
+                               (device_id, start, end))
+            db.commit()
+            done = 0
+            for chunk in stream_rows(reader, table, device_id, start, end - timedelta(milliseconds=1), chunksize, rollup.columns):
+                rows = [(device_id, r[0].to_pydatetime(), *[None if v != v else v for v in r[1:]])
+                        for r in chunk[["Date_Time"] + rollup.columns].itertuples(index=False)]
+                rollup.write(cursor, rows)
+                db.commit()
+                done += len(rows)
+                print(f"Device {device_id}: {done} rows rolled up")
+    finally:
+        cursor.close()
+
+
+def main():
+    from downsample import value_columns
+
+    parser = argparse.ArgumentParser(description="Create and backfill the rollup tables")
+    parser.add_argument("action", choices=["create", "backfill"])
+    parser.add_argument("config", help="config.json with the storage (or mysql) section")
+    parser.add_argument("--table", default="vfd")
+    parser.add_argument("--start", help="backfill from (YYYY-MM-DD[ HH:MM]), default the first row")
+    parser.add_argument("--end", help="backfill up to (YYYY-MM-DD[ HH:MM]), default the current hour")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+    backend = open_backend(storage_config(cfg))
+    db = backend.connect()
+    try:
+        columns = value_columns(db, args.table)
+        levels = cfg.get("rollups", list(RollupLevels))
+        if args.action == "create":
+            cursor = db.cursor()
+            Rollup(args.table, columns, levels, backend).create(cursor)
+            cursor.close()
+            print(f"Rollup tables ready: {', '.join(rollup_table(args.table, name) for name in levels)}")
+            return
+
+        cursor = db.cursor()
+        cursor.execute(f"SELECT DISTINCT Device_ID FROM {args.table}")
+        device_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"SELECT MIN(Date_Time) FROM {args.table}")
+        first = cursor.fetchone()[0]
+        cursor.close()
+        if first is None:
+            print("No rows to roll up")
+            return
+        if isinstance(first, str):
+            first = datetime.fromisoformat(first)
+        start = datetime.fromisoformat(args.start) if args.start else first
+        end = datetime.fromisoformat(args.end) if args.end else datetime.now()
+        reader = backend.connect()
+        try:
+            backfill(db, reader, args.table, columns, device_ids, start, end, levels)
+        finally:
+            reader.close()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+
+class DeadlineScheduler:
+    """Fixed-rate schedule on the monotonic clock.
+
+    Deadlines are start + n * interval, so time spent reading and writing
+    does not add up into drift. Ticks are aligned to whole multiples of the
+    interval on the wall clock (e.g. every full second) which keeps logged
+    timestamps evenly spaced. When a cycle runs past one or more deadlines
+    those ticks are skipped and counted instead of being run back to back.
+    """
+
+    def __init__(self, interval):
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = float(interval)
+        now_wall = time.time()
+        self.start_mono = time.monotonic()
+        self.start_wall = datetime.fromtimestamp(now_wall)
+        # First tick on the next wall clock multiple of the interval
+        self.deadline = self.start_mono + (self.interval - now_wall % self.interval) % self.interval
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+        self.cycles = 0
+        self.cycle_total = 0.0
+        self.cycle_last = 0.0
+        self.cycle_max = 0.0
+
+    def tick_time(self):
+        """Wall clock time of the current deadline."""
+        return self.start_wall + timedelta(seconds=self.deadline - self.start_mono)
+
+    def advance(self):
+        """Move to the next deadline and return the seconds left until it."""
+        now = time.monotonic()
+        self.deadline += self.interval
+        if now > self.deadline:
+            late = now - self.deadline
+            skipped = int(late // self.interval) + 1
+            self.overruns += 1
+            self.missed += skipped
+            self.max_lateness = max(self.max_lateness, late)
+            self.deadline += skipped * self.interval
+        self.ticks += 1
+        return self.deadline - now
+
+    def record_cycle(self, seconds):
+        """Duration of one completed read cycle, for the latency figures in stats()."""
+        self.cycles += 1
+        self.cycle_total += seconds
+        self.cycle_last = seconds
+        self.cycle_max = max(self.cycle_max, seconds)
+
+    async def wait_first(self):
+        await asyncio.sleep(max(0.0, self.deadline - time.monotonic()))
+
+    async def wait(self):
+        """Sleep until the next deadline."""
+        await asyncio.sleep(self.advance())
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "missed_deadlines": self.missed,
+            "max_lateness": round(self.max_lateness, 3),
+            "cycles": self.cycles,
+            "cycle_last_ms": round(self.cycle_last * 1000, 2),
+            "cycle_avg_ms": round(self.cycle_total / self.cycles * 1000, 2) if self.cycles else 0.0,
+            "cycle_max_ms": round(self.cycle_max * 1000, 2)
+        }
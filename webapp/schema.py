@@ -0,0 +1,256 @@
+import argparse
+import json
+import time
+from datetime import date, datetime
+import mysql.connector
+from register_map import DefaultRegisters, parse_registers, sql_type
+
+# Key columns, the rest of the table comes from the register map
+KeyDefinitions = [
+    "ID BIGINT NOT NULL AUTO_INCREMENT",
+    "Device_ID INT NOT NULL DEFAULT 1",
+    "Date_Time DATETIME(3) NOT NULL"
+]
+KeyNames = ["ID", "Device_ID", "Date_Time"]
+
+
+def month_start(day, months=0):
+    """First day of the month months after day's month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_clause(first_month, last_month):
+    """Monthly RANGE COLUMNS partitions from first_month up to last_month, plus pmax."""
+    parts = []
+    month = month_start(first_month)
+    while month <= last_month:
+        upper = month_start(month, 1)
+        parts.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{upper:%Y-%m-%d}')")
+        month = upper
+    parts.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return "PARTITION BY RANGE COLUMNS (Date_Time) (\n    " + ",\n    ".join(parts) + "\n)"
+
+
+def create_table_sql(table, column_definitions, first_month, last_month):
+    """Partitioned table clustered on (Device_ID, Date_Time).
+
+    InnoDB stores rows in primary key order, so every dashboard query
+    (one device, a time range) is a contiguous range scan inside the
+    partitions of that range. ID stays in the key to keep it unique and
+    has its own index for AUTO_INCREMENT and the incremental cache.
+    """
+    lines = KeyDefinitions + column_definitions + [
+        "PRIMARY KEY (Device_ID, Date_Time, ID)",
+        "KEY idx_id (ID)"
+    ]
+    return (f"CREATE TABLE {table} (\n    " + ",\n    ".join(lines) + "\n) ENGINE=InnoDB\n"
+            + partition_clause(first_month, last_month))
+
+
+def partitions(cursor, database, table):
+    """(name, upper bound) of the table's partitions, in order. Empty if not partitioned."""
+    cursor.execute(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (database, table)
+    )
+    return [(name, bound.strip("'")) for name, bound in cursor.fetchall()]
+
+
+def table_exists(cursor, database, table):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                   (database, table))
+    return cursor.fetchone()[0] > 0
+
+
+def create(db, database, table, registers, months_ahead=3):
+    """Create the partitioned table for a register map."""
+    cursor = db.cursor()
+    try:
+        if table_exists(cursor, database, table):
+            raise ValueError(f"Table {table} already exists, use migrate")
+        columns = [f"{reg['column']} {sql_type(reg)}" for reg in registers]
+        today = date.today()
+        cursor.execute(create_table_sql(table, columns, today, month_start(today, months_ahead)))
+        print(f"Created {table} with partitions up to {month_start(today, months_ahead):%Y-%m}")
+    finally:
+        cursor.close()
+
+
+def add_partitions(db, database, table, months_ahead=3):
+    """Split pmax so there are monthly partitions up to months_ahead from now."""
+    cursor = db.cursor()
+    try:
+        existing = partitions(cursor, database, table)
+        if not existing:
+            return 0
+        bounds = [b for name, b in existing if name != "pmax"]
+        next_month = datetime.strptime(bounds[-1][:10], "%Y-%m-%d").date() if bounds else month_start(date.today())
+        last_month = month_start(date.today(), months_ahead)
+        new = []
+        while next_month <= last_month:
+            upper = month_start(next_month, 1)
+            new.append(f"PARTITION p{next_month:%Y%m} VALUES LESS THAN ('{upper:%Y-%m-%d}')")
+            next_month = upper
+        if new:
+            cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+                           + ", ".join(new) + ", PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+            print(f"Added {len(new)} partitions to {table}")
+        return len(new)
+    finally:
+        cursor.close()
+
+
+def drop_old_partitions(db, database, table, keep_months):
+    """Retention: drop whole monthly partitions older than keep_months.
+
+    Dropping a partition removes its data file instead of deleting rows one
+    by one, so it takes a moment whatever the size and leaves no fragmentation.
+    """
+    cutoff = month_start(date.today(), -keep_months)
+    cursor = db.cursor()
+    try:
+        old = [name for name, bound in partitions(cursor, database, table)
+               if name != "pmax" and datetime.strptime(bound[:10], "%Y-%m-%d").date() <= cutoff]
+        if old:
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(old)}")
+            print(f"Dropped partitions {', '.join(old)} from {table}")
+        return old
+    finally:
+        cursor.close()
+
+
+def maintain(db, database, table, months_ahead=3, keep_months=None):
+    """Add upcoming partitions and apply retention. Does nothing for unpartitioned tables."""
+    added = add_partitions(db, database, table, months_ahead)
+    dropped = drop_old_partitions(db, database, table, keep_months) if keep_months else []
+    return added, dropped
+
+
+def migrate(db, database, table, batch=10000, months_ahead=3):
+    """Move an existing table to the partitioned layout while the logger keeps writing.
+
+    Rows are copied into a new table in ID order, batch by batch, then the
+    rows inserted meanwhile are copied and the tables are swapped with one
+    atomic RENAME. The new table's AUTO_INCREMENT starts above the old one so
+    rows that slip in during the swap keep unique IDs and are copied after
+    it. The old table is kept as <table>_old.
+    """
+    cursor = db.cursor()
+    new_table = f"{table}_new"
+    old_table = f"{table}_old"
+    try:
+        if partitions(cursor, database, table):
+            print(f"{table} is already partitioned")
+            return
+
+        cursor.execute(
+            "SELECT COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+            (database, table)
+        )
+        existing = cursor.fetchall()
+        names = [name for name, _ in existing]
+        value_columns = [(name, col_type) for name, col_type in existing if name not in KeyNames]
+        definitions = [f"`{name}` {col_type}" for name, col_type in value_columns]
+
+        cursor.execute(f"SELECT MIN(Date_Time), MAX(ID) FROM {table}")
+        first, max_id = cursor.fetchone()
+        first_month = first.date() if first else date.today()
+
+        cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+        cursor.execute(create_table_sql(new_table, definitions, first_month, month_start(date.today(), months_ahead)))
+
+        # Old tables may predate multi-device logging
+        device = "Device_ID" if "Device_ID" in names else "1"
+        copy_columns = ", ".join(["ID", "Device_ID", "Date_Time"] + [f"`{name}`" for name, _ in value_columns])
+        select_columns = ", ".join(["ID", device, "Date_Time"] + [f"`{name}`" for name, _ in value_columns])
+
+        def copy_after(last_id, upto=None):
+            # Copies rows with last_id < ID (<= upto) in batches, returns the highest ID copied
+            while True:
+                limit = f" AND ID <= {int(upto)}" if upto is not None else ""
+                cursor.execute(
+                    f"INSERT INTO {new_table} ({copy_columns}) SELECT {select_columns} FROM {table} "
+                    f"WHERE ID > %s{limit} ORDER BY ID LIMIT {int(batch)}",
+                    (last_id,)
+                )
+                db.commit()
+                if cursor.rowcount == 0:
+                    return last_id
+                cursor.execute(f"SELECT MAX(ID) FROM {new_table}")
+                last_id = cursor.fetchone()[0]
+                print(f"Copied up to ID {last_id}")
+                time.sleep(0.05)  # leave room for the logger's inserts
+
+        last_id = copy_after(0, max_id)
+        last_id = copy_after(last_id)
+
+        # Gap in the ID sequence so rows inserted during the swap cannot clash
+        cursor.execute("SELECT AUTO_INCREMENT FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                       (database, table))
+        next_id = (cursor.fetchone()[0] or last_id + 1) + 100000
+        cursor.execute(f"ALTER TABLE {new_table} AUTO_INCREMENT = {int(next_id)}")
+
+        cursor.execute(f"DROP TABLE IF EXISTS {old_table}")
+        cursor.execute(f"RENAME TABLE {table} TO {old_table}, {new_table} TO {table}")
+
+        # Rows written to the old table between the last copy and the rename
+        cursor.execute(
+            f"INSERT INTO {table} ({copy_columns}) SELECT {select_columns} FROM {old_table} WHERE ID > %s",
+            (last_id,)
+        )
+        db.commit()
+        print(f"Migrated {table}, {cursor.rowcount} late rows copied after the swap. Old data kept in {old_table}")
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, migrate and maintain the partitioned data table")
+    parser.add_argument("action", choices=["sql", "create", "migrate", "maintain", "show"])
+    parser.add_argument("config", help="config.json with the mysql section (and optional register map)")
+    parser.add_argument("--table", default="vfd")
+    parser.add_argument("--months-ahead", type=int, default=3, help="monthly partitions to keep ready ahead of now")
+    parser.add_argument("--keep-months", type=int, default=None, help="drop partitions older than this")
+    parser.add_argument("--batch", type=int, default=10000, help="rows per copy batch when migrating")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+
+    if args.action == "sql":
+        # Print the CREATE TABLE without connecting
+        registers = parse_registers(cfg.get("registers", DefaultRegisters))
+        today = date.today()
+        print(create_table_sql(args.table, [f"{reg['column']} {sql_type(reg)}" for reg in registers],
+                               today, month_start(today, args.months_ahead)) + ";")
+        return
+
+    database = cfg["mysql"]["database"]
+    db = mysql.connector.connect(
+        host=cfg["mysql"]["host"],
+        user=cfg["mysql"]["user"],
+        password=cfg["mysql"]["password"],
+        database=database
+    )
+    try:
+        if args.action == "create":
+            create(db, database, args.table, parse_registers(cfg.get("registers", DefaultRegisters)), args.months_ahead)
+        elif args.action == "migrate":
+            migrate(db, database, args.table, args.batch, args.months_ahead)
+        elif args.action == "maintain":
+            maintain(db, database, args.table, args.months_ahead, args.keep_months)
+        else:
+            cursor = db.cursor()
+            for name, bound in partitions(cursor, database, args.table):
+                print(f"{name}: < {bound}")
+            cursor.close()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
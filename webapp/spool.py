@@ -0,0 +1,116 @@
+import json
+import os
+import time
+
+
+class Spool:
+    """Append-only local spool for rows that could not be written to the database.
+
+    Rows are stored as JSON lines in numbered segment files. Segments are
+    replayed oldest first, one segment per database write, and deleted once
+    the write succeeded. When the spool grows past max_bytes the oldest
+    segments are dropped.
+
+    fsync policy:
+        "always"   - fsync after every append (nothing lost on power failure)
+        "interval" - fsync at most every fsync_interval seconds
+        "never"    - leave it to the OS
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, segment_bytes=1024 * 1024,
+                 fsync="always", fsync_interval=1.0):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.segment_bytes = int(segment_bytes)
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.last_fsync = 0.0
+        self.current = None
+        os.makedirs(self.path, exist_ok=True)
+
+    def segments(self):
+        """Segment file paths, oldest first."""
+        names = sorted(n for n in os.listdir(self.path) if n.endswith(".seg"))
+        return [os.path.join(self.path, n) for n in names]
+
+    def size(self):
+        """Bytes currently held on disk."""
+        return sum(os.path.getsize(p) for p in self.segments())
+
+    def pending(self):
+        return bool(self.segments())
+
+    def _open_segment(self):
+        segments = self.segments()
+        number = int(os.path.basename(segments[-1])[:-4]) + 1 if segments else 1
+        self.current = open(os.path.join(self.path, f"{number:012d}.seg"), "a", encoding="utf-8")
+
+    def _close_segment(self, sync=True):
+        if self.current:
+            self.current.flush()
+            # "interval" syncs too: nothing would sync the file once it is closed
+            if sync and self.fsync != "never":
+                os.fsync(self.current.fileno())
+            self.current.close()
+            self.current = None
+
+    def append(self, rows):
+        """Append rows to the newest segment."""
+        if self.current is None or self.current.tell() >= self.segment_bytes:
+            self._close_segment()
+            self._open_segment()
+
+        self.current.write("".join(json.dumps(list(row), default=str) + "\n" for row in rows))
+        self.current.flush()
+
+        now = time.monotonic()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self.last_fsync >= self.fsync_interval):
+            os.fsync(self.current.fileno())
+            self.last_fsync = now
+
+        self._enforce_limit()
+
+    def _enforce_limit(self):
+        segments = self.segments()
+        total = sum(os.path.getsize(p) for p in segments)
+        # Always keep the segment being written
+        while total > self.max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            print(f"Spool over {self.max_bytes} bytes, dropped {os.path.basename(oldest)}")
+
+    def read_segment(self, segment):
+        """Rows stored in one segment. A torn last line from a crash is skipped."""
+        rows = []
+        with open(segment, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except ValueError:
+                    print(f"Skipping damaged spool line in {os.path.basename(segment)}")
+        return rows
+
+    def replay(self, writer):
+        """Write spooled rows back in order. Stops at the first failure.
+
+        The segment being appended to stays open until its rows are
+        written, so failed flushes during an outage keep filling it up to
+        segment_bytes instead of starting a new file each.
+        """
+        replayed = 0
+        for segment in self.segments():
+            rows = self.read_segment(segment)
+            if rows:
+                writer(rows)
+                replayed += len(rows)
+            if self.current is not None and os.path.abspath(self.current.name) == os.path.abspath(segment):
+                # Written, it is removed next and needs no fsync
+                self._close_segment(sync=False)
+            os.remove(segment)
+        return replayed
+
+    def close(self):
+        self._close_segment()
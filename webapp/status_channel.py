@@ -0,0 +1,133 @@
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+# Fixed layout of the status block, after an 8 byte sequence number
+StatusFields = [
+    ("running", "?"),
+    ("pid", "I"),
+    ("started", "d"),
+    ("updated", "d"),
+    ("last_sample", "d"),
+    ("last_write", "d"),
+    ("cycle_last_ms", "d"),
+    ("cycle_avg_ms", "d"),
+    ("cycle_max_ms", "d"),
+    ("samples", "Q"),
+    ("samples_suppressed", "Q"),
+    ("rows_written", "Q"),
+    ("insert_errors", "Q"),
+    ("device_errors", "Q"),
+    ("overruns", "Q"),
+    ("missed_deadlines", "Q"),
+    ("spooled_bytes", "Q"),
+    ("message", "256s"),
+    ("error", "256s"),
+    ("warning", "256s")
+]
+StatusFormat = "<Q" + "".join(fmt for _, fmt in StatusFields)
+StatusSize = struct.calcsize(StatusFormat)
+TextFields = ["message", "error", "warning"]
+TimeFields = ["started", "updated", "last_sample", "last_write"]
+
+
+class StatusWriter:
+    """Logger status in a small memory-mapped block instead of a JSON file.
+
+    A publish rewrites the block in place between two increments of a
+    sequence number (odd while writing), so readers always get a complete
+    snapshot and nothing goes to disk on the hot path.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        self.file.truncate(StatusSize)
+        self.mm = mmap.mmap(self.file.fileno(), StatusSize)
+        self.seq = struct.unpack_from("<Q", self.mm)[0] & ~1
+        self.fields = {name: (b"" if fmt.endswith("s") else 0) for name, fmt in StatusFields}
+        self.fields.update(running=True, pid=os.getpid(), started=time.time())
+
+    def set(self, **fields):
+        """Change fields without publishing. Times may be datetimes or engine tick strings."""
+        for name, value in fields.items():
+            if name in TimeFields and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            if isinstance(value, datetime):
+                value = value.timestamp()
+            self.fields[name] = value
+
+    def incr(self, name, count=1):
+        self.fields[name] += count
+
+    def publish(self, **fields):
+        """Set fields and write a snapshot.
+
+        Giving any of message, error or warning clears the other two, like
+        the status file that was rewritten as a whole.
+        """
+        if any(name in fields for name in TextFields):
+            for name in TextFields:
+                self.fields[name] = fields.pop(name, "")
+        self.set(**fields)
+        self.fields["updated"] = time.time()
+        values = []
+        for name, fmt in StatusFields:
+            value = self.fields[name]
+            if fmt.endswith("s") and isinstance(value, str):
+                value = value.encode("utf-8")[:int(fmt[:-1])]
+            values.append(value)
+
+        self.seq += 1
+        struct.pack_into("<Q", self.mm, 0, self.seq)
+        struct.pack_into(StatusFormat, self.mm, 0, self.seq, *values)
+        self.seq += 1
+        struct.pack_into("<Q", self.mm, 0, self.seq)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class StatusReader:
+    """Consistent snapshots of a StatusWriter block."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+
+    def snapshot(self, retries=1000):
+        """Status as a dict, None if the logger has not created the block yet."""
+        if self.mm is None:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) < StatusSize:
+                return None
+            with open(self.path, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), StatusSize, access=mmap.ACCESS_READ)
+
+        for _ in range(retries):
+            before = struct.unpack_from("<Q", self.mm)[0]
+            if before % 2:
+                continue  # being written
+            data = self.mm[:StatusSize]
+            if struct.unpack_from("<Q", self.mm)[0] == before:
+                break
+        else:
+            raise TimeoutError("Status block kept changing while reading")
+
+        values = struct.unpack(StatusFormat, data)[1:]
+        status = {}
+        for (name, fmt), value in zip(StatusFields, values):
+            if fmt.endswith("s"):
+                value = value.rstrip(b"\0").decode("utf-8", "replace")
+                if not value:
+                    continue
+            elif name in TimeFields:
+                value = datetime.fromtimestamp(value).isoformat(" ", "milliseconds") if value else None
+            status[name] = value
+        return status
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
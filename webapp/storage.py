@@ -0,0 +1,417 @@
+import abc
+import argparse
+import json
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from metrics import Registry
+
+
+def _sqlite_time(ts):
+    return ts.isoformat(" ", "milliseconds")
+
+
+# Registered once for the process: sqlite3 keeps the adapters globally
+sqlite3.register_adapter(datetime, _sqlite_time)
+sqlite3.register_adapter(date, lambda day: day.isoformat())
+try:
+    import pandas as pd
+    sqlite3.register_adapter(pd.Timestamp, _sqlite_time)
+except ImportError:
+    pass
+
+
+class Backend(abc.ABC):
+    """Where the data table lives: how to connect and the SQL dialect to use.
+
+    Query builders elsewhere take the dialect from here (placeholder,
+    quoting, time bucketing, upserts) so the same code runs against every
+    backend. Subclasses only override what differs.
+    """
+
+    name = None
+    placeholder = "?"
+    datetime_type = "TIMESTAMP"
+    table_options = ""
+    writable = True
+
+    @abc.abstractmethod
+    def connect(self):
+        """New DB-API connection."""
+
+    def key(self):
+        """Identifies the data source in caches, without secrets."""
+        return (self.name,)
+
+    def quote(self, name):
+        return f'"{name}"'
+
+    def column_type(self, reg):
+        if reg["type"] == "float32" or reg["scale"] != 1:
+            return "DOUBLE"
+        return "BIGINT" if reg["type"] == "u32" else "INTEGER"
+
+    @abc.abstractmethod
+    def bucket_key(self, column, seconds):
+        """Bucket number of a time column, for GROUP BY."""
+
+    @abc.abstractmethod
+    def bucket_time(self, column, seconds):
+        """Start time of the bucket of a time column."""
+
+    def new_value(self, name):
+        """The incoming value of a column in an upsert's UPDATE part."""
+        return f"excluded.{name}"
+
+    def upsert(self, table, names, keys, updates):
+        placeholders = ", ".join([self.placeholder] * len(names))
+        return (f"INSERT INTO {table} ({', '.join(names)}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                + ", ".join(f"{name} = {expr}" for name, expr in updates))
+
+    def stream_cursor(self, connection):
+        """Cursor that hands out rows as they are read, for fetchmany loops."""
+        return connection.cursor()
+
+    def add_columns(self, cursor, table, definitions):
+        """Add the (name, SQL type) columns table does not have yet, e.g. after registers were mapped.
+
+        CREATE TABLE IF NOT EXISTS leaves an existing table as it is. Returns the added names.
+        """
+        cursor.execute(f"SELECT * FROM {table} WHERE 1 = 0")
+        cursor.fetchall()
+        existing = {d[0].lower() for d in cursor.description}
+        added = []
+        for name, sql_type in definitions:
+            if name.lower() not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {self.quote(name)} {sql_type}")
+                added.append(name)
+        return added
+
+    def ping(self, db):
+        """Make sure db is still usable before a write."""
+
+    def is_alive(self, connection):
+        """Health check for pooled connections."""
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def end_read(self, connection):
+        """End the read transaction of a pooled connection, so its next user sees new rows."""
+        connection.rollback()
+
+    @abc.abstractmethod
+    def create_table(self, db, table, registers):
+        """Create the data table for registers if it does not exist."""
+
+    def maintain(self, db, table, cfg):
+        """Periodic housekeeping, run by the logger at startup and once a day."""
+
+    def write(self, db, query, rows, rollup=None):
+        """Insert rows (and update the rollups) in one transaction."""
+        self.ping(db)
+        cursor = db.cursor()
+        try:
+            # mysql-connector rewrites executemany INSERTs into one multi-row statement
+            with Registry.timer("db_insert_seconds", backend=self.name):
+                cursor.executemany(query, rows)
+            if rollup:
+                with Registry.timer("db_rollup_seconds", backend=self.name):
+                    rollup.write(cursor, rows)
+            with Registry.timer("db_commit_seconds", backend=self.name):
+                db.commit()
+        except Exception:
+            Registry.incr("db_write_errors_total", backend=self.name)
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+class MySQLBackend(Backend):
+    """MySQL server, shared by the logger and any number of dashboards."""
+
+    name = "mysql"
+    placeholder = "%s"
+    datetime_type = "DATETIME(3)"
+    table_options = " ENGINE=InnoDB"
+
+    def __init__(self, host=None, user=None, password=None, database=None):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+
+    def connect(self):
+        import mysql.connector
+        return mysql.connector.connect(host=self.host, user=self.user, password=self.password, database=self.database)
+
+    def key(self):
+        return (self.name, self.host, self.user, self.database)
+
+    def quote(self, name):
+        return f"`{name}`"
+
+    def column_type(self, reg):
+        from register_map import sql_type
+        return sql_type(reg)
+
+    def bucket_key(self, column, seconds):
+        return f"FLOOR(UNIX_TIMESTAMP({column}) / {int(seconds)})"
+
+    def bucket_time(self, column, seconds):
+        return f"FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP({column}) / {int(seconds)}) * {int(seconds)})"
+
+    def new_value(self, name):
+        return f"new.{name}"
+
+    def upsert(self, table, names, keys, updates):
+        # Row alias (MySQL 8.0.19+) instead of VALUES(), which is deprecated since 8.0.20.
+        # MySQL applies the assignments left to right, later ones see the new values
+        placeholders = ", ".join([self.placeholder] * len(names))
+        return (f"INSERT INTO {table} ({', '.join(names)}) VALUES ({placeholders}) AS new "
+                f"ON DUPLICATE KEY UPDATE " + ", ".join(f"{name} = {expr}" for name, expr in updates))
+
+    def stream_cursor(self, connection):
+        return connection.cursor(buffered=False)
+
+    def ping(self, db):
+        # Reconnects if the server went away, e.g. during maintenance
+        db.ping(reconnect=True, attempts=1, delay=0)
+
+    def is_alive(self, connection):
+        return connection.is_connected()
+
+    def create_table(self, db, table, registers):
+        # Partitioned layout, see schema.py
+        from schema import create, table_exists
+        cursor = db.cursor()
+        try:
+            exists = table_exists(cursor, self.database, table)
+            if exists:
+                added = self.add_columns(cursor, table, [(reg["column"], self.column_type(reg)) for reg in registers])
+                if added:
+                    print(f"Added columns {', '.join(added)} to {table}")
+        finally:
+            cursor.close()
+        if not exists:
+            create(db, self.database, table, registers)
+
+    def maintain(self, db, table, cfg):
+        from schema import maintain
+        partition_cfg = cfg.get("partitions", {})
+        self.ping(db)
+        maintain(db, self.database, table, partition_cfg.get("months_ahead", 3), partition_cfg.get("keep_months"))
+
+
+class SQLiteBackend(Backend):
+    """Local SQLite file in WAL mode.
+
+    No server and no network round trip per batch, so small edge boxes can
+    log at high rates. WAL lets the dashboard read while the logger writes.
+    Times are stored as ISO text with milliseconds, which sorts in time order.
+    """
+
+    name = "sqlite"
+    datetime_type = "TEXT"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        # Connections are opened by one thread and may be closed by another (Streamlit)
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def key(self):
+        return (self.name, os.path.abspath(self.path))
+
+    def column_type(self, reg):
+        if reg["type"] == "float32" or reg["scale"] != 1:
+            return "REAL"
+        return "INTEGER"
+
+    def bucket_key(self, column, seconds):
+        return f"(CAST(strftime('%s', {column}) AS INTEGER) / {int(seconds)})"
+
+    def bucket_time(self, column, seconds):
+        return f"datetime((CAST(strftime('%s', {column}) AS INTEGER) / {int(seconds)}) * {int(seconds)}, 'unixepoch')"
+
+    def create_table(self, db, table, registers):
+        columns = [f"{self.quote(reg['column'])} {self.column_type(reg)}" for reg in registers]
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (ID INTEGER PRIMARY KEY AUTOINCREMENT, "
+            f"Device_ID INTEGER NOT NULL DEFAULT 1, Date_Time TEXT NOT NULL, {', '.join(columns)})"
+        )
+        db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_device_time ON {table} (Device_ID, Date_Time)")
+        cursor = db.cursor()
+        try:
+            added = self.add_columns(cursor, table, [(reg["column"], self.column_type(reg)) for reg in registers])
+            if added:
+                print(f"Added columns {', '.join(added)} to {table}")
+        finally:
+            cursor.close()
+        db.commit()
+
+    def maintain(self, db, table, cfg):
+        # Move the WAL back into the database file so it does not keep growing
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class DuckDBBackend(Backend):
+    """DuckDB over a directory of Parquet files, for fast analytical range scans.
+
+    The files are archived from the live database (python storage.py archive)
+    and read as one table, so the dashboard queries run unchanged on a
+    columnar engine. DuckDB allows a single writing process, so the logger
+    keeps writing to MySQL or SQLite.
+    """
+
+    name = "duckdb"
+    writable = False
+
+    def __init__(self, path, table="vfd"):
+        self.path = path
+        self.table = table
+
+    def connect(self):
+        import duckdb
+        db = duckdb.connect()
+        pattern = os.path.join(self.path, self.table, "**", "*.parquet").replace("\\", "/")
+        db.execute(f"CREATE VIEW {self.table} AS SELECT * FROM read_parquet('{pattern}', union_by_name = true)")
+        return db
+
+    def key(self):
+        return (self.name, os.path.abspath(self.path), self.table)
+
+    def column_type(self, reg):
+        if reg["type"] == "float32" or reg["scale"] != 1:
+            return "DOUBLE"
+        return "UINTEGER" if reg["type"] == "u32" else "INTEGER"
+
+    def bucket_key(self, column, seconds):
+        return f"FLOOR(epoch({column}) / {int(seconds)})"
+
+    def bucket_time(self, column, seconds):
+        return (f"TIMESTAMP '1970-01-01' + to_seconds(CAST(FLOOR(epoch({column}) / {int(seconds)}) "
+                f"* {int(seconds)} AS BIGINT))")
+
+    def end_read(self, connection):
+        # The archive is read only and DuckDB refuses a rollback outside a transaction
+        pass
+
+    def create_table(self, db, table, registers):
+        raise ValueError("The DuckDB backend reads archived Parquet files, log to MySQL or SQLite")
+
+
+Backends = {"mysql": MySQLBackend, "sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
+
+
+def storage_config(cfg):
+    """The storage section of config.json, the mysql section for older configs."""
+    if "storage" in cfg:
+        return cfg["storage"]
+    return {"backend": "mysql", **cfg["mysql"]}
+
+
+def open_backend(storage):
+    """Backend for a storage section: {"backend": "sqlite", "path": ...} etc."""
+    settings = dict(storage)
+    kind = settings.pop("backend", "mysql")
+    if kind not in Backends:
+        raise ValueError(f"Unknown storage backend '{kind}', use one of {', '.join(Backends)}")
+    return Backends[kind](**settings)
+
+
+def dialect_of(connection):
+    """Backend whose SQL dialect matches an open connection."""
+    module = type(connection).__module__
+    if module.startswith("sqlite3"):
+        return SQLiteBackend(None)
+    if "duckdb" in module:
+        return DuckDBBackend(None)
+    return MySQLBackend()
+
+
+def archive(backend, directory, table, device_ids, day):
+    """Write one day of every device to <directory>/<table>/device=<id>/<day>.parquet."""
+    from export import ExportWriter
+    from streaming import stream_rows
+
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1) - timedelta(milliseconds=1)
+    connection = backend.connect()
+    written = 0
+    try:
+        for device_id in device_ids:
+            folder = os.path.join(directory, table, f"device={device_id}")
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{day:%Y-%m-%d}.parquet")
+            writer = None
+            try:
+                for chunk in stream_rows(connection, table, device_id, start, end):
+                    if writer is None:
+                        writer = ExportWriter(path + ".tmp", "Parquet")
+                    writer.write(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is not None:
+                os.replace(path + ".tmp", path)
+                written += writer.rows
+                print(f"Archived {writer.rows} rows of device {device_id} to {path}")
+    finally:
+        connection.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the data table or archive days to Parquet")
+    parser.add_argument("action", choices=["create", "archive"])
+    parser.add_argument("config", help="config.json with the storage (or mysql) section")
+    parser.add_argument("--table", default="vfd")
+    parser.add_argument("--to", help="archive directory for the DuckDB backend")
+    parser.add_argument("--days", type=int, default=1, help="archive this many days, ending yesterday")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+    backend = open_backend(storage_config(cfg))
+
+    if args.action == "create":
+        from acquisition import load_devices
+        _, devices = load_devices(cfg)
+        registers = list({reg["column"]: reg for device in devices for reg in device["registers"]}.values())
+        db = backend.connect()
+        try:
+            backend.create_table(db, args.table, registers)
+        finally:
+            db.close()
+        print(f"Table {args.table} ready in {backend.name}")
+        return
+
+    if not args.to:
+        parser.error("archive needs --to <directory>")
+    db = backend.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute(f"SELECT DISTINCT Device_ID FROM {args.table}")
+        device_ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    finally:
+        db.close()
+    today = date.today()
+    for days_ago in range(args.days, 0, -1):
+        archive(backend, args.to, args.table, device_ids, today - timedelta(days=days_ago))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import pandas as pd
+from data_cache import compact_dtypes
+from storage import dialect_of
+
+
+def count_rows(connection, table, device_id, start, end):
+    """Number of rows in the range, used for progress reporting."""
+    p = dialect_of(connection).placeholder
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE Device_ID = {p} AND Date_Time BETWEEN {p} AND {p}",
+                       (device_id, start, end))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def stream_rows(connection, table, device_id, start, end, chunksize=50000, columns=None):
+    """Yield the rows of a range as DataFrames of at most chunksize rows.
+
+    Uses an unbuffered cursor (on MySQL), so the server streams the result
+    and only one chunk is held in memory at a time. The connection cannot run other
+    queries until the generator is exhausted or closed. columns limits the
+    select list (Date_Time is always included).
+    """
+    dialect = dialect_of(connection)
+    p = dialect.placeholder
+    select = "*" if not columns else ", ".join(dialect.quote(c) for c in ['Date_Time'] + [c for c in columns if c != 'Date_Time'])
+    cursor = dialect.stream_cursor(connection)
+    try:
+        cursor.execute(f"SELECT {select} FROM {table} WHERE Device_ID = {p} AND Date_Time BETWEEN {p} AND {p} ORDER BY Date_Time ASC, ID ASC",
+                       (device_id, start, end))
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            yield compact_dtypes(pd.DataFrame(rows, columns=columns))
+    finally:
+        # Drain what is left so the connection is usable again, a chunk at a time
+        # so stopping early does not pull the rest of the range into memory
+        try:
+            while cursor.fetchmany(chunksize):
+                pass
+        except Exception:
+            pass
+        cursor.close()
+
+
+class ChunkDownsampler:
+    """Min/max/mean per time bucket built up chunk by chunk.
+
+    Gives the same result as downsample.bucket_stats on the whole range while
+    only holding one row per bucket.
+    """
+
+    def __init__(self, columns, bucket, time_column='Date_Time'):
+        self.columns = list(columns)
+        self.bucket = int(bucket)
+        self.time_column = time_column
+        self.parts = []
+
+    def update(self, chunk):
+        seconds = chunk[self.time_column].values.astype('datetime64[s]').astype('int64')
+        key = (seconds // self.bucket) * self.bucket
+        grouped = chunk[self.columns].astype('float64').groupby(key)
+        self.parts.append(pd.concat([
+            grouped.sum().add_suffix('__sum'),
+            grouped.count().add_suffix('__count'),
+            grouped.min().add_suffix('__min'),
+            grouped.max().add_suffix('__max')
+        ], axis=1))
+        # Buckets only span chunk borders, fold the parts so memory stays one row per bucket
+        if len(self.parts) > 8:
+            self.parts = [self._combine()]
+
+    def _combine(self):
+        merged = pd.concat(self.parts)
+        grouped = merged.groupby(level=0, sort=True)
+        agg = {c: 'sum' for c in merged.columns if c.endswith(('__sum', '__count'))}
+        agg.update({c: 'min' for c in merged.columns if c.endswith('__min')})
+        agg.update({c: 'max' for c in merged.columns if c.endswith('__max')})
+        return grouped.agg(agg)
+
+    def result(self):
+        if not self.parts:
+            return pd.DataFrame(columns=[self.time_column] + self.columns)
+        combined = self._combine()
+        out = pd.DataFrame(index=combined.index)
+        for col in self.columns:
+            out[col] = combined[f'{col}__sum'] / combined[f'{col}__count']
+        for col in self.columns:
+            out[f'{col}__min'] = combined[f'{col}__min']
+        for col in self.columns:
+            out[f'{col}__max'] = combined[f'{col}__max']
+        out.index = pd.to_datetime(out.index, unit='s')
+        out.index.name = self.time_column
+        return out.reset_index()
+
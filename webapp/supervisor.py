@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from acquisition import load_devices
+from logger import LivePath, StatusPath, StopPath, worker_path
+from status_channel import StatusReader
+
+ConfigPath = r"C:\Users\ADMIN\Desktop\IASYS\config.json"
+ControlPort = 9100  # control API, "supervisor": {"port": ...} in config.json
+MonitorInterval = 0.5  # seconds between checks of the workers
+StopTimeout = 30  # seconds a worker gets to flush its rows before it is terminated
+
+
+class Worker:
+    """One logger.py process polling a single bus."""
+
+    def __init__(self, bus, devices, cpu=None, metrics_port=None, maintenance=False):
+        self.bus = bus
+        self.devices = devices
+        self.cpu = cpu
+        self.metrics_port = metrics_port
+        self.maintenance = maintenance
+        self.proc = None
+        self.wanted = False  # should be running
+        self.restarts = 0
+        self.failures = 0  # exits in a row without running stable_after seconds
+        self.started = None
+        self.next_start = 0.0
+        self.last_exit = None
+
+    def command(self):
+        command = [sys.executable, "logger.py", "--bus", self.bus]
+        if self.metrics_port:
+            command += ["--metrics-port", str(self.metrics_port)]
+        if not self.maintenance:
+            command.append("--no-maintenance")
+        return command
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            self.command(),
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
+        )
+        self.started = time.monotonic()
+        if self.cpu is not None:
+            try:
+                import psutil
+                psutil.Process(self.proc.pid).cpu_affinity([self.cpu])
+            except Exception as e:
+                # Not every platform can pin processes (e.g. macOS)
+                print(f"Worker {self.bus}: no CPU affinity ({e})")
+        print(f"Worker {self.bus} started, PID {self.proc.pid}" + (f" on CPU {self.cpu}" if self.cpu is not None else ""))
+
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self, timeout=StopTimeout):
+        if not self.running():
+            return
+        # The stop file lets the logger flush its buffer and close the bus. An interrupt would
+        # too, but a supervisor started detached on Windows has no console to send CTRL_BREAK through
+        stop_path = worker_path(StopPath, self.bus)
+        with open(stop_path, "w"):
+            pass
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print(f"Worker {self.bus} did not stop, terminating it")
+            self.proc.terminate()
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        finally:
+            if os.path.exists(stop_path):
+                os.remove(stop_path)
+        self.last_exit = self.proc.returncode
+        # Stopped on purpose, check() must not count it as a crash
+        self.proc = None
+
+    def info(self):
+        # stop() clears proc without the supervisor's lock
+        proc = self.proc
+        running = proc is not None and proc.poll() is None
+        state = "running" if running else ("restarting" if self.wanted else "stopped")
+        return {
+            "bus": self.bus,
+            "devices": self.devices,
+            "state": state,
+            "pid": proc.pid if running else None,
+            "cpu": self.cpu,
+            "uptime": round(time.monotonic() - self.started, 1) if running else None,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "metrics_port": self.metrics_port,
+            "status_path": worker_path(StatusPath, self.bus),
+            "live_path": worker_path(LivePath, self.bus)
+        }
+
+
+class Supervisor:
+    """Runs one logger worker per bus and restarts workers that exit.
+
+    One process per bus keeps a slow or failing RS-485 line from holding
+    up the others and lets each line use its own core. Restarts back off
+    exponentially (backoff, 2 * backoff, ... up to max_backoff seconds)
+    and the delay resets once a worker has run stable_after seconds.
+    """
+
+    def __init__(self, config_path, backoff=1.0, max_backoff=60.0, stable_after=60.0):
+        self.config_path = config_path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.plan()
+
+    def plan(self):
+        """One worker per bus of the config."""
+        with open(self.config_path, "r") as f:
+            cfg = json.load(f)
+        buses, devices = load_devices(cfg)
+        sup_cfg = cfg.get("supervisor", {})
+        cpus = sup_cfg.get("cpus")
+        if cpus is None and sup_cfg.get("affinity", True):
+            count = os.cpu_count() or 1
+            # Leave the first core to the dashboard and the database when there are enough
+            cpus = list(range(1, count)) if count > 2 else list(range(count))
+        metrics_cfg = cfg.get("metrics", {})
+        base_port = metrics_cfg.get("port", 9108) if metrics_cfg.get("enabled", True) else None
+
+        self.workers = {}
+        for number, bus in enumerate(sorted(buses)):
+            self.workers[bus] = Worker(
+                bus,
+                [device["id"] for device in devices if device["bus"] == bus],
+                cpus[number % len(cpus)] if cpus else None,
+                base_port + number if base_port else None,
+                maintenance=number == 0
+            )
+
+    def select(self, bus=None):
+        if bus is None:
+            return list(self.workers.values())
+        if bus not in self.workers:
+            raise KeyError(f"No worker for bus '{bus}'")
+        return [self.workers[bus]]
+
+    def start(self, bus=None):
+        with self.lock:
+            for worker in self.select(bus):
+                worker.wanted = True
+                worker.failures = 0
+                worker.next_start = 0.0
+
+    def stop(self, bus=None):
+        with self.lock:
+            workers = self.select(bus)
+            for worker in workers:
+                worker.wanted = False
+        for worker in workers:
+            worker.stop()
+
+    def restart(self, bus=None):
+        self.stop(bus)
+        self.start(bus)
+
+    def reload(self):
+        """Re-read the config, e.g. after the dashboard wrote a new one.
+
+        Workers read the config when they start, so running ones are restarted.
+        """
+        with self.lock:
+            wanted = any(worker.wanted for worker in self.workers.values())
+        self.stop()
+        with self.lock:
+            self.plan()
+        if wanted:
+            self.start()
+
+    def check(self):
+        """Start wanted workers that are not running, after their backoff delay."""
+        now = time.monotonic()
+        with self.lock:
+            for worker in self.workers.values():
+                if not worker.wanted or worker.running():
+                    continue
+                if worker.proc is not None:
+                    # It exited on its own, schedule the restart
+                    worker.last_exit = worker.proc.returncode
+                    ran = now - worker.started
+                    worker.failures = 1 if ran >= self.stable_after else worker.failures + 1
+                    delay = min(self.max_backoff, self.backoff * 2 ** (worker.failures - 1))
+                    worker.next_start = now + delay
+                    worker.proc = None
+                    worker.restarts += 1
+                    print(f"Worker {worker.bus} exited with {worker.last_exit}, restarting in {delay:.0f} s")
+                if now >= worker.next_start:
+                    try:
+                        worker.start()
+                    except Exception as e:
+                        print(f"Worker {worker.bus} failed to start: {e}")
+                        worker.failures += 1
+                        worker.next_start = now + min(self.max_backoff, self.backoff * 2 ** (worker.failures - 1))
+
+    def status(self):
+        with self.lock:
+            infos = [worker.info() for worker in self.workers.values()]
+        for info in infos:
+            reader = StatusReader(info["status_path"])
+            try:
+                info["status"] = reader.snapshot()
+            except Exception as e:
+                info["status"] = {"error": str(e)}
+            finally:
+                reader.close()
+        return {"pid": os.getpid(), "workers": infos}
+
+    def monitor(self):
+        while not self.stopping.wait(MonitorInterval):
+            self.check()
+
+    def shutdown(self):
+        self.stopping.set()
+        self.stop()
+
+
+def serve(supervisor, port=ControlPort, host="127.0.0.1"):
+    """Control API over HTTP with JSON replies.
+
+    GET  /workers                     workers, their state and logger status
+    POST /start, /stop, /restart      all workers, or one with ?bus=<name>
+    POST /reload                      re-read config.json
+    POST /shutdown                    stop the workers and the supervisor
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, body):
+            data = json.dumps(body, default=str).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if urlparse(self.path).path == "/workers":
+                self.reply(200, supervisor.status())
+            else:
+                self.reply(404, {"error": "Unknown path"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            bus = parse_qs(url.query).get("bus", [None])[0]
+            actions = {
+                "/start": lambda: supervisor.start(bus),
+                "/stop": lambda: supervisor.stop(bus),
+                "/restart": lambda: supervisor.restart(bus),
+                "/reload": supervisor.reload
+            }
+            try:
+                if url.path == "/shutdown":
+                    self.reply(200, {"ok": True})
+                    threading.Thread(target=server.shutdown, daemon=True).start()
+                    return
+                if url.path not in actions:
+                    self.reply(404, {"error": "Unknown path"})
+                    return
+                actions[url.path]()
+                self.reply(200, supervisor.status())
+            except Exception as e:
+                self.reply(400, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass  # polled by the dashboard, keep the output readable
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one logger worker per bus and expose a control API")
+    parser.add_argument("--config", default=ConfigPath)
+    parser.add_argument("--start", action="store_true", help="start the workers right away")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        sup_cfg = json.load(f).get("supervisor", {})
+    supervisor = Supervisor(args.config, sup_cfg.get("backoff", 1), sup_cfg.get("max_backoff", 60))
+    server = serve(supervisor, sup_cfg.get("port", ControlPort), sup_cfg.get("host", "127.0.0.1"))
+    threading.Thread(target=supervisor.monitor, name="monitor", daemon=True).start()
+    if args.start:
+        supervisor.start()
+    print(f"Supervisor running {len(supervisor.workers)} workers, control API on port {server.server_address[1]}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.shutdown()
+        server.server_close()
+        print("Supervisor stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+from metrics import Metrics, histogram_summary, parse_metrics
+
+
+def test_summary_leaves_the_scrape_untouched():
+    metrics = Metrics()
+    for seconds in (0.001, 0.004, 0.02, 0.3):
+        metrics.observe("modbus_lock_wait_seconds", seconds, bus="rs485")
+    parsed = parse_metrics(metrics.render())
+
+    first = histogram_summary(parsed, "modbus_lock_wait_seconds")
+    second = histogram_summary(parsed, "modbus_lock_wait_seconds")
+    assert first == second
+    assert first[0]["bus"] == "rs485" and first[0]["count"] == 4
+    assert all("le" in labels for labels, _ in parsed["modbus_lock_wait_seconds_bucket"])
@@ -0,0 +1,178 @@
+import asyncio
+import struct
+
+import pytest
+
+pytest.importorskip("pymodbus")
+from pymodbus.exceptions import ModbusException
+from modbus_tcp import PipelinedTcpClient, ReadHolding
+
+
+def register_reply(pdu):
+    """Reply to a read: every register holds its own address."""
+    function_code, address, count = struct.unpack(">BHH", pdu)
+    return struct.pack(f">BB{count}H", function_code, 2 * count, *range(address, address + count))
+
+
+class FakeServer:
+    """Modbus TCP server on localhost; handle(requests) decides what goes back.
+
+    requests is the list of (transaction, unit, pdu) read so far, handle
+    returns the (transaction, unit, pdu) replies to send, or None to close
+    the connection.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve(self, reader, writer):
+        requests = []
+        try:
+            while True:
+                transaction, _, length, unit = struct.unpack(">HHHB", await reader.readexactly(7))
+                requests.append((transaction, unit, await reader.readexactly(length - 1)))
+                replies = await self.handle(requests)
+                if replies is None:
+                    break
+                for transaction, unit, pdu in replies:
+                    writer.write(struct.pack(">HHHB", transaction, 0, len(pdu) + 1, unit) + pdu)
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+async def connected_client(handle, **kwargs):
+    server = FakeServer(handle)
+    port = await server.start()
+    client = PipelinedTcpClient("127.0.0.1", port, **kwargs)
+    assert await client.connect()
+    return server, client
+
+
+def test_out_of_order_replies():
+    async def handle(requests):
+        # Answer the batch of 8 last to first
+        if len(requests) < 8:
+            return []
+        return [(t, u, register_reply(pdu)) for t, u, pdu in reversed(requests[-8:])]
+
+    async def run():
+        server, client = await connected_client(handle)
+        try:
+            replies = await asyncio.gather(*[client.read_holding_registers(10 * i, count=2) for i in range(8)])
+        finally:
+            client.close()
+            server.close()
+        assert [rr.registers for rr in replies] == [[10 * i, 10 * i + 1] for i in range(8)]
+
+    asyncio.run(run())
+
+
+def test_late_reply_after_timeout():
+    held = []
+
+    async def handle(requests):
+        transaction, unit, pdu = requests[-1]
+        if len(requests) == 1:
+            # Held back until after the client gave up on it
+            held.append((transaction, unit, register_reply(pdu)))
+            return []
+        return held + [(transaction, unit, register_reply(pdu))]
+
+    async def run():
+        server, client = await connected_client(handle)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.read_holding_registers(100, count=1), timeout=0.2)
+            rr = await asyncio.wait_for(client.read_holding_registers(200, count=1), timeout=1)
+        finally:
+            client.close()
+            server.close()
+        assert rr.registers == [200]
+        assert not client.pending
+
+    asyncio.run(run())
+
+
+def test_connection_loss_fails_pending_requests():
+    async def handle(requests):
+        return None if len(requests) == 3 else []
+
+    async def run():
+        server, client = await connected_client(handle)
+        try:
+            results = await asyncio.wait_for(asyncio.gather(
+                *[client.read_holding_registers(i, count=1) for i in range(3)], return_exceptions=True), timeout=2)
+        finally:
+            client.close()
+            server.close()
+        assert all(isinstance(result, ConnectionError) for result in results)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("reply", [
+    bytes([ReadHolding | 0x80]),  # exception reply without its code
+    struct.pack(">BBH", ReadHolding, 4, 1),  # byte count beyond the data
+    struct.pack(">BBHH", ReadHolding, 4, 1, 2),  # two registers for a read of one
+    struct.pack(">BBH", ReadHolding + 1, 2, 1),  # another function
+])
+def test_malformed_replies(reply):
+    async def handle(requests):
+        transaction, unit, _ = requests[-1]
+        return [(transaction, unit, reply)]
+
+    async def run():
+        server, client = await connected_client(handle)
+        try:
+            with pytest.raises(ModbusException):
+                await client.read_holding_registers(0, count=1)
+        finally:
+            client.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_reply_from_another_unit():
+    async def handle(requests):
+        transaction, unit, pdu = requests[-1]
+        return [(transaction, unit + 1, register_reply(pdu))]
+
+    async def run():
+        server, client = await connected_client(handle)
+        try:
+            with pytest.raises(ModbusException):
+                await client.read_holding_registers(0, count=1, slave=5)
+        finally:
+            client.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_exception_reply():
+    async def handle(requests):
+        transaction, unit, _ = requests[-1]
+        return [(transaction, unit, bytes([ReadHolding | 0x80, 2]))]
+
+    async def run():
+        server, client = await connected_client(handle)
+        try:
+            rr = await client.read_holding_registers(0, count=1)
+        finally:
+            client.close()
+            server.close()
+        assert rr.isError() and rr.exception_code == 2
+
+    asyncio.run(run())
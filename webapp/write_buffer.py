@@ -0,0 +1,85 @@
+import time
+
+
+class WriteBuffer:
+    """Collect logged rows in memory and write them to the database in batches.
+
+    The buffer is flushed when it holds max_rows rows, when the oldest row is
+    older than max_age seconds, or when flush() is called on shutdown.
+
+    With a spool, rows that cannot be written are moved to local disk and
+    replayed ahead of newer rows once the database accepts writes again.
+    """
+
+    def __init__(self, writer, max_rows=50, max_age=5.0, max_pending=10000, spool=None):
+        # writer(rows) must write all rows in one go and raise on failure
+        self.writer = writer
+        self.spool = spool
+        self.replayed = 0
+        self.max_rows = max(1, int(max_rows))
+        self.max_age = float(max_age)
+        self.max_pending = max(self.max_rows, int(max_pending))
+        self.rows = []
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, row):
+        """Add one row and flush if the buffer is due. Returns rows written."""
+        if not self.rows:
+            self.oldest = time.monotonic()
+        self.rows.append(row)
+        self._trim()
+
+        if self.due():
+            return self.flush()
+        return 0
+
+    def extend(self, rows):
+        """Add rows without flushing, e.g. samples still queued on shutdown."""
+        rows = list(rows)
+        if rows and not self.rows:
+            self.oldest = time.monotonic()
+        self.rows.extend(rows)
+        self._trim()
+
+    def _trim(self):
+        # Never grow without limit while the database is unreachable
+        if len(self.rows) > self.max_pending:
+            dropped = len(self.rows) - self.max_pending
+            del self.rows[:dropped]
+            print(f"Write buffer full, dropped {dropped} oldest rows")
+
+    def due(self):
+        """True when the buffer should be flushed."""
+        if not self.rows:
+            return False
+        if len(self.rows) >= self.max_rows:
+            return True
+        return time.monotonic() - self.oldest >= self.max_age
+
+    def flush(self):
+        """Write every buffered row.
+
+        Without a spool the rows are kept for the next attempt if the writer
+        fails. With a spool they are moved to it and the error is re-raised.
+        """
+        if not self.rows:
+            return 0
+        rows = self.rows
+        try:
+            # Spooled rows are older, they have to go in first
+            if self.spool is not None and self.spool.pending():
+                self.replayed += self.spool.replay(self.writer)
+            self.writer(rows)
+        except Exception:
+            if self.spool is None:
+                raise
+            self.spool.append(rows)
+            self.rows = []
+            self.oldest = None
+            raise
+        self.rows = []
+        self.oldest = None
+        return len(rows)